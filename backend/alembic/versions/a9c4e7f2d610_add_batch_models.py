@@ -0,0 +1,35 @@
+"""add batch_models for multi-model matrix batches
+
+Revision ID: a9c4e7f2d610
+Revises: f1b6d2c8e905
+Create Date: 2026-10-19 17:48:22.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9c4e7f2d610'
+down_revision: Union[str, Sequence[str], None] = 'f1b6d2c8e905'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('batch_models',
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('model_id', sa.Integer(), nullable=False),
+    sa.Column('tokens_reserved', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['batches.id'], ),
+    sa.ForeignKeyConstraint(['model_id'], ['models.id'], ),
+    sa.PrimaryKeyConstraint('batch_id', 'model_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('batch_models')
@@ -0,0 +1,28 @@
+"""add version counter to batches for ETags
+
+Revision ID: b7d3e9a1c452
+Revises: a9c4e7f2d610
+Create Date: 2026-10-19 18:32:07.519384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d3e9a1c452'
+down_revision: Union[str, Sequence[str], None] = 'a9c4e7f2d610'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('batches', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('batches', 'version')
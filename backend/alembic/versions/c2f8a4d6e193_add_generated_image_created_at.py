@@ -0,0 +1,33 @@
+"""add created_at to generated_images for exports
+
+Revision ID: c2f8a4d6e193
+Revises: b7d3e9a1c452
+Create Date: 2026-10-19 19:05:41.208716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f8a4d6e193'
+down_revision: Union[str, Sequence[str], None] = 'b7d3e9a1c452'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Added without a default first, so existing rows stay NULL rather than
+    # all claiming the migration's timestamp
+    op.add_column('generated_images', sa.Column('created_at', sa.DateTime(timezone=True), nullable=True))
+    op.alter_column('generated_images', 'created_at', server_default=sa.func.now())
+    op.create_index(op.f('ix_generated_images_created_at'), 'generated_images', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_generated_images_created_at'), table_name='generated_images')
+    op.drop_column('generated_images', 'created_at')
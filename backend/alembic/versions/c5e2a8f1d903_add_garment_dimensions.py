@@ -0,0 +1,32 @@
+"""add garment preprocessing columns
+
+Revision ID: c5e2a8f1d903
+Revises: b3c91e7a4d20
+Create Date: 2026-10-19 10:03:27.518846
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e2a8f1d903'
+down_revision: Union[str, Sequence[str], None] = 'b3c91e7a4d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('garment_images', sa.Column('source_url', sa.String(), nullable=True))
+    op.add_column('garment_images', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('garment_images', sa.Column('height', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('garment_images', 'height')
+    op.drop_column('garment_images', 'width')
+    op.drop_column('garment_images', 'source_url')
@@ -0,0 +1,36 @@
+"""add batch_archives for persisted download archives
+
+Revision ID: d4a1f7b3c820
+Revises: c2f8a4d6e193
+Create Date: 2026-10-19 19:41:16.730528
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a1f7b3c820'
+down_revision: Union[str, Sequence[str], None] = 'c2f8a4d6e193'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('batch_archives',
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('outputs_digest', sa.String(length=64), nullable=False),
+    sa.Column('url', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['batches.id'], ),
+    sa.PrimaryKeyConstraint('batch_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('batch_archives')
@@ -0,0 +1,38 @@
+"""add garment perceptual hash and dedupe stats
+
+Revision ID: d81f4b6e2a57
+Revises: c5e2a8f1d903
+Create Date: 2026-10-19 11:26:05.774210
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81f4b6e2a57'
+down_revision: Union[str, Sequence[str], None] = 'c5e2a8f1d903'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('garment_images', sa.Column('phash', sa.String(length=16), nullable=True))
+    op.add_column('garment_images', sa.Column('duplicate_of_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_garment_images_phash'), 'garment_images', ['phash'], unique=False)
+    op.create_foreign_key('fk_garment_images_duplicate_of_id', 'garment_images', 'garment_images', ['duplicate_of_id'], ['id'])
+    op.add_column('batches', sa.Column('duplicate_garments', sa.Integer(), nullable=True))
+    op.add_column('batches', sa.Column('tokens_saved', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('batches', 'tokens_saved')
+    op.drop_column('batches', 'duplicate_garments')
+    op.drop_constraint('fk_garment_images_duplicate_of_id', 'garment_images', type_='foreignkey')
+    op.drop_index(op.f('ix_garment_images_phash'), table_name='garment_images')
+    op.drop_column('garment_images', 'duplicate_of_id')
+    op.drop_column('garment_images', 'phash')
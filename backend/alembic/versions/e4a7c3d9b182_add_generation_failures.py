@@ -0,0 +1,50 @@
+"""add generation_failures and retry bookkeeping
+
+Revision ID: e4a7c3d9b182
+Revises: d81f4b6e2a57
+Create Date: 2026-10-19 12:48:51.330572
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c3d9b182'
+down_revision: Union[str, Sequence[str], None] = 'd81f4b6e2a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('generation_failures',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('garment_image_id', sa.Integer(), nullable=False),
+    sa.Column('model_id', sa.Integer(), nullable=True),
+    sa.Column('pose_label', sa.String(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error_kind', sa.String(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['batches.id'], ),
+    sa.ForeignKeyConstraint(['garment_image_id'], ['garment_images.id'], ),
+    sa.ForeignKeyConstraint(['model_id'], ['models.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_generation_failures_batch_id'), 'generation_failures', ['batch_id'], unique=False)
+    op.create_index(op.f('ix_generation_failures_id'), 'generation_failures', ['id'], unique=False)
+    op.add_column('generated_images', sa.Column('attempts', sa.Integer(), nullable=True))
+    op.add_column('batches', sa.Column('failed_combinations', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('batches', 'failed_combinations')
+    op.drop_column('generated_images', 'attempts')
+    op.drop_index(op.f('ix_generation_failures_id'), table_name='generation_failures')
+    op.drop_index(op.f('ix_generation_failures_batch_id'), table_name='generation_failures')
+    op.drop_table('generation_failures')
@@ -0,0 +1,30 @@
+"""add token reservation and refund columns to batches
+
+Revision ID: f1b6d2c8e905
+Revises: e4a7c3d9b182
+Create Date: 2026-10-19 17:21:07.514203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b6d2c8e905'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c3d9b182'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('batches', sa.Column('tokens_reserved', sa.Integer(), nullable=True))
+    op.add_column('batches', sa.Column('tokens_refunded', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('batches', 'tokens_refunded')
+    op.drop_column('batches', 'tokens_reserved')
@@ -0,0 +1,55 @@
+"""add pending_generations for provider callback mode
+
+Revision ID: f6c2d8e4a175
+Revises: e9b5c1d7f364
+Create Date: 2026-10-19 21:03:29.845172
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6c2d8e4a175'
+down_revision: Union[str, Sequence[str], None] = 'e9b5c1d7f364'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('pending_generations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('garment_image_id', sa.Integer(), nullable=False),
+    sa.Column('model_id', sa.Integer(), nullable=True),
+    sa.Column('pose_label', sa.String(), nullable=False),
+    sa.Column('provider', sa.String(), nullable=False),
+    sa.Column('request_id', sa.String(), nullable=True),
+    sa.Column('token', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('submitted_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['batches.id'], ),
+    sa.ForeignKeyConstraint(['garment_image_id'], ['garment_images.id'], ),
+    sa.ForeignKeyConstraint(['model_id'], ['models.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_pending_generations_batch_id'), 'pending_generations', ['batch_id'], unique=False)
+    op.create_index(op.f('ix_pending_generations_id'), 'pending_generations', ['id'], unique=False)
+    op.create_index(op.f('ix_pending_generations_request_id'), 'pending_generations', ['request_id'], unique=True)
+    op.create_index(op.f('ix_pending_generations_status'), 'pending_generations', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_pending_generations_status'), table_name='pending_generations')
+    op.drop_index(op.f('ix_pending_generations_request_id'), table_name='pending_generations')
+    op.drop_index(op.f('ix_pending_generations_id'), table_name='pending_generations')
+    op.drop_index(op.f('ix_pending_generations_batch_id'), table_name='pending_generations')
+    op.drop_table('pending_generations')
@@ -1,17 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.auth import get_current_user, create_user, authenticate_user, create_password_reset_token, verify_password_reset_token, send_password_reset_email
+from app.core.auth import get_current_user_async, create_user_async, authenticate_user_async, create_password_reset_token, verify_password_reset_token, send_password_reset_email
 from app.schemas.user import UserCreate, UserLogin, UserResponse, PasswordResetRequest, PasswordReset
-from app.core.config import get_db
+from app.core.config import get_async_db, get_db
+from app.core.replicas import get_async_read_db
 from app.models.subscription import Subscription
 from app.models.user import User
 from app.core.utils import hash_password
 
 router = APIRouter()
 
+async def _latest_subscription(db: AsyncSession, user_id: int):
+    return await db.scalar(
+        select(Subscription)
+        .where(Subscription.user_id == user_id)
+        .order_by(Subscription.current_period_end.desc())
+        .limit(1)
+    )
+
 @router.post("/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = create_user(user, db)  # <-- Fix argument order
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await create_user_async(user, db)
     if db_user is None:
         raise HTTPException(status_code=400, detail="User already exists")
     from app.core.auth import create_access_token
@@ -24,20 +35,15 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = authenticate_user(db, user.email, user.password)
-    if db_user is None:
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    db_user = await authenticate_user_async(db, user.email, user.password)
+    if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     from app.core.auth import create_access_token
     access_token = create_access_token(
         data={"sub": db_user.email}
     )
-    subscription = (
-        db.query(Subscription)
-        .filter(Subscription.user_id == db_user.id)
-        .order_by(Subscription.current_period_end.desc())
-        .first()
-    )
+    subscription = await _latest_subscription(db, db_user.id)
     subscription_status = subscription.status if subscription else None
     return {
         "access_token": access_token,
@@ -48,11 +54,11 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
 from fastapi.security import OAuth2PasswordRequestForm
 
 @router.post("/token")
-def login_for_access_token(
-    db: Session = Depends(get_db),
+async def login_for_access_token(
+    db: AsyncSession = Depends(get_async_db),
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     from app.core.auth import create_access_token
@@ -60,13 +66,8 @@ def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me")
-def read_users_me(db: Session = Depends(get_db), current_user: UserResponse = Depends(get_current_user)):
-    subscription = (
-        db.query(Subscription)
-        .filter(Subscription.user_id == current_user.id)
-        .order_by(Subscription.current_period_end.desc())
-        .first()
-    )
+async def read_users_me(db: AsyncSession = Depends(get_async_read_db), current_user: UserResponse = Depends(get_current_user_async)):
+    subscription = await _latest_subscription(db, current_user.id)
     subscription_status = subscription.status if subscription else None
     return {
         "email": current_user.email,
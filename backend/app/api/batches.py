@@ -1,33 +1,56 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
-from sqlalchemy.orm import Session
-from app.models import Batch, GeneratedImage,GarmentImage
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Query
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from app.models import Batch, BatchModel, GeneratedImage, GarmentImage, GenerationFailure, Model
 from app.models.subscription import Subscription
 from app.models.task import Task
 from app.schemas import BatchCreate, BatchResponse
-from app.workers.image_tasks import generate_images_task
-from app.core.config import get_db
+from app.workers.image_tasks import (
+    cancel_batch_run, cancel_submitted_generations, enqueue_generation, queued_combinations,
+)
+from app.core.config import get_async_db, get_db, settings
+from app.core.etags import batch_etag, etag_matches, not_modified
+from app.core.replicas import get_async_read_db
 import os
 import shutil
 from datetime import datetime
-from app.core.auth import get_current_user
+from app.core.auth import get_current_user, get_current_user_async
+from app.core.tracing import current_trace_context, span
 from app.models.user import User
 from typing import List
 from fastapi import Body
 import base64
 import uuid
 from pathlib import Path
-from fastapi import Request, UploadFile
+from fastapi import Request, Response, UploadFile
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from cloudinary.uploader import upload
-from app.core.cloudinary_config import cloudinary
-from fastapi.responses import StreamingResponse
-import io
-import zipfile
-import requests
+from app.services.archives import batch_outputs, ensure_archive, outputs_digest, stored_archive
+from app.services.blob_store import save_upload
+from app.services.preprocessing import normalize_garment_async, upload_normalized_garment
+from app.services.dedupe import find_near_duplicate, find_previous_garment, copy_outputs
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+from app.services.uploads import UploadService
+from app.services.admission import check_admission
+from app.services.ingest import CatalogueIngest, iter_url_items, iter_zip_entries
+from app.services.scheduler import get_scheduler, get_tenant_policy
+from app.services.token import TokenService
+from fastapi.responses import FileResponse
+from PIL import Image
 
 router = APIRouter()
 
+
+async def _normalize_upload(filename: str, data: bytes) -> dict:
+    try:
+        return await normalize_garment_async(data)
+    except (OSError, Image.DecompressionBombError):
+        # UnidentifiedImageError is an OSError too
+        raise HTTPException(status_code=400, detail=f"{filename} is not a readable image")
+
+
 def parse_batch_datetime(batch):
     # Defensive: handle None and already-datetime
     created_at = batch.created_at
@@ -47,9 +70,29 @@ def parse_batch_datetime(batch):
 
 
 
+async def _load_matrix_models(db: AsyncSession, model_ids: List[int], user_id: int) -> List[Model]:
+    """The requested models with their images, in request order; the user's own or shared ones only."""
+    found = {
+        model.id: model
+        for model in (await db.scalars(
+            select(Model)
+            .options(selectinload(Model.model_images))
+            .where(Model.id.in_(model_ids), or_(Model.user_id == user_id, Model.user_id == 0))
+        )).all()
+    }
+    missing = [model_id for model_id in model_ids if model_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Model not found: {', '.join(map(str, missing))}")
+    empty = [model_id for model_id in model_ids if not found[model_id].model_images]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"No model images found for model {', '.join(map(str, empty))}")
+    return [found[model_id] for model_id in model_ids]
+
+
 # Update the create_batch function
 @router.post("/", response_model=BatchResponse)
-async def create_batch(request: Request, db: Session = Depends(get_db),current_user: User = Depends(get_current_user)):
+async def create_batch(request: Request, db: AsyncSession = Depends(get_async_db),
+                       current_user: User = Depends(get_current_user_async)):
     form = await request.form()
     
      # Get task_id from frontend
@@ -60,7 +103,11 @@ async def create_batch(request: Request, db: Session = Depends(get_db),current_u
     task_id = int(form.get("task_id"))
 
     # Validate user's subscription status via task -> user
-    task = db.query(Task).filter(Task.id == task_id).first()
+    task = await db.scalar(
+        select(Task)
+        .options(selectinload(Task.model).selectinload(Model.model_images))
+        .where(Task.id == task_id)
+    )
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
 
@@ -73,28 +120,38 @@ async def create_batch(request: Request, db: Session = Depends(get_db),current_u
     # if subscription is None or (subscription.status or "").lower() != "active":
     #     raise HTTPException(status_code=402, detail="Upgrade to pro plan")
 
-    # Get model images count from task's model
-    model_images_count = 0
-    if task.model and task.model.model_images:
-        model_images_count = len(task.model.model_images)
+    # A matrix job tries the garments on every model in model_ids, as one
+    # batch, instead of on the task's model
+    model_ids = list(dict.fromkeys(int(model_id) for model_id in form.getlist("model_ids")))
+    if model_ids:
+        models = await _load_matrix_models(db, model_ids, current_user.id)
+    else:
+        models = [task.model] if task.model else []
+
+    # Poses each garment is generated in, across all models
+    model_images_count = sum(len(model.model_images) for model in models)
     
     if model_images_count == 0:
         raise HTTPException(status_code=400, detail="No model images found for this task's model")
 
-    # Get all files from 'files'
+    # Get all files from 'files', plus garments already uploaded directly to storage
     upload_files = form.getlist("files")
-    if not upload_files:
+    try:
+        upload_ids = [int(upload_id) for upload_id in form.getlist("upload_ids")]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="upload_ids must be integers")
+    if not upload_files and not upload_ids:
         raise HTTPException(status_code=400, detail="No file uploaded")
+    # Services written against a sync Session run through run_sync, which
+    # hands them the AsyncSession's underlying one without blocking the loop
+    uploaded_garments = await db.run_sync(
+        lambda session: UploadService(session).get_completed_sessions(current_user.id, upload_ids, purpose="garment")
+    )
 
-    # Calculate required tokens: number of garment images × number of model images
-    required_tokens = len(upload_files) * model_images_count
-    
-    # Check if user has enough tokens
-    if current_user.token_balance < required_tokens:
-        raise HTTPException(
-            status_code=403, 
-            detail=f"Insufficient tokens. Required: {required_tokens}, Available: {current_user.token_balance}"
-        )
+    # Normalize every garment up front; this also yields its perceptual hash
+    contents = [(file.filename, await file.read()) for file in upload_files]
+    with span("normalize_garments", count=len(contents)):
+        normalized_garments = await asyncio.gather(*(_normalize_upload(name, data) for name, data in contents))
 
     # Create batch first
     new_batch = Batch(
@@ -103,78 +160,287 @@ async def create_batch(request: Request, db: Session = Depends(get_db),current_u
         created_at=datetime.utcnow().isoformat()
     )
 
-    # Save each garment image as a separate record linked to the same batch
-    for file in upload_files:
-        garment_image_url = await save_garment_image(file)
+    # Collapse near-duplicates: within this batch onto the first copy, and onto
+    # earlier batches of the same model that already have outputs
+    originals = []
+    reused = []
+    for normalized in normalized_garments:
         garment_image = GarmentImage(
-            image_url=garment_image_url
+            width=normalized["width"],
+            height=normalized["height"],
+            phash=normalized["phash"]
+        )
+        original = find_near_duplicate(normalized["phash"], [g for g, _ in originals])
+        # Earlier outputs are for the task's model only, so matrix jobs don't reuse them
+        previous = None if original or model_ids else await db.run_sync(
+            find_previous_garment, current_user.id, task.model_id, normalized["phash"]
         )
+        if original is not None:
+            garment_image.duplicate_of = original
+        elif previous is not None:
+            garment_image.image_url = previous.image_url
+            garment_image.duplicate_of_id = previous.id
+            reused.append((garment_image, previous))
+        else:
+            originals.append((garment_image, normalized))
         new_batch.garment_images.append(garment_image)
 
-    db.add(new_batch)
-    db.commit()
-    db.refresh(new_batch)
+    duplicate_garments = len(normalized_garments) - len(originals)
+    new_batch.duplicate_garments = duplicate_garments
+    new_batch.tokens_saved = duplicate_garments * model_images_count
 
-    generate_images_task(new_batch.id,current_user.id)
+    # Calculate required tokens: number of distinct garment images × number of model images
+    required_tokens = (len(originals) + len(uploaded_garments)) * model_images_count
+    
+    # Check if user has enough tokens
+    if current_user.token_balance < required_tokens:
+        raise HTTPException(
+            status_code=403, 
+            detail=f"Insufficient tokens. Required: {required_tokens}, Available: {current_user.token_balance}"
+        )
+
+    # Turn work away while the backlog is too deep, before anything is uploaded
+    policy = await db.run_sync(get_tenant_policy, current_user.id)
+    admission = check_admission(get_scheduler(), policy, required_tokens, queued_combinations())
+    if not admission.admitted:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Generation queue is busy (about {int(admission.queue_wait_seconds)}s of backlog). Please retry later.",
+            headers={"Retry-After": str(admission.retry_after)}
+        )
 
-    return BatchResponse.model_validate(parse_batch_datetime(new_batch))
+    # Only distinct garments are uploaded
+    for garment_image, normalized in originals:
+        garment_image.image_url = await run_in_threadpool(upload_normalized_garment, normalized)
+    for garment_image in new_batch.garment_images:
+        if garment_image.duplicate_of is not None:
+            garment_image.image_url = garment_image.duplicate_of.image_url
+    for upload_session in uploaded_garments:
+        new_batch.garment_images.append(GarmentImage(image_url=upload_session.url))
+
+    # Charge up front; the worker refunds whatever fails or is cancelled.
+    # Conditional on the balance, so concurrent batches can't overdraw it
+    if not await db.run_sync(lambda session: TokenService(session).reserve_tokens(current_user.id, required_tokens)):
+        await db.rollback()
+        raise HTTPException(status_code=403, detail=f"Insufficient tokens. Required: {required_tokens}")
+    new_batch.tokens_reserved = required_tokens
+    distinct_garments = len(originals) + len(uploaded_garments)
+    if model_ids:
+        new_batch.matrix_models = [
+            BatchModel(model_id=model.id, tokens_reserved=distinct_garments * len(model.model_images))
+            for model in models
+        ]
+
+    db.add(new_batch)
+    await db.flush()
+    # Garments seen in an earlier batch get that batch's outputs, no generation
+    for garment_image, previous in reused:
+        await db.run_sync(copy_outputs, previous, garment_image, task.model_id)
+    await db.commit()
+    await db.refresh(new_batch)
+
+    # Generation runs on the batch runners; poll the batch for progress
+    enqueue_generation(new_batch.id, current_user.id, trace_context=current_trace_context(),
+                       combinations=required_tokens)
+
+    batch_dict = parse_batch_datetime(new_batch)
+    batch_dict["queue_wait_seconds"] = admission.queue_wait_seconds
+    batch_dict["eta_seconds"] = admission.eta_seconds
+    batch_dict["models"] = [
+        {"model_id": model.id, "poses": len(model.model_images),
+         "tokens_reserved": distinct_garments * len(model.model_images)}
+        for model in models
+    ]
+    return BatchResponse.model_validate(batch_dict)
 
   
 
+@router.get("/queue")
+def get_queue_status(current_user: User = Depends(get_current_user)):
+    """How much of the current user's generation work is waiting or running."""
+    scheduler = get_scheduler()
+    return {
+        "queued": scheduler.queue_depths().get(current_user.id, 0),
+        "running": scheduler.running().get(current_user.id, 0),
+    }
+
+
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+URL_LIST_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+INGEST_STATUS = {"insufficient_tokens": 403, "queue_busy": 429, "invalid_input": 400}
+
+
+@router.post("/ingest")
+async def ingest_catalogue(request: Request, task_id: int, batch_size: int = Query(default=None, ge=1),
+                           db: AsyncSession = Depends(get_async_db),
+                           current_user: User = Depends(get_current_user_async)):
+    """Create batches for a whole catalogue, streamed in as a ZIP of images or JSON lines of URLs.
+
+    The garments are split into batches of ``batch_size``, each charged and
+    queued as soon as it's complete. Stops early, keeping the batches already
+    created, when tokens run out or the generation queue is too deep.
+    """
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    if batch_size > settings.INGEST_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"batch_size can be at most {settings.INGEST_MAX_BATCH_SIZE}")
+
+    task = await db.scalar(
+        select(Task)
+        .options(selectinload(Task.model).selectinload(Model.model_images))
+        .where(Task.id == task_id, Task.user_id == current_user.id)
+    )
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not task.model or not task.model.model_images:
+        raise HTTPException(status_code=400, detail="No model images found for this task's model")
+
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type in ZIP_TYPES:
+        items = iter_zip_entries(request.stream(), settings.UPLOAD_MAX_BYTES)
+    elif media_type in URL_LIST_TYPES:
+        items = iter_url_items(request.stream(), settings.UPLOAD_MAX_BYTES, settings.INGEST_FETCH_CONCURRENCY)
+    else:
+        raise HTTPException(status_code=415, detail="Send a ZIP archive or JSON lines of image URLs")
+
+    with span("ingest_catalogue", task_id=task_id, batch_size=batch_size):
+        summary = await CatalogueIngest(db, current_user.id, task, batch_size).run(items)
+
+    stopped = summary["stopped"]
+    if stopped and not summary["batches"]:
+        headers = {"Retry-After": str(stopped["retry_after"])} if stopped["retry_after"] else None
+        raise HTTPException(status_code=INGEST_STATUS[stopped["reason"]], detail=stopped["detail"], headers=headers)
+    return summary
+
+
 @router.get("/{batch_id}", response_model=BatchResponse)
-def get_batch(batch_id: int, db: Session = Depends(get_db)):
-    batch = db.query(Batch).filter(Batch.id == batch_id).first()
+async def get_batch(batch_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    current = (await db.execute(select(Batch.version, Batch.status).where(Batch.id == batch_id))).first()
+    if not current:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    etag = batch_etag(batch_id, *current)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+
+    batch = await db.get(Batch, batch_id)
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
+    # The version may have moved between the two reads; tag what is actually sent
+    response.headers["ETag"] = batch_etag(batch.id, batch.version, batch.status)
     return BatchResponse.model_validate(parse_batch_datetime(batch))
 
+@router.get("/{batch_id}/models")
+async def get_batch_models(batch_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    """Cost and progress of a batch per model: distinct garments × that model's poses."""
+    batch = await db.scalar(
+        select(Batch).options(selectinload(Batch.matrix_models), selectinload(Batch.task)).where(Batch.id == batch_id)
+    )
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if batch.matrix_models:
+        reserved = {entry.model_id: entry.tokens_reserved for entry in batch.matrix_models}
+    elif batch.task and batch.task.model_id:
+        reserved = {batch.task.model_id: batch.tokens_reserved}
+    else:
+        reserved = {}
+
+    models = {
+        model.id: model
+        for model in (await db.scalars(
+            select(Model).options(selectinload(Model.model_images)).where(Model.id.in_(reserved))
+        )).all()
+    }
+    # Duplicates are copied from their original, so progress counts originals only
+    distinct = (GarmentImage.batch_id == batch_id, GarmentImage.duplicate_of_id.is_(None))
+    garments = await db.scalar(select(func.count()).select_from(GarmentImage).where(*distinct))
+    generated = dict((await db.execute(
+        select(GeneratedImage.model_id, func.count())
+        .join(GarmentImage, GeneratedImage.garment_image_id == GarmentImage.id)
+        .where(*distinct)
+        .group_by(GeneratedImage.model_id)
+    )).all())
+    failed = dict((await db.execute(
+        select(GenerationFailure.model_id, func.count())
+        .where(GenerationFailure.batch_id == batch_id)
+        .group_by(GenerationFailure.model_id)
+    )).all())
+
+    return {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "models": [
+            {
+                "model_id": model_id,
+                "name": models[model_id].name if model_id in models else None,
+                "poses": len(models[model_id].model_images) if model_id in models else 0,
+                "expected": garments * (len(models[model_id].model_images) if model_id in models else 0),
+                "generated": generated.get(model_id, 0),
+                "failed": failed.get(model_id, 0),
+                "tokens_reserved": tokens or 0,
+            }
+            for model_id, tokens in reserved.items()
+        ],
+    }
+
+
+@router.post("/{batch_id}/cancel", response_model=BatchResponse)
+def cancel_batch(batch_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Stop a batch: drop its remaining combinations and refund what never ran."""
+    batch = (
+        db.query(Batch)
+        .join(Task, Batch.task_id == Task.id)
+        .filter(Batch.id == batch_id, Task.user_id == current_user.id)
+        .first()
+    )
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if batch.status in ("done", "failed", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Batch is already {batch.status}")
+
+    # Not picked up by a worker yet: nothing ran, so everything comes back now
+    claimed = db.query(Batch).filter(Batch.id == batch_id, Batch.status == "queued").update(
+        {Batch.status: "cancelled", Batch.version: Batch.version + 1}, synchronize_session=False
+    )
+    if claimed:
+        refund = (batch.tokens_reserved or 0) - (batch.tokens_refunded or 0)
+        TokenService(db).refund_tokens(current_user.id, refund)
+        db.query(Batch).filter(Batch.id == batch_id).update(
+            {Batch.tokens_refunded: (batch.tokens_refunded or 0) + max(refund, 0), Batch.version: Batch.version + 1},
+            synchronize_session=False,
+        )
+    else:
+        # The worker settles the refund once its in-flight calls have stopped
+        db.query(Batch).filter(Batch.id == batch_id, Batch.status == "processing").update(
+            {Batch.status: "cancelling", Batch.version: Batch.version + 1}, synchronize_session=False
+        )
+    db.commit()
+    cancel_batch_run(batch_id)
+    if not claimed:
+        # Callback mode: whatever the provider has accepted is withdrawn here
+        cancel_submitted_generations(db, batch_id)
+
+    db.refresh(batch)
+    return BatchResponse.model_validate(parse_batch_datetime(batch))
+
+
 @router.get("/{batch_id}/download")
 def download_batch_zip(batch_id: int, db: Session = Depends(get_db)):
     batch = db.query(Batch).filter(Batch.id == batch_id).first()
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
 
-    # Collect all generated image URLs for the batch
-    image_urls: List[str] = []
-    for garment in batch.garment_images:
-        for gen in garment.generated_images:
-            if gen.output_url:
-                image_urls.append(gen.output_url)
-
+    image_urls = batch_outputs(db, batch_id)
     if not image_urls:
         raise HTTPException(status_code=404, detail="No generated images found for this batch")
 
-    def iter_zip():
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-            for idx, url in enumerate(image_urls, start=1):
-                try:
-                    # Stream each image from its URL
-                    resp = requests.get(url, stream=True, timeout=20)
-                    resp.raise_for_status()
-                    # Guess extension from URL path
-                    ext = ".jpg"
-                    path_lower = url.split("?")[0].lower()
-                    if path_lower.endswith((".png", ".jpeg", ".jpg", ".webp")):
-                        for candidate in [".png", ".jpeg", ".jpg", ".webp"]:
-                            if path_lower.endswith(candidate):
-                                ext = candidate
-                                break
-                    filename = f"image_{idx}{ext}"
-                    # Read content fully into memory for writing into zip
-                    content = resp.content
-                    zf.writestr(filename, content)
-                except Exception:
-                    # Skip failed downloads silently
-                    continue
-        zf.close()
-        buffer.seek(0)
-        yield from buffer
-
-    headers = {
-        "Content-Disposition": f"attachment; filename=batch_{batch_id}.zip"
-    }
-    return StreamingResponse(iter_zip(), media_type="application/zip", headers=headers)
+    path = stored_archive(db, batch_id, outputs_digest(image_urls))
+    if path is None:
+        # Built on the first download, or joins a build already under way
+        path = ensure_archive(batch_id).result()
+
+    # Content-addressed, so the file name is a strong ETag; FileResponse
+    # answers Range / If-Range requests against it, so downloads can resume
+    return FileResponse(path, media_type="application/zip", filename=f"batch_{batch_id}.zip",
+                        headers={"ETag": f'"{os.path.basename(path)}"'})
 
 from app.models import Batch, GeneratedImage
 from app.schemas import BatchResponse
@@ -187,14 +453,10 @@ async def dummy_create_batch(
     dummy_image: UploadFile = File(...),         # Dummy generated image
     db: Session = Depends(get_db)
 ):
-    save_dir = "uploaded_garments"
-    os.makedirs(save_dir, exist_ok=True)
     batch_responses = []
 
     # Save dummy generated image once
-    dummy_image_path = os.path.join(save_dir, f"dummy_{dummy_image.filename}")
-    with open(dummy_image_path, "wb") as buffer:
-        shutil.copyfileobj(dummy_image.file, buffer)
+    dummy_image_path = save_upload(dummy_image)
 
     # Create one batch per request
     new_batch = Batch(
@@ -208,9 +470,7 @@ async def dummy_create_batch(
 
     for file in files:
         # Save garment image
-        garment_image_path = os.path.join(save_dir, file.filename)
-        with open(garment_image_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        garment_image_path = save_upload(file)
 
         # Create garment image entry
         garment_image = GarmentImage(
@@ -235,14 +495,3 @@ async def dummy_create_batch(
     batch_responses.append(BatchResponse.model_validate(parse_batch_datetime(new_batch)))
 
     return batch_responses
-
-
-async def save_garment_image(file: UploadFile):
-    # Upload directly to Cloudinary
-    upload_result = upload(
-        file.file,
-        folder="my_project_uploads/garments"  # Cloudinary folder name
-    )
-    
-    # Return the secure URL from Cloudinary
-    return upload_result["secure_url"]
\ No newline at end of file
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from app.services.blob_store import blob_store, parse_blob_name
+
+router = APIRouter()
+
+# Blobs are content-addressed, so a given URL can never change
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+@router.api_route("/{name}", methods=["GET", "HEAD"])
+def get_blob(name: str, request: Request):
+    parsed = parse_blob_name(name)
+    if parsed is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    digest, media_type = parsed
+    if not blob_store.exists(digest):
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Access-Control-Allow-Origin": "*",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    # FileResponse answers Range / If-Range requests against our strong ETag
+    return FileResponse(blob_store.path_for(digest), media_type=media_type, headers=headers)
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Body, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.config import get_db
+from app.workers.callbacks import CallbackMismatch, complete_pending_generation
+
+router = APIRouter()
+
+
+@router.post("/tryon/{pending_id}")
+def tryon_callback(pending_id: int, token: str = "", body: dict = Body(...), db: Session = Depends(get_db)):
+    """Result of a try-on submitted in callback mode, POSTed by the provider"""
+    try:
+        pending = complete_pending_generation(db, pending_id, token, body)
+    except CallbackMismatch as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if pending is None:
+        raise HTTPException(status_code=404, detail="Pending generation not found")
+    return {"status": pending.status}
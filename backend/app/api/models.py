@@ -11,53 +11,63 @@ import os
 from app.models.model_image import ModelImage
 from typing import Optional
 import uuid
-from cloudinary.uploader import upload
-from app.core.cloudinary_config import cloudinary 
-from sqlalchemy import or_
+from app.core.cloudinary_config import get_cloudinary_uploader
+from app.core.tracing import SpanKind, span
+from app.services.blob_store import save_upload
+from app.services.uploads import UploadService, get_upload_service
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.core.auth import get_current_user_async
+from app.core.config import get_async_db
+from app.core.replicas import get_async_read_db
 
 router = APIRouter()
 
+def _model_response(model: Model) -> dict:
+    return {
+        "id": model.id,
+        "name": model.name,
+        "description": model.description,
+        "images": [img.url for img in model.model_images]
+    }
+
 @router.get("/", response_model=list[ModelResponse])
-def list_models(db: Session = Depends(get_db),current_user: User = Depends(get_current_user)):
-    models = db.query(Model).filter(
-        or_(
-            Model.user_id == current_user.id,
-            Model.user_id == 0
-        )
-    ).all()
-    result = []
-    for model in models:
-        images = [
-            img.url
-            for img in db.query(ModelImage).filter(ModelImage.model_id == model.id).all()
-        ]
-        result.append({
-            "id": model.id,
-            "name": model.name,
-            "description": model.description,
-            "images": images
-        })
-    return result
+async def list_models(db: AsyncSession = Depends(get_async_read_db), current_user: User = Depends(get_current_user_async)):
+    # One query for the models and one for all their images
+    models = (await db.scalars(
+        select(Model)
+        .options(selectinload(Model.model_images))
+        .where(or_(Model.user_id == current_user.id, Model.user_id == 0))
+    )).all()
+    return [_model_response(model) for model in models]
 
 @router.get("/{model_id}", response_model=ModelResponse)
-def get_model(model_id: int, db: Session = Depends(get_db)):
-    model = db.query(Model).filter(Model.id == model_id).first()
+async def get_model(model_id: int, db: AsyncSession = Depends(get_async_db)):
+    model = await db.scalar(select(Model).options(selectinload(Model.model_images)).where(Model.id == model_id))
     if not model:
         raise HTTPException(status_code=404, detail="Model not found")
-    return model
+    return _model_response(model)
 
 import logging
 
-# Configure logging (so logs show up in uvicorn terminal)
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("uvicorn")
+logger = logging.getLogger(__name__)
 
 @router.post("/", response_model=dict)
-async def create_model(
-    files: list[UploadFile] = File(...),
+def create_model(
+    files: list[UploadFile] = File(None),
+    upload_ids: list[int] = Form(None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    upload_service: UploadService = Depends(get_upload_service)
 ):
+    files = files or []
+    uploaded_images = upload_service.get_completed_sessions(
+        current_user.id, upload_ids or [], purpose="model"
+    )
+    if not files and not uploaded_images:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+
     # Create the model entry
     random_name = f"Model-{uuid.uuid4().hex[:8]}"
     random_description = f"Auto-generated model {uuid.uuid4().hex[:6]}"
@@ -74,10 +84,11 @@ async def create_model(
             logger.info(f"📂 File: {file.filename} | ContentType: {file.content_type}")
 
             # ✅ Upload directly to Cloudinary
-            upload_result = upload(
-                file.file,
-                folder="my_project_uploads"  # Cloudinary folder name
-            )
+            with span("cloudinary.upload", kind=SpanKind.CLIENT):
+                upload_result = get_cloudinary_uploader().upload(
+                    file.file,
+                    folder="my_project_uploads"  # Cloudinary folder name
+                )
 
             # ✅ Save Cloudinary URL in DB
             model_image = ModelImage(
@@ -87,16 +98,24 @@ async def create_model(
             )
             db.add(model_image)
 
-        db.commit()
+    # Images uploaded directly to storage only need registering
+    for upload_session in uploaded_images:
+        db.add(ModelImage(
+            model_id=new_model.id,
+            url=upload_session.url,
+            pose_label="pose_label"
+        ))
 
-    logger.info(f"✅ Model {new_model.id} created successfully with {len(files)} file(s)")
+    db.commit()
+
+    logger.info(f"✅ Model {new_model.id} created successfully with {len(files) + len(uploaded_images)} file(s)")
 
     return {"model_id": new_model.id}
 
 
 
 @router.post("/create_with_images", response_model=ModelResponse)
-async def create_model_with_images(
+def create_model_with_images(
     model_id: Optional[str] = Form(None),
     name: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
@@ -124,16 +143,11 @@ async def create_model_with_images(
         db.commit()
         db.refresh(new_model)
 
-    save_dir = "uploaded_images"
-    os.makedirs(save_dir, exist_ok=True)
-
     if files:
         for file in files:
             if not isinstance(file, UploadFile):
                 continue  # skip invalid files
-            file_location = os.path.join(save_dir, file.filename)
-            with open(file_location, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            file_location = save_upload(file)
             model_image = ModelImage(
                 model_id=new_model.id,
                 url=file_location,
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.core.config import get_db
 from app.core.auth import get_current_user
@@ -6,16 +7,21 @@ from app.models.user import User
 from app.models.subscription import Subscription
 from typing import Dict, Any
 import json
+import logging
 
 from app.services.payment import payment_service
 from app.services.subscription import subscription_service
 from app.services.token import get_token_service
 from app.models.transaction import Transaction
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# PayPal calls and the sync Session both block, so handlers are plain defs
+# that FastAPI runs on its threadpool instead of the event loop
 @router.post("/paypal/create-order")
-async def create_paypal_order(request: Dict[str, Any], db: Session = Depends(get_db),current_user: User = Depends(get_current_user)):
+def create_paypal_order(request: Dict[str, Any], db: Session = Depends(get_db),current_user: User = Depends(get_current_user)):
     try:
         amount = request.get("amount", 1000)
         plan_id = request.get("plan")
@@ -34,14 +40,16 @@ async def create_paypal_order(request: Dict[str, Any], db: Session = Depends(get
 async def paypal_webhook(request: Request, db: Session = Depends(get_db)):
     try:
         body = await request.body()
-        result = payment_service.handle_paypal_webhook(body=body, db=db, SubscriptionModel=Subscription)
+        result = await run_in_threadpool(
+            payment_service.handle_paypal_webhook, body=body, db=db, SubscriptionModel=Subscription
+        )
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing webhook: {str(e)}")
 
 
 @router.post("/paypal/order-status")
-async def paypal_order_status(request: Dict[str, Any], db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def paypal_order_status(request: Dict[str, Any], db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
         merchant_order_id = request.get("orderId") or request.get("merchantOrderId")
         if not merchant_order_id:
@@ -57,7 +65,7 @@ async def paypal_order_status(request: Dict[str, Any], db: Session = Depends(get
 
 
 @router.get("/paypal/order-status/{orderId}")
-async def paypal_order_status_by_id(orderId: str, planId: int | None = Query(default=None), db: Session = Depends(get_db)):
+def paypal_order_status_by_id(orderId: str, planId: int | None = Query(default=None), db: Session = Depends(get_db)):
     try:
         if not orderId:
             raise HTTPException(status_code=422, detail="orderId is required")
@@ -103,12 +111,9 @@ async def paypal_order_status_by_id(orderId: str, planId: int | None = Query(def
                             token_service = get_token_service(db)
                             token_service.allocate_tokens_from_plan(user_id=txn.user_id, subscription_id=subscription.id)
                         except Exception as e:
-                            print(f"Token allocation error for user {txn.user_id}, subscription {subscription.id}: {e}")
+                            logger.exception("Token allocation error for user %s, subscription %s", txn.user_id, subscription.id)
                     else:
-                        try:
-                            print(f"No resolved_plan_id for order_id={orderId}")
-                        except Exception:
-                            pass
+                        logger.warning("No resolved_plan_id for order_id=%s", orderId)
 
                     return {
                         "success": True,
@@ -3,12 +3,13 @@ from sqlalchemy.orm import Session
 from app.models.plan import Plan
 from app.schemas.plan import PlanResponse, PlanCreate
 from app.core.config import get_db
+from app.core.replicas import get_read_db
 from fastapi import Depends
 
 router = APIRouter()
 
 @router.get("/", response_model=list[PlanResponse])
-def get_plans(db: Session = Depends(get_db)):
+def get_plans(db: Session = Depends(get_read_db)):
     plans = db.query(Plan).all()
     return plans
     
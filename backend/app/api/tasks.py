@@ -1,23 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.models import Task, Batch
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.models import Task, Batch, GarmentImage, Model
 from app.schemas import TaskCreate, TaskResponse, BatchCreate, TaskRespons
-from app.core.config import get_db
-from app.core.auth import get_current_user
+from app.core.config import get_async_db
+from app.core.etags import batches_etag, etag_matches, not_modified
+from app.core.replicas import get_async_read_db, read_session
+from app.core.auth import get_current_user, get_current_user_async
+from app.services.export import FORMATS, export_query, stream_export
 from app.models.user import User
 import logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("uvicorn")  # use uvicorn logger
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Relationships the task responses read; loaded up front, as the async
+# session can't lazy-load them on attribute access
+WITH_MODEL_IMAGES = selectinload(Task.model).selectinload(Model.model_images)
+
 @router.post("/", response_model=TaskResponse)
-def create_task(
+async def create_task(
     task: TaskCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
-    print("➡️ Incoming task:", task.dict())
-    print("➡️ Current user:", current_user.id)
+    # The payload is only serialized when debug logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Incoming task", extra={"payload": task.model_dump(), "user_id": current_user.id})
 
     new_task = Task(
         user_id=current_user.id,
@@ -27,8 +39,8 @@ def create_task(
         pose=task.pose
     )
     db.add(new_task)
-    db.commit()
-    db.refresh(new_task)
+    await db.commit()
+    new_task = await db.scalar(select(Task).options(WITH_MODEL_IMAGES).where(Task.id == new_task.id))
 
     # Get all image URLs for the model
     model_images = []
@@ -39,13 +51,13 @@ def create_task(
     task_dict = TaskResponse.from_orm(new_task).dict()
     task_dict["model_images"] = model_images
 
-    print("⬅️ Returning task:", task_dict)
+    logger.debug("Returning task", extra={"task_id": new_task.id, "payload": task_dict})
     return task_dict
 
 
 @router.get("/{task_id}", response_model=TaskResponse)
-def get_task(task_id: int, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == task_id).first()
+async def get_task(task_id: int, db: AsyncSession = Depends(get_async_db)):
+    task = await db.get(Task, task_id)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
@@ -59,10 +71,22 @@ def get_task(task_id: int, db: Session = Depends(get_db)):
 #     return db_batch
 
 @router.get("/{task_id}/batches/")
-def get_batches(task_id: int, db: Session = Depends(get_db)):
-    batches = db.query(Batch).filter(Batch.task_id == task_id).all()
-
-    response = []
+async def get_batches(task_id: int, request: Request, response: Response,
+                      db: AsyncSession = Depends(get_async_read_db)):
+    versions = (await db.execute(
+        select(Batch.id, Batch.version, Batch.status).where(Batch.task_id == task_id)
+    )).all()
+    etag = batches_etag(versions)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+
+    batches = (await db.scalars(
+        select(Batch)
+        .options(selectinload(Batch.garment_images).selectinload(GarmentImage.generated_images))
+        .where(Batch.task_id == task_id)
+    )).all()
+
+    batches_data = []
 
     for batch in batches:
         batch_data = {
@@ -89,26 +113,30 @@ def get_batches(task_id: int, db: Session = Depends(get_db)):
 
             batch_data["garment_images"].append(garment_data)
 
-        response.append(batch_data)
+        batches_data.append(batch_data)
 
-    return response
+    # Tag what was loaded, in case a batch moved on since the version read
+    response.headers["ETag"] = batches_etag((batch.id, batch.version, batch.status) for batch in batches)
+    return batches_data
 
 
 @router.delete("/{task_id}")
-def delete_task(task_id: int, db: Session = Depends(get_db)):
-    task = db.query(Task).filter(Task.id == task_id).first()
+async def delete_task(task_id: int, db: AsyncSession = Depends(get_async_db)):
+    task = await db.get(Task, task_id)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    db.delete(task)
-    db.commit()
+    await db.delete(task)
+    await db.commit()
     return {"detail": "Task deleted successfully"}
 
 @router.get("/my/", response_model=list[TaskResponse])
-def get_my_tasks(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_my_tasks(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
-    tasks = db.query(Task).filter(Task.user_id == current_user.id)
+    tasks = (await db.scalars(
+        select(Task).options(WITH_MODEL_IMAGES).where(Task.user_id == current_user.id)
+    )).all()
     result = []
     for task in tasks:
         # Get all image URLs for the model
@@ -119,4 +147,43 @@ def get_my_tasks(
         task_dict = TaskResponse.from_orm(task).dict()
         task_dict["model_images"] = model_images
         result.append(task_dict)
-    return result
\ No newline at end of file
+    return result
+
+
+def _export_response(request: Request, user: User, fmt: str, name: str, task_id: Optional[int] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None):
+    # The stream outlives the handler, so it gets its own session rather than
+    # the dependency's; stream_export closes it
+    db = read_session(request)
+    if task_id is not None and db.scalar(select(Task.id).where(Task.id == task_id, Task.user_id == user.id)) is None:
+        db.close()
+        raise HTTPException(status_code=404, detail="Task not found")
+    query = export_query(user.id, task_id=task_id, since=since, until=until)
+    headers = {"Content-Disposition": f"attachment; filename={name}.{fmt}"}
+    return StreamingResponse(stream_export(db, query, fmt), media_type=FORMATS[fmt], headers=headers)
+
+
+@router.get("/export/")
+def export_my_images(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|jsonl)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """Every generated image of the user's tasks, optionally created in [since, until)."""
+    return _export_response(request, current_user, format, "generated_images", since=since, until=until)
+
+
+@router.get("/{task_id}/export/")
+def export_task_images(
+    task_id: int,
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|jsonl)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """A task's generated images as CSV or JSON lines, streamed."""
+    return _export_response(request, current_user, format, f"task_{task_id}", task_id, since, until)
+
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends
+from app.core.auth import get_current_user
+from app.models.user import User
+from app.schemas.upload import UploadSessionCreate, UploadSessionTicket, UploadSessionResponse
+from app.services.uploads import UploadService, get_upload_service
+
+router = APIRouter()
+
+@router.post("/sessions", response_model=UploadSessionTicket)
+def create_upload_session(
+    request: UploadSessionCreate,
+    current_user: User = Depends(get_current_user),
+    upload_service: UploadService = Depends(get_upload_service)
+):
+    """Get a presigned URL to upload an image straight to storage"""
+    return upload_service.create_session(
+        user_id=current_user.id,
+        filename=request.filename,
+        content_type=request.content_type,
+        purpose=request.purpose,
+        method=request.method,
+    )
+
+@router.post("/sessions/{session_id}/complete", response_model=UploadSessionResponse)
+def complete_upload_session(
+    session_id: int,
+    current_user: User = Depends(get_current_user),
+    upload_service: UploadService = Depends(get_upload_service)
+):
+    """Register an uploaded object once the client has finished sending it"""
+    return upload_service.complete_session(current_user.id, session_id)
@@ -0,0 +1,94 @@
+import secrets
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.auth import get_current_user
+from app.core.config import get_db
+from app.core.outbound import BlockedURL, check_public_url
+from app.models import Task, WebhookDelivery, WebhookEndpoint
+from app.models.user import User
+from app.schemas.webhook import (
+    WebhookDeliveryResponse, WebhookEndpointCreate, WebhookEndpointCreated, WebhookEndpointResponse,
+)
+from app.services.webhooks import EVENTS
+
+router = APIRouter()
+
+
+def _own_endpoint(db: Session, endpoint_id: int, user: User) -> WebhookEndpoint:
+    endpoint = db.get(WebhookEndpoint, endpoint_id)
+    if endpoint is None or endpoint.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Webhook endpoint not found")
+    return endpoint
+
+
+@router.post("/", response_model=WebhookEndpointCreated)
+def create_webhook_endpoint(
+    request: WebhookEndpointCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Register a URL for batch.completed / batch.failed events; the signing secret is only returned here"""
+    unknown = sorted(set(request.events) - set(EVENTS))
+    if unknown or not request.events:
+        raise HTTPException(status_code=400, detail=f"Unknown events {unknown}; expected some of {list(EVENTS)}")
+    if request.max_concurrency is not None and request.max_concurrency < 1:
+        raise HTTPException(status_code=400, detail="max_concurrency must be at least 1")
+    try:
+        check_public_url(str(request.url))
+    except BlockedURL:
+        raise HTTPException(status_code=400, detail="url must resolve to a public address")
+    if request.task_id is not None:
+        task = db.get(Task, request.task_id)
+        if task is None or task.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Task not found")
+
+    endpoint = WebhookEndpoint(
+        user_id=current_user.id,
+        task_id=request.task_id,
+        url=str(request.url),
+        secret=secrets.token_urlsafe(32),
+        events=sorted(set(request.events)),
+        max_concurrency=request.max_concurrency,
+        active=True,
+    )
+    db.add(endpoint)
+    db.commit()
+    db.refresh(endpoint)
+    return endpoint
+
+
+@router.get("/", response_model=List[WebhookEndpointResponse])
+def list_webhook_endpoints(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return db.query(WebhookEndpoint).filter(WebhookEndpoint.user_id == current_user.id).all()
+
+
+@router.delete("/{endpoint_id}")
+def delete_webhook_endpoint(
+    endpoint_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    db.delete(_own_endpoint(db, endpoint_id, current_user))
+    db.commit()
+    return {"detail": "Webhook endpoint deleted"}
+
+
+@router.get("/{endpoint_id}/deliveries", response_model=List[WebhookDeliveryResponse])
+def list_webhook_deliveries(
+    endpoint_id: int,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Most recent deliveries first, with their last attempt's outcome"""
+    _own_endpoint(db, endpoint_id, current_user)
+    return (
+        db.query(WebhookDelivery)
+        .filter(WebhookDelivery.endpoint_id == endpoint_id)
+        .order_by(WebhookDelivery.id.desc())
+        .limit(min(max(limit, 1), 500))
+        .all()
+    )
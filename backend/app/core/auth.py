@@ -1,16 +1,22 @@
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.schemas.user import UserCreate, UserLogin
 from app.core.utils import hash_password, verify_password
-from app.core.config import get_db, settings
+from app.core.config import get_async_db, get_db, settings
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordBearer
+import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+logger = logging.getLogger(__name__)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token",
                                          description="Paste your JWT access token here to authorize."
 )
@@ -26,12 +32,30 @@ def create_user(user: UserCreate, db: Session):
     db.refresh(new_user)
     return new_user
 
+async def create_user_async(user: UserCreate, db: AsyncSession):
+    db_user = await db.scalar(select(User).where(User.email == user.email))
+    if db_user:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+    # bcrypt is deliberately slow; keep it off the event loop
+    hashed_password = await run_in_threadpool(hash_password, user.password)
+    new_user = User(email=user.email, password_hash=hashed_password)
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return new_user
+
 def authenticate_user(db: Session, email: str, password: str):
     user = db.query(User).filter(User.email == email).first()
     if not user or not verify_password(password, user.password_hash):
         return False
     return user
 
+async def authenticate_user_async(db: AsyncSession, email: str, password: str):
+    user = await db.scalar(select(User).where(User.email == email))
+    if not user or not await run_in_threadpool(verify_password, password, user.password_hash):
+        return False
+    return user
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
@@ -42,22 +66,36 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _email_from_token(token: str) -> str:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return email
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    email = _email_from_token(token)
     user = db.query(User).filter(User.email == email).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    return user
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """``get_current_user`` for handlers on the async session."""
+    email = _email_from_token(token)
+    user = await db.scalar(select(User).where(User.email == email))
+    if user is None:
+        raise _credentials_exception()
     return user
 
 def create_password_reset_token(email: str):
@@ -103,6 +141,7 @@ def send_password_reset_email(email: str, reset_token: str, base_url: str):
     message.attach(MIMEText(body, "html"))
     
     try:
+        settings.require("EMAIL_USERNAME", "EMAIL_PASSWORD", "EMAIL_FROM")
         server = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT)
         server.starttls()
         server.login(settings.EMAIL_USERNAME, settings.EMAIL_PASSWORD)
@@ -110,5 +149,5 @@ def send_password_reset_email(email: str, reset_token: str, base_url: str):
         server.quit()
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        logger.error("Error sending email: %s", e)
         return False
\ No newline at end of file
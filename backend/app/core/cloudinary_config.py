@@ -1,11 +1,28 @@
 import os
-from dotenv import load_dotenv
-import cloudinary
+import threading
 
-load_dotenv()  # loads from .env
+_configured = False
+_lock = threading.Lock()
 
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
+
+def get_cloudinary_uploader():
+    """``cloudinary.uploader``, imported and configured on first use.
+
+    Deferred so that processes which never upload to Cloudinary neither
+    import the SDK nor need its credentials.
+    """
+    global _configured
+    with _lock:
+        if not _configured:
+            from dotenv import load_dotenv
+            import cloudinary
+
+            load_dotenv()  # loads from .env
+            cloudinary.config(
+                cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+                api_key=os.getenv("CLOUDINARY_API_KEY"),
+                api_secret=os.getenv("CLOUDINARY_API_SECRET")
+            )
+            _configured = True
+    import cloudinary.uploader
+    return cloudinary.uploader
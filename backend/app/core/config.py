@@ -1,8 +1,15 @@
 from pydantic_settings import BaseSettings
-from app.database import SessionLocal
+from app.database import SessionLocal, get_async_sessionmaker
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # Read replicas for read-only endpoints (comma separated), see app/core/replicas.py.
+    # A replica further than MAX_LAG behind is skipped; a user's reads go to the
+    # primary for READ_YOUR_WRITES seconds after they change something
+    DATABASE_REPLICA_URLS: str = ""
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_LAG_CHECK_SECONDS: float = 2.0
+    READ_YOUR_WRITES_SECONDS: float = 10.0
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 300000
@@ -11,21 +18,134 @@ class Settings(BaseSettings):
     # Email configuration
     EMAIL_HOST: str = "smtp.gmail.com"
     EMAIL_PORT: int = 587
-    EMAIL_USERNAME: str
-    EMAIL_PASSWORD: str
-    EMAIL_FROM: str
-    
-    STRIPE_API_KEY: str
-    MINIO_URL: str
-    MINIO_ACCESS_KEY: str
-    MINIO_SECRET_KEY: str
-    CELERY_BROKER_URL: str
-    FAL_KEY: str
+    # Integration secrets are optional at startup, so processes that never
+    # touch an integration don't need its credentials; see ``require``
+    EMAIL_USERNAME: str = ""
+    EMAIL_PASSWORD: str = ""
+    EMAIL_FROM: str = ""
+
+    STRIPE_API_KEY: str = ""
+    MINIO_URL: str = ""
+    MINIO_ACCESS_KEY: str = ""
+    MINIO_SECRET_KEY: str = ""
+    CELERY_BROKER_URL: str = ""
+    FAL_KEY: str = ""
+
+    # Object storage (S3 / MinIO) for direct client uploads
+    S3_BUCKET: str = "vestureai-uploads"
+    S3_REGION: str = "us-east-1"
+    UPLOAD_URL_EXPIRES_SECONDS: int = 900
+    UPLOAD_MAX_BYTES: int = 25 * 1024 * 1024
+    STORAGE_MULTIPART_CHUNKSIZE: int = 8 * 1024 * 1024
+    STORAGE_MAX_CONCURRENCY: int = 10
+
+    # Garment preprocessing before try-on submission
+    GARMENT_MAX_EDGE: int = 2048
+    GARMENT_FORMAT: str = "JPEG"
+    GARMENT_QUALITY: int = 90
+    # Where normalized garments go: "cloudinary", or "blob" for the local blob store
+    GARMENT_STORAGE: str = "cloudinary"
+    PREPROCESS_WORKERS: int = 2
+    # Max differing bits (of 64) for two garments to count as the same photo
+    GARMENT_DEDUPE_MAX_DISTANCE: int = 4
+
+    # Aggregate rate governor for fal.ai ("memory" per process, "file" per host)
+    FAL_RATE_PER_SECOND: float = 5.0
+    FAL_BURST: int = 10
+    FAL_MAX_CONCURRENCY: int = 8
+    FAL_MAX_THROTTLE_RETRIES: int = 5
+    FAL_GOVERNOR_BACKEND: str = "memory"
+    FAL_GOVERNOR_DIR: str = "/tmp/vestureai-fal-governor"
+
+    # Retries and circuit breaker around fal.ai calls
+    FAL_RETRY_MAX_ATTEMPTS: int = 4
+    FAL_RETRY_BASE_DELAY: float = 1.0
+    FAL_RETRY_MAX_DELAY: float = 30.0
+    FAL_BREAKER_FAILURE_RATE: float = 0.5
+    FAL_BREAKER_MIN_REQUESTS: int = 10
+    FAL_BREAKER_WINDOW_SECONDS: float = 60.0
+    FAL_BREAKER_OPEN_SECONDS: float = 30.0
+
+    # Try-on backend: "fal", "fal_queue", or "fake" for offline load tests.
+    # "fal_webhook" / "fake_webhook" submit and return, the provider calling
+    # back PROVIDER_CALLBACK_BASE_URL (this API as the provider reaches it);
+    # results that haven't called back in PROVIDER_CALLBACK_TIMEOUT_SECONDS fail
+    TRYON_PROVIDER: str = "fal"
+    FAKE_TRYON_LATENCY: str = "lognormal:2.0:0.5"
+    FAKE_TRYON_FAILURE_RATE: float = 0.0
+    FAKE_TRYON_THROTTLE_RATE: float = 0.0
+    FAKE_TRYON_SEED: int = 0
+    PROVIDER_CALLBACK_BASE_URL: str = ""
+    PROVIDER_CALLBACK_TIMEOUT_SECONDS: float = 900.0
+
+    # Logging: LOG_SAMPLING keeps a fraction of sub-WARNING records per logger
+    # prefix, e.g. "app.workers=0.1,app.services.image_generation=0.01"
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_SAMPLING: str = ""
+
+    # Generation scheduler: worker threads, and defaults for users whose plan
+    # limits set no "priority" / "max_concurrency"
+    SCHEDULER_WORKERS: int = 8
+    SCHEDULER_DEFAULT_PRIORITY: float = 1.0
+    SCHEDULER_DEFAULT_MAX_CONCURRENCY: int = 2
+    # Batches driven at once when enqueued without waiting (bulk ingestion)
+    BATCH_RUNNERS: int = 4
+
+    # Bulk catalogue ingestion (POST /batches/ingest): garments per batch, and
+    # how many URL downloads and storage uploads run at once
+    INGEST_BATCH_SIZE: int = 100
+    INGEST_MAX_BATCH_SIZE: int = 1000
+    INGEST_FETCH_CONCURRENCY: int = 16
+    INGEST_UPLOAD_CONCURRENCY: int = 16
+
+    # Generated-image exports (GET /tasks/{id}/export/): rows fetched per
+    # round trip of the server-side cursor, and sent per chunk
+    EXPORT_YIELD_PER: int = 1000
+
+    # Download archives of finished batches built at once in the background
+    ARCHIVE_BUILDERS: int = 2
+
+    # Completion webhooks (see app/services/webhooks.py): sender threads, how
+    # often the outbox is polled when nothing wakes the dispatcher, retries
+    # with exponential backoff, and deliveries in flight per endpoint unless
+    # the endpoint sets its own
+    WEBHOOK_SENDERS: int = 8
+    WEBHOOK_POLL_SECONDS: float = 5.0
+    WEBHOOK_TIMEOUT_SECONDS: float = 10.0
+    WEBHOOK_LEASE_SECONDS: float = 60.0
+    WEBHOOK_MAX_ATTEMPTS: int = 8
+    WEBHOOK_BASE_DELAY: float = 10.0
+    WEBHOOK_MAX_DELAY: float = 3600.0
+    WEBHOOK_ENDPOINT_CONCURRENCY: int = 2
+
+    # Admission control on batch creation. Past DEFER_WAIT seconds of estimated
+    # queue wait, users below PRIORITY_FLOOR get a 429; past REJECT_WAIT, everyone
+    # does. DEFAULT_JOB_SECONDS stands in until a combination has been timed
+    ADMISSION_DEFER_WAIT_SECONDS: float = 300.0
+    ADMISSION_REJECT_WAIT_SECONDS: float = 1200.0
+    ADMISSION_PRIORITY_FLOOR: float = 2.0
+    ADMISSION_DEFAULT_JOB_SECONDS: float = 10.0
+
+    # Tracing: "none", "file" (JSON lines), "console" or "otlp"
+    TRACING_EXPORTER: str = "none"
+    TRACING_FILE: str = "traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_SAMPLE_RATIO: float = 0.1
+
+    # Local content-addressed blob store (see app/services/blob_store.py)
+    BLOB_STORE_DIR: str = "blob_store"
 
     class Config:
         env_file = ".env"
         extra = "ignore"
 
+    def require(self, *names: str) -> None:
+        """Fail with a clear message when an integration is used unconfigured."""
+        missing = [name for name in names if not getattr(self, name)]
+        if missing:
+            raise RuntimeError(f"{', '.join(missing)} must be set to use this feature")
+
 settings = Settings()
 
 def get_db():
@@ -33,4 +153,10 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """Request-scoped AsyncSession for ``async def`` handlers."""
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -0,0 +1,38 @@
+"""Strong ETags for batch reads, from each batch's status and version counter.
+
+``Batch.version`` moves whenever the batch or one of its garments,
+generated images or failures changes, so comparing a client's
+``If-None-Match`` only needs ``(id, version, status)`` rows, not the
+object graph.
+"""
+import hashlib
+from typing import Iterable, Optional, Tuple
+
+from fastapi import Response
+
+
+def batch_etag(batch_id: int, version: int, status: str) -> str:
+    return f'"batch-{batch_id}-{version}-{status}"'
+
+
+def batches_etag(rows: Iterable[Tuple[int, int, str]]) -> str:
+    """One tag for a list of batches: a digest of their sorted ``(id, version, status)`` rows."""
+    digest = hashlib.sha256()
+    for batch_id, version, status in sorted(rows):
+        digest.update(f"{batch_id}:{version}:{status};".encode())
+    return f'"batches-{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 9110 weak comparison, which is what ``If-None-Match`` uses."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
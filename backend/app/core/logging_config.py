@@ -0,0 +1,160 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator, Optional
+
+from opentelemetry import trace
+
+from app.core.config import settings
+
+_log_context: contextvars.ContextVar[Dict[str, object]] = contextvars.ContextVar("log_context", default={})
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+
+
+@contextmanager
+def bind_log_context(**fields) -> Iterator[None]:
+    """Attach correlation fields (batch_id, user_id, ...) to every log line in this context."""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copies bound fields and the current trace id onto the record.
+
+    Runs on the queue handler, in the thread that logged, so the context
+    variables are still those of the caller.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            record.trace_id = format(span_context.trace_id, "032x")
+            record.span_id = format(span_context.span_id, "016x")
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records below WARNING, per logger category.
+
+    ``rates`` maps logger name prefixes to a keep ratio; the longest matching
+    prefix wins and unmatched loggers are kept in full.
+    """
+
+    def __init__(self, rates: Dict[str, float], rng: random.Random = None):
+        super().__init__()
+        self.rates = dict(sorted(rates.items(), key=lambda item: -len(item[0])))
+        self._rng = rng or random.Random()
+
+    def rate_for(self, name: str) -> float:
+        for prefix, rate in self.rates.items():
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or self._rng.random() < rate
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """``"app.workers=0.1,app.services.image_generation=0.01"`` -> {prefix: rate}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler that keeps ``extra`` fields and the traceback apart from the message."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields at the top level."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(stream=None) -> None:
+    """Route all logging through a queue so request threads never block on I/O.
+
+    Records are filtered and enriched in the caller, then written by a
+    single listener thread. Safe to call again; the previous listener is
+    stopped and replaced.
+    """
+    global _listener
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    handler = StructuredQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SamplingFilter(parse_sampling(settings.LOG_SAMPLING)))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,104 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Provider calls run for seconds, not milliseconds
+PROVIDER_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+UPLOAD_SECONDS = Histogram(
+    "vestureai_upload_seconds", "Time to store an image", ["target"], buckets=FAST_BUCKETS
+)
+PROVIDER_QUEUE_WAIT_SECONDS = Histogram(
+    "vestureai_provider_queue_wait_seconds",
+    "Time a combination waited in the rate governor before reaching the provider",
+    buckets=PROVIDER_BUCKETS,
+)
+PROVIDER_INFERENCE_SECONDS = Histogram(
+    "vestureai_provider_inference_seconds", "Time the try-on provider took per call",
+    ["provider"], buckets=PROVIDER_BUCKETS,
+)
+DB_WRITE_SECONDS = Histogram(
+    "vestureai_db_write_seconds", "Time to persist a generated image", buckets=FAST_BUCKETS
+)
+TOKENS_CONSUMED = Counter("vestureai_tokens_consumed_total", "Tokens charged for generated images")
+COMBINATIONS = Counter(
+    "vestureai_generation_combinations_total",
+    "Garment × pose combinations by outcome",
+    ["outcome"],
+)
+ADMISSIONS = Counter(
+    "vestureai_batch_admissions_total", "Batch creation requests by admission outcome", ["outcome"]
+)
+DB_READ_ROUTES = Counter(
+    "vestureai_db_read_routes_total", "Read-only requests by database they were routed to", ["target", "reason"]
+)
+INGESTED_IMAGES = Counter(
+    "vestureai_ingest_images_total", "Images received by bulk ingestion, by outcome", ["outcome"]
+)
+ARCHIVE_BUILDS = Counter(
+    "vestureai_batch_archive_builds_total", "Batch download archives built, complete or with outputs missing",
+    ["result"],
+)
+WEBHOOK_DELIVERIES = Counter(
+    "vestureai_webhook_deliveries_total", "Webhook delivery attempts by outcome", ["outcome"]
+)
+PROVIDER_IN_FLIGHT = Gauge(
+    "vestureai_provider_requests_in_flight", "Provider calls currently running", multiprocess_mode="livesum"
+)
+GENERATION_QUEUE_DEPTH = Gauge(
+    "vestureai_generation_queue_depth", "Combinations waiting to be generated", multiprocess_mode="livesum"
+)
+
+
+class PoolCollector:
+    """SQLAlchemy pool stats, read only when scraped."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.pool
+        for name, doc, read in (
+            ("size", "Configured pool size", "size"),
+            ("checked_in", "Idle connections in the pool", "checkedin"),
+            ("checked_out", "Connections currently in use", "checkedout"),
+            ("overflow", "Connections opened beyond the pool size", "overflow"),
+        ):
+            reader = getattr(pool, read, None)
+            if reader is None:
+                continue  # e.g. SQLite's StaticPool has no sizing
+            yield GaugeMetricFamily(f"vestureai_db_pool_{name}", doc, value=reader())
+
+
+_pool_collector = None
+
+
+def register_pool_collector(engine, registry=REGISTRY) -> None:
+    global _pool_collector
+    if _pool_collector is None:
+        _pool_collector = PoolCollector(engine)
+        registry.register(_pool_collector)
+
+
+def metrics_endpoint(request: Request) -> Response:
+    """Prometheus exposition; aggregates worker processes when PROMETHEUS_MULTIPROC_DIR is set."""
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        if _pool_collector is not None:
+            registry.register(_pool_collector)
+    return Response(generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
@@ -0,0 +1,50 @@
+"""Checks for requests made to URLs that users supply.
+
+Catalogue URLs and webhook endpoints come from users, so a request to them
+must not reach the service's own network: loopback, private, link-local
+(cloud metadata) and other non-global addresses are refused. The host is
+resolved here and every address it resolves to must be public; callers
+check again before following a redirect.
+"""
+import ipaddress
+import socket
+from typing import List
+from urllib.parse import urlsplit
+
+# Followed by hand, so each hop is checked
+MAX_REDIRECTS = 5
+
+
+class BlockedURL(ValueError):
+    """The URL is not http(s), or its host is not a public address."""
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def resolve_public(host: str, port: int) -> List[str]:
+    """Addresses ``host`` resolves to, if every one of them is public."""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise BlockedURL(f"{host} does not resolve") from e
+    addresses = [info[4][0] for info in infos]
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise BlockedURL(f"{host} is not a public address")
+    return addresses
+
+
+def check_public_url(url: str) -> None:
+    """Raise ``BlockedURL`` unless ``url`` is http(s) on a public host."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise BlockedURL("expected an http(s) URL")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError as e:
+        raise BlockedURL("invalid port") from e
+    resolve_public(parts.hostname, port)
@@ -0,0 +1,270 @@
+"""Routing read-only endpoints to read replicas.
+
+Handlers that only read take ``get_read_db`` / ``get_async_read_db``
+instead of ``get_db`` / ``get_async_db``. Those hand out a session on a
+replica from DATABASE_REPLICA_URLS, round robin, unless:
+
+* no replica is configured, or every replica is lagging more than
+  REPLICA_MAX_LAG_SECONDS behind (or can't be reached)
+* the caller wrote recently (read-your-writes): a successful mutating
+  request marks its user, in this process, and sets a cookie, for any
+  process, for READ_YOUR_WRITES_SECONDS
+* the request asks for it with ``X-Read-Consistency: primary``
+
+in which case the session is on the primary, as before.
+"""
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import DB_READ_ROUTES
+from app.core.tracing import instrument_engine, tracing_enabled
+from app.database import POOL_OPTIONS, SessionLocal, async_database_url, get_async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+CONSISTENCY_HEADER = "x-read-consistency"
+PRIMARY_UNTIL_COOKIE = "vestureai_primary_until"
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def _postgres_lag(connection) -> float:
+    # Zero when the standby has replayed everything it received, so an idle
+    # primary doesn't look like lag; NULL on a primary, also zero
+    return connection.execute(text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )).scalar() or 0.0
+
+
+# Replication lag in seconds, by dialect. Dialects without one (SQLite)
+# count a reachable replica as current
+LAG_PROBES = {"postgresql": _postgres_lag}
+
+
+class Replica:
+    """One replica: its engines, session factories and last measured lag."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_engine(url, **POOL_OPTIONS)
+        self.sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        if tracing_enabled():
+            instrument_engine(self.engine)
+        self.lag_seconds = 0.0
+        self.checked_at = None
+        self._async_engine = None
+        self._async_sessionmaker = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+
+    def async_sessionmaker(self):
+        """Built on first use, like the primary's async engine."""
+        with self._lock:
+            if self._async_sessionmaker is None:
+                from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+                self._async_engine = create_async_engine(async_database_url(self.url), **POOL_OPTIONS)
+                self._async_sessionmaker = async_sessionmaker(bind=self._async_engine, autoflush=False,
+                                                              expire_on_commit=False)
+                if tracing_enabled():
+                    instrument_engine(self._async_engine.sync_engine)
+            return self._async_sessionmaker
+
+    def measure_lag(self, probe: Optional[Callable]) -> float:
+        try:
+            with self.engine.connect() as connection:
+                self.lag_seconds = float(probe(connection)) if probe else 0.0
+        except Exception:
+            logger.warning("Replica %s unreachable, reading from primary", self.name, exc_info=True)
+            self.lag_seconds = float("inf")
+        self.checked_at = time.monotonic()
+        return self.lag_seconds
+
+    async def dispose(self) -> None:
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+        self.engine.dispose()
+
+
+class ReplicaRouter:
+    """Picks primary or a replica for each read-only request."""
+
+    def __init__(self, urls=(), max_lag_seconds: float = 5.0, lag_check_seconds: float = 2.0,
+                 read_your_writes_seconds: float = 10.0, lag_probe: Optional[Callable] = None):
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_seconds = lag_check_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._lag_probe = lag_probe
+        self._next = itertools.count()
+        self._recent_writes = {}  # user -> monotonic deadline
+        self._lock = threading.Lock()
+
+    def _probe_for(self, replica: Replica) -> Optional[Callable]:
+        if self._lag_probe is not None:
+            return self._lag_probe
+        return LAG_PROBES.get(replica.engine.dialect.name)
+
+    def lag_check_due(self) -> bool:
+        now = time.monotonic()
+        return any(r.checked_at is None or now - r.checked_at >= self.lag_check_seconds for r in self.replicas)
+
+    def check_lag(self) -> None:
+        """Re-measure every replica whose last measurement is stale. Blocking."""
+        now = time.monotonic()
+        for replica in self.replicas:
+            if replica.checked_at is None or now - replica.checked_at >= self.lag_check_seconds:
+                replica.measure_lag(self._probe_for(replica))
+
+    def mark_write(self, user: Optional[str]) -> None:
+        if not user:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[user] = now + self.read_your_writes_seconds
+            if len(self._recent_writes) > 10000:
+                self._recent_writes = {u: t for u, t in self._recent_writes.items() if t > now}
+
+    def _wrote_recently(self, user: Optional[str]) -> bool:
+        if not user:
+            return False
+        with self._lock:
+            deadline = self._recent_writes.get(user)
+        return deadline is not None and deadline > time.monotonic()
+
+    def choose(self, request: Optional[Request]) -> Optional[Replica]:
+        """The replica to read from, or None for the primary. Uses the last measured lag."""
+        if not self.replicas:
+            return None
+        reason = None
+        if request is not None:
+            if request.headers.get(CONSISTENCY_HEADER, "").lower() == "primary":
+                reason = "requested"
+            elif _cookie_deadline(request) > time.time() or self._wrote_recently(_request_user(request)):
+                reason = "read_your_writes"
+        if reason is None:
+            healthy = [r for r in self.replicas if r.lag_seconds <= self.max_lag_seconds]
+            if healthy:
+                DB_READ_ROUTES.labels(target="replica", reason="healthy").inc()
+                return healthy[next(self._next) % len(healthy)]
+            reason = "lag"
+        DB_READ_ROUTES.labels(target="primary", reason=reason).inc()
+        return None
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.dispose()
+
+
+def _cookie_deadline(request: Request) -> float:
+    try:
+        return float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+
+def _request_user(request) -> Optional[str]:
+    """The token's subject, without a DB lookup; None for anonymous or invalid tokens."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_replica_router() -> ReplicaRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            urls = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+            _router = ReplicaRouter(
+                urls,
+                max_lag_seconds=settings.REPLICA_MAX_LAG_SECONDS,
+                lag_check_seconds=settings.REPLICA_LAG_CHECK_SECONDS,
+                read_your_writes_seconds=settings.READ_YOUR_WRITES_SECONDS,
+            )
+        return _router
+
+
+async def shutdown_replicas() -> None:
+    global _router
+    with _router_lock:
+        router, _router = _router, None
+    if router is not None:
+        await router.dispose()
+
+
+def read_session(request: Optional[Request]):
+    """A new session where ``get_read_db`` would read from; the caller closes it.
+
+    For responses that keep reading after the handler returns, such as
+    streamed exports, which outlive the dependency's session.
+    """
+    router = get_replica_router()
+    if router.replicas and router.lag_check_due():
+        router.check_lag()
+    replica = router.choose(request)
+    return replica.sessionmaker() if replica else SessionLocal()
+
+
+def get_read_db(request: Request):
+    """``get_db`` for read-only handlers: a replica session when one is fit to serve."""
+    db = read_session(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    """``get_async_db`` for read-only handlers: a replica session when one is fit to serve."""
+    router = get_replica_router()
+    if router.replicas and router.lag_check_due():
+        await run_in_threadpool(router.check_lag)
+    replica = router.choose(request)
+    factory = replica.async_sessionmaker() if replica else get_async_sessionmaker()
+    async with factory() as db:
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """Sends a user's reads to the primary for a while after they change something."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                router = get_replica_router()
+                if router.replicas:
+                    router.mark_write(_request_user(Request(scope)))
+                    seconds = router.read_your_writes_seconds
+                    cookie = (f"{PRIMARY_UNTIL_COOKIE}={time.time() + seconds:.0f}; "
+                              f"Max-Age={int(seconds)}; Path=/; HttpOnly; SameSite=Lax")
+                    message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
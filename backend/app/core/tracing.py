@@ -0,0 +1,211 @@
+import functools
+import inspect
+import json
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Sequence
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+from app.core.config import settings
+
+tracer = trace.get_tracer("vestureai")
+propagator = TraceContextTextMapPropagator()
+
+_configured = False
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends finished spans to a local file, one compact JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = [json.dumps(json.loads(span.to_json()), separators=(",", ":")) for span in spans]
+        with self._lock, open(self.path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _build_exporter(kind: str) -> Optional[SpanExporter]:
+    if kind == "file":
+        return JsonLinesSpanExporter(settings.TRACING_FILE)
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            raise ImportError(
+                "OTLP export needs opentelemetry-exporter-otlp-proto-http. "
+                "Please install it with: pip install opentelemetry-exporter-otlp-proto-http"
+            )
+        return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    return None
+
+
+def setup_tracing(engine=None, exporter: SpanExporter = None) -> None:
+    """Install the tracer provider once per process.
+
+    With TRACING_EXPORTER "none" no provider is installed and every span is
+    the API's no-op span, so instrumentation costs next to nothing. Root
+    traces are sampled at TRACING_SAMPLE_RATIO; child spans follow their parent.
+    """
+    global _configured
+    if _configured:
+        return
+    exporter = exporter or _build_exporter(settings.TRACING_EXPORTER)
+    if exporter is None:
+        return
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "vestureai"}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    if engine is not None:
+        instrument_engine(engine)
+    _configured = True
+
+
+def tracing_enabled() -> bool:
+    return _configured
+
+
+def shutdown_tracing() -> None:
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+@contextmanager
+def span(name: str, kind: SpanKind = SpanKind.INTERNAL, **attributes) -> Iterator[trace.Span]:
+    """Child span of whatever is current; exceptions mark it as errored."""
+    with tracer.start_as_current_span(name, kind=kind, attributes=attributes) as current:
+        yield current
+
+
+def traced(name: str, kind: SpanKind = SpanKind.CLIENT):
+    """Decorator form of ``span`` for plain and async functions."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name, kind=kind):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name, kind=kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_trace_context() -> Dict[str, str]:
+    """W3C trace headers for handing the current trace to a background job."""
+    carrier: Dict[str, str] = {}
+    propagator.inject(carrier)
+    return carrier
+
+
+@contextmanager
+def attach_trace_context(carrier: Optional[Dict[str, str]]) -> Iterator[None]:
+    """Continue a trace started elsewhere (e.g. the request that queued a job)."""
+    if not carrier:
+        yield
+        return
+    token = otel_context.attach(propagator.extract(carrier))
+    try:
+        yield
+    finally:
+        otel_context.detach(token)
+
+
+def instrument_engine(engine) -> None:
+    """A client span per SQL statement, only inside an already sampled trace."""
+    from sqlalchemy import event
+
+    if getattr(engine, "_tracing_instrumented", False):
+        return
+    engine._tracing_instrumented = True
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if not trace.get_current_span().is_recording():
+            return
+        context._tracing_span = tracer.start_span(
+            statement.split(None, 1)[0].upper() if statement else "SQL",
+            kind=SpanKind.CLIENT,
+            attributes={"db.system": conn.dialect.name, "db.statement": statement[:500]},
+        )
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        current = getattr(context, "_tracing_span", None)
+        if current is not None:
+            current.end()
+            context._tracing_span = None
+
+    def on_error(exception_context):
+        current = getattr(exception_context.execution_context, "_tracing_span", None)
+        if current is not None:
+            current.set_status(Status(StatusCode.ERROR, str(exception_context.original_exception)))
+            current.end()
+            exception_context.execution_context._tracing_span = None
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+    event.listen(engine, "handle_error", on_error)
+
+
+class TracingMiddleware:
+    """Server span per HTTP request, continuing an incoming ``traceparent``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        parent = propagator.extract(headers)
+        method = scope["method"]
+        with tracer.start_as_current_span(
+            f"{method} {scope['path']}", context=parent, kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"]},
+        ) as server_span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    server_span.set_attribute("http.response.status_code", status)
+                    if status >= 500:
+                        server_span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # Name by route template so /batches/1 and /batches/2 group together
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    server_span.update_name(f"{method} {route.path}")
+                    server_span.set_attribute("http.route", route.path)
@@ -2,15 +2,14 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 import os
+import threading
 from dotenv import load_dotenv
 
 
 # Load environment variables from .env file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
 
-# Create engine with connection pooling and best practices
-engine = create_engine(
-    os.getenv("DATABASE_URL"),
+POOL_OPTIONS = dict(
     pool_size=10,  # Initial number of connections in the pool
     max_overflow=10,  # Maximum number of connections beyond pool_size
     pool_timeout=30,  # Timeout in seconds for getting a connection from the pool
@@ -19,8 +18,62 @@ engine = create_engine(
     echo=False,  # Set to True for SQL query logging, False in production
 )
 
+# Create engine with connection pooling and best practices
+engine = create_engine(os.getenv("DATABASE_URL"), **POOL_OPTIONS)
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Base class for all ORM models
 Base = declarative_base()
+
+# Async drivers for the request path, keyed by the sync URL's scheme
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+_async_engine = None
+_async_sessionmaker = None
+_async_lock = threading.Lock()
+
+
+def async_database_url(url: str) -> str:
+    """The same database as ``url``, through its async driver."""
+    scheme, sep, rest = url.partition("://")
+    if scheme not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {scheme}")
+    return f"{ASYNC_DRIVERS[scheme]}{sep}{rest}"
+
+
+def get_async_engine():
+    """Async engine over DATABASE_URL, built on first use so workers never load the driver."""
+    global _async_engine
+    with _async_lock:
+        if _async_engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            _async_engine = create_async_engine(async_database_url(os.getenv("DATABASE_URL")), **POOL_OPTIONS)
+        return _async_engine
+
+
+def get_async_sessionmaker():
+    """Factory for request-scoped AsyncSessions.
+
+    Objects are not expired on commit: on an AsyncSession reloading them
+    would be implicit I/O, which has to be awaited explicitly instead.
+    """
+    global _async_sessionmaker
+    engine = get_async_engine()
+    with _async_lock:
+        if _async_sessionmaker is None:
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+            _async_sessionmaker = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+        return _async_sessionmaker
+
+
+async def dispose_async_engine() -> None:
+    """Close the async engine's pooled connections, if it was ever built."""
+    if _async_engine is not None:
+        await _async_engine.dispose()
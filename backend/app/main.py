@@ -4,7 +4,20 @@ from fastapi.staticfiles import StaticFiles
 from starlette.responses import Response
 from starlette.requests import Request
 
-from app.api import auth, plans, subscriptions, models, tasks, batches, payments,token
+from starlette_exporter import PrometheusMiddleware
+
+from app.core.logging_config import setup_logging, shutdown_logging
+from app.core.metrics import metrics_endpoint, register_pool_collector
+from app.core.tracing import TracingMiddleware, instrument_engine, setup_tracing, shutdown_tracing, tracing_enabled
+from app.core.replicas import ReadYourWritesMiddleware, shutdown_replicas
+from app.database import dispose_async_engine, engine, get_async_engine
+from app.services.preprocessing import shutdown_preprocess_pool
+from app.services.scheduler import shutdown_scheduler
+from app.services.archives import shutdown_archive_builders
+from app.services.webhooks import get_webhook_dispatcher, shutdown_webhook_dispatcher
+from app.workers.callbacks import shutdown_callback_sweeper, start_callback_sweeper
+from app.workers.image_tasks import recover_queued_batches, shutdown_batch_runners
+from app.api import auth, plans, subscriptions, models, tasks, batches, payments,token, blobs, uploads, webhooks, callbacks
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -22,11 +35,8 @@ app = FastAPI()
 import logging
 from fastapi import FastAPI
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,  # INFO, DEBUG, ERROR, etc.
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+# Structured logging through a background queue; level and sampling from settings
+setup_logging()
 
 logger = logging.getLogger("vestureai")
 # Global CORS for API routes
@@ -38,9 +48,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files with CORS headers
-app.mount("/uploaded_garments", CORSAwareStaticFiles(directory="uploaded_garments"), name="uploaded_garments")
-app.mount("/uploaded_images", CORSAwareStaticFiles(directory="uploaded_images"), name="uploaded_images")
+# Request counts, latencies and in-flight requests, grouped by route template
+app.add_middleware(PrometheusMiddleware, app_name="vestureai", prefix="vestureai_http",
+                   group_paths=True, skip_paths=["/metrics"])
+register_pool_collector(engine)
+app.add_route("/metrics", metrics_endpoint)
+
+# Marks users whose reads should stay on the primary after they change something
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Outermost, so the server span covers every other middleware
+setup_tracing(engine)
+app.add_middleware(TracingMiddleware)
+
+# Legacy upload directories, kept read-only for rows stored before the blob store
+app.mount("/uploaded_garments", CORSAwareStaticFiles(directory="uploaded_garments", check_dir=False), name="uploaded_garments")
+app.mount("/uploaded_images", CORSAwareStaticFiles(directory="uploaded_images", check_dir=False), name="uploaded_images")
 
 # Include API routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -51,6 +74,45 @@ app.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
 app.include_router(batches.router, prefix="/batches", tags=["batches"])
 app.include_router(payments.router, prefix="/api/payments", tags=["payments"])
 app.include_router(token.router, prefix="/api/tokens", tags=["tokens"])
+app.include_router(blobs.router, prefix="/blobs", tags=["blobs"])
+app.include_router(uploads.router, prefix="/uploads", tags=["uploads"])
+app.include_router(webhooks.router, prefix="/webhooks", tags=["webhooks"])
+app.include_router(callbacks.router, prefix="/callbacks", tags=["callbacks"])
+
+
+@app.on_event("startup")
+def instrument_async_engine():
+    # The async engine is built on first use, so it gets its SQL spans here
+    if tracing_enabled():
+        instrument_engine(get_async_engine().sync_engine)
+
+
+@app.on_event("startup")
+def start_background_workers():
+    # Picks up deliveries left in the outbox by an earlier run
+    get_webhook_dispatcher()
+    # Fails callback-mode generations whose provider never called back
+    start_callback_sweeper()
+    # The batch runner queue is in memory; pick up what the last run left queued
+    recover_queued_batches()
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await dispose_async_engine()
+    await shutdown_replicas()
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    shutdown_preprocess_pool()
+    shutdown_batch_runners()
+    shutdown_archive_builders()
+    shutdown_webhook_dispatcher()
+    shutdown_callback_sweeper()
+    shutdown_scheduler()
+    shutdown_tracing()
+    shutdown_logging()
 
 
 @app.get("/")
@@ -6,6 +6,10 @@ from .subscription import Subscription
 from .model import Model
 from .model_image import ModelImage
 from .task import Task
-from .batch import Batch,GarmentImage
+from .batch import Batch, BatchArchive, BatchModel, GarmentImage
 from .generated_image import GeneratedImage
-from .transaction import Transaction
\ No newline at end of file
+from .transaction import Transaction
+from .upload_session import UploadSession
+from .generation_failure import GenerationFailure
+from .webhook import WebhookEndpoint, WebhookDelivery
+from .pending_generation import PendingGeneration
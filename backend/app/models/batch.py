@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, ForeignKey, event, select, update
+from sqlalchemy.orm import Session, relationship
+from sqlalchemy.sql import func
 from app.database import Base
 
 class Batch(Base):
@@ -7,12 +8,44 @@ class Batch(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, ForeignKey('tasks.id'))
-    status = Column(String, default='queued')  # queued, processing, done, failed
+    status = Column(String, default='queued')  # queued, processing, done, failed, cancelling, cancelled
     created_at = Column(String)  # You may want to use DateTime instead
+    duplicate_garments = Column(Integer, default=0)  # garments collapsed by perceptual hash
+    tokens_saved = Column(Integer, default=0)
+    failed_combinations = Column(Integer, default=0)  # garment × pose pairs that could not be generated
+    tokens_reserved = Column(Integer, default=0)  # charged up front when the batch was created
+    tokens_refunded = Column(Integer, default=0)  # returned for work that failed or never ran
+    # Bumped whenever the batch or anything under it changes; see bump_batch_versions
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
 
     task = relationship("Task", back_populates="batches")
     garment_images = relationship("GarmentImage", back_populates="batch")
+    failures = relationship("GenerationFailure", back_populates="batch")
+    # Set for matrix jobs, which try the garments on several models instead of the task's
+    matrix_models = relationship("BatchModel", back_populates="batch", cascade="all, delete-orphan")
+
+
+class BatchModel(Base):
+    __tablename__ = 'batch_models'
+
+    batch_id = Column(Integer, ForeignKey('batches.id'), primary_key=True)
+    model_id = Column(Integer, ForeignKey('models.id'), primary_key=True)
+    tokens_reserved = Column(Integer, default=0)  # this model's share of the batch's reservation
+
+    batch = relationship("Batch", back_populates="matrix_models")
+    model = relationship("Model")
+
+
+class BatchArchive(Base):
+    """The download ZIP last built for a batch, kept in the blob store."""
+    __tablename__ = 'batch_archives'
+
+    batch_id = Column(Integer, ForeignKey('batches.id'), primary_key=True)
+    outputs_digest = Column(String(64), nullable=False)  # of the output URLs it was built from
+    url = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
 class GarmentImage(Base):
@@ -20,7 +53,46 @@ class GarmentImage(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     batch_id = Column(Integer, ForeignKey('batches.id'), nullable=False)
-    image_url = Column(String, nullable=False)
+    image_url = Column(String, nullable=False)  # normalized image sent to the provider
+    source_url = Column(String, nullable=True)  # original upload, when it was normalized later
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    phash = Column(String(16), index=True, nullable=True)  # perceptual hash of the normalized image
+    duplicate_of_id = Column(Integer, ForeignKey('garment_images.id'), nullable=True)
 
     batch = relationship("Batch", back_populates="garment_images")
-    generated_images = relationship("GeneratedImage", back_populates="garment_image")
\ No newline at end of file
+    duplicate_of = relationship("GarmentImage", remote_side=[id])
+    generated_images = relationship("GeneratedImage", back_populates="garment_image")
+
+
+@event.listens_for(Session, "after_flush")
+def bump_batch_versions(session, flush_context):
+    """Advance ``Batch.version`` for every batch changed in this flush, directly or through its children.
+
+    Bulk ``query(Batch).update()`` calls bypass the ORM and bump the
+    version themselves.
+    """
+    from app.models.generated_image import GeneratedImage
+    from app.models.generation_failure import GenerationFailure
+
+    batch_ids, garment_ids = set(), set()
+    for obj in (*session.dirty, *session.deleted, *session.new):
+        if isinstance(obj, Batch):
+            if obj not in session.new:
+                batch_ids.add(obj.id)
+        elif isinstance(obj, (GarmentImage, GenerationFailure)):
+            batch_ids.add(obj.batch_id)
+        elif isinstance(obj, GeneratedImage):
+            garment_ids.add(obj.garment_image_id)
+    batch_ids.discard(None)
+    garment_ids.discard(None)
+
+    connection = session.connection()
+    if batch_ids:
+        connection.execute(update(Batch).where(Batch.id.in_(batch_ids)).values(version=Batch.version + 1))
+    if garment_ids:
+        connection.execute(
+            update(Batch)
+            .where(Batch.id.in_(select(GarmentImage.batch_id).where(GarmentImage.id.in_(garment_ids))))
+            .values(version=Batch.version + 1)
+        )
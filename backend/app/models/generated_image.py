@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 from app.database import Base
 
 class GeneratedImage(Base):
@@ -10,6 +11,8 @@ class GeneratedImage(Base):
     model_id = Column(Integer, ForeignKey('models.id'), nullable=False)
     output_url = Column(String, nullable=False)
     pose_label = Column(String, nullable=False)
+    attempts = Column(Integer, default=1)  # provider calls it took, including retries
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     garment_image = relationship("GarmentImage", back_populates="generated_images")
     model = relationship("Model", back_populates="images")
\ No newline at end of file
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.database import Base
+
+class GenerationFailure(Base):
+    __tablename__ = 'generation_failures'
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey('batches.id'), index=True, nullable=False)
+    garment_image_id = Column(Integer, ForeignKey('garment_images.id'), nullable=False)
+    model_id = Column(Integer, ForeignKey('models.id'), nullable=True)
+    pose_label = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=1)
+    error_kind = Column(String, nullable=False)  # transient, permanent, circuit_open
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    batch = relationship("Batch", back_populates="failures")
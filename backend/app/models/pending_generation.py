@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class PendingGeneration(Base):
+    """A combination submitted to a provider that calls back with the result."""
+    __tablename__ = "pending_generations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey("batches.id"), index=True, nullable=False)
+    garment_image_id = Column(Integer, ForeignKey("garment_images.id"), nullable=False)
+    model_id = Column(Integer, ForeignKey("models.id"), nullable=True)
+    pose_label = Column(String, nullable=False)
+
+    provider = Column(String, nullable=False)
+    request_id = Column(String, unique=True, index=True, nullable=True)  # set once the provider accepts it
+    token = Column(String, nullable=False)  # in the callback URL, so only the provider can complete it
+    status = Column(String, index=True, nullable=False, default="submitting")  # submitting, submitted, completed, failed, cancelled
+    attempts = Column(Integer, nullable=False, default=0)  # submissions it took
+    error = Column(String, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    submitted_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+
+    # Where the client uploads the bytes to
+    object_key = Column(String, unique=True, nullable=False)
+    filename = Column(String, nullable=True)
+    content_type = Column(String, nullable=False)
+    purpose = Column(String, nullable=False)  # garment, model
+
+    status = Column(String, index=True, nullable=False, default="pending")  # pending, completed
+    size_bytes = Column(Integer, nullable=True)
+    url = Column(String, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    user = relationship("User")
@@ -0,0 +1,42 @@
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class WebhookEndpoint(Base):
+    __tablename__ = "webhook_endpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    task_id = Column(Integer, ForeignKey("tasks.id"), index=True, nullable=True)  # None: every task of the user
+    url = Column(String, nullable=False)
+    secret = Column(String, nullable=False)  # HMAC key for the signature header
+    events = Column(JSON, nullable=False)  # e.g. ["batch.completed", "batch.failed"]
+    max_concurrency = Column(Integer, nullable=True)  # deliveries in flight at once; None: the default
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    deliveries = relationship("WebhookDelivery", back_populates="endpoint", cascade="all, delete-orphan")
+
+
+class WebhookDelivery(Base):
+    """One event for one endpoint: the outbox row the dispatcher works through."""
+    __tablename__ = "webhook_deliveries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    endpoint_id = Column(Integer, ForeignKey("webhook_endpoints.id"), index=True, nullable=False)
+    event = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+
+    status = Column(String, index=True, nullable=False, default="pending")  # pending, sending, delivered, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # When it's next due; while sending, when the claim lapses if the sender died
+    next_attempt_at = Column(DateTime(timezone=True), index=True, nullable=False, server_default=func.now())
+    response_status = Column(Integer, nullable=True)
+    last_error = Column(String, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+
+    endpoint = relationship("WebhookEndpoint", back_populates="deliveries")
@@ -7,4 +7,6 @@ from .model import ModelResponse
 from .model_image import ModelImageResponse
 from .task import TaskCreate, TaskResponse,TaskRespons
 from .batch import BatchCreate, BatchResponse
-from .generated_image import GeneratedImageResponse
\ No newline at end of file
+from .generated_image import GeneratedImageResponse
+from .upload import UploadSessionCreate, UploadSessionTicket, UploadSessionResponse
+from .webhook import WebhookEndpointCreate, WebhookEndpointResponse, WebhookEndpointCreated, WebhookDeliveryResponse
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class BatchCreate(BaseModel):
@@ -10,6 +10,11 @@ class Batch(BaseModel):
     task_id: int
     status: str
     created_at: datetime
+    duplicate_garments: Optional[int] = 0
+    tokens_saved: Optional[int] = 0
+    failed_combinations: Optional[int] = 0
+    tokens_reserved: Optional[int] = 0
+    tokens_refunded: Optional[int] = 0
 
     class Config:
         orm_mode = True
@@ -25,6 +30,16 @@ class BatchOutput(BaseModel):
     class Config:
         orm_mode = True
 
+class BatchModelCost(BaseModel):
+    model_id: int
+    poses: int
+    tokens_reserved: int
+
 class BatchResponse(Batch):
+    # Admission estimate and per-model cost, only set on the response to batch creation
+    queue_wait_seconds: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    models: Optional[List[BatchModelCost]] = None
+
     class Config:
         from_attributes = True  # <-- for Pydantic v2+
\ No newline at end of file
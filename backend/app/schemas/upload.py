@@ -0,0 +1,29 @@
+from pydantic import BaseModel
+from typing import Dict, Optional
+from datetime import datetime
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: str
+    purpose: str = "garment"  # garment, model
+    method: str = "put"  # put, post
+
+class UploadSessionTicket(BaseModel):
+    id: int
+    object_key: str
+    method: str
+    url: str
+    fields: Dict[str, str] = {}
+    expires_in: int
+
+class UploadSessionResponse(BaseModel):
+    id: int
+    object_key: str
+    purpose: str
+    status: str
+    size_bytes: Optional[int] = None
+    url: Optional[str] = None
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,38 @@
+from pydantic import BaseModel, HttpUrl
+from typing import List, Optional
+from datetime import datetime
+
+class WebhookEndpointCreate(BaseModel):
+    url: HttpUrl
+    task_id: Optional[int] = None  # only this task's batches; all of the user's when omitted
+    events: List[str] = ["batch.completed", "batch.failed"]
+    max_concurrency: Optional[int] = None
+
+class WebhookEndpointResponse(BaseModel):
+    id: int
+    url: str
+    task_id: Optional[int] = None
+    events: List[str]
+    max_concurrency: Optional[int] = None
+    active: bool
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class WebhookEndpointCreated(WebhookEndpointResponse):
+    secret: str  # shown once, for verifying signatures
+
+class WebhookDeliveryResponse(BaseModel):
+    id: int
+    event: str
+    status: str
+    attempts: int
+    response_status: Optional[int] = None
+    last_error: Optional[str] = None
+    next_attempt_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    delivered_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,55 @@
+import math
+from dataclasses import dataclass
+
+from app.core.config import settings
+from app.core.metrics import ADMISSIONS
+from app.services.scheduler import FairScheduler, TenantPolicy
+
+
+@dataclass
+class AdmissionDecision:
+    """Whether a new batch may start, and when it should be done if so."""
+
+    admitted: bool
+    queue_wait_seconds: float
+    eta_seconds: float
+    retry_after: int = 0
+
+
+def estimate_queue_wait(scheduler: FairScheduler, waiting: int = 0) -> float:
+    """Seconds until the work already queued has drained through the pool.
+
+    ``waiting`` counts combinations of batches still waiting for a batch
+    runner; the scheduler only sees them once a runner picks the batch up.
+    """
+    job_seconds = scheduler.job_seconds() or settings.ADMISSION_DEFAULT_JOB_SECONDS
+    queued = sum(scheduler.queue_depths().values()) + waiting
+    return queued * job_seconds / max(scheduler.workers, 1)
+
+
+def check_admission(scheduler: FairScheduler, policy: TenantPolicy, combinations: int,
+                    waiting: int = 0) -> AdmissionDecision:
+    """Admit, defer or reject a batch of ``combinations`` from the current backlog.
+
+    The estimate is deliberately pessimistic: fair queuing usually serves a
+    newcomer ahead of the bulk of the queue, but a deep queue still means
+    the pool is saturated and new work only adds to everyone's wait. The
+    batch's own run time is bounded by its concurrency cap.
+    """
+    job_seconds = scheduler.job_seconds() or settings.ADMISSION_DEFAULT_JOB_SECONDS
+    wait = estimate_queue_wait(scheduler, waiting)
+    parallel = max(1, min(policy.max_concurrency, scheduler.workers))
+    eta = wait + math.ceil(combinations / parallel) * job_seconds
+
+    if wait >= settings.ADMISSION_REJECT_WAIT_SECONDS:
+        threshold, outcome = settings.ADMISSION_REJECT_WAIT_SECONDS, "rejected"
+    elif wait >= settings.ADMISSION_DEFER_WAIT_SECONDS and policy.priority < settings.ADMISSION_PRIORITY_FLOOR:
+        threshold, outcome = settings.ADMISSION_DEFER_WAIT_SECONDS, "deferred"
+    else:
+        ADMISSIONS.labels("admitted").inc()
+        return AdmissionDecision(True, round(wait, 1), round(eta, 1))
+
+    ADMISSIONS.labels(outcome).inc()
+    # Come back once the backlog should have drained below the threshold
+    retry_after = max(1, math.ceil(wait - threshold))
+    return AdmissionDecision(False, round(wait, 1), round(eta, 1), retry_after)
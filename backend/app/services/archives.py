@@ -0,0 +1,162 @@
+"""Download archives of finished batches, built once and kept in the blob store.
+
+A batch's archive is keyed by a digest of its output URLs: it is built in
+the background when the batch finishes, or on the first download, and
+rebuilt only once the outputs change. Builds of the same batch coalesce,
+so simultaneous first downloads wait on one build. Archives missing an
+output that couldn't be fetched are served but not kept, so the next
+download tries again.
+
+Images are stored in the ZIP as they are; they're compressed already.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import ARCHIVE_BUILDS
+from app.core.tracing import span
+from app.database import SessionLocal
+from app.models import BatchArchive, GarmentImage, GeneratedImage
+from app.services.blob_store import blob_name, blob_path_for_url, blob_store, blob_url
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpeg", ".jpg", ".webp")
+
+
+def batch_outputs(db: Session, batch_id: int) -> List[str]:
+    """Output URLs of a batch, in the order they're numbered in the archive."""
+    return list(db.scalars(
+        select(GeneratedImage.output_url)
+        .join(GeneratedImage.garment_image)
+        .where(GarmentImage.batch_id == batch_id, GeneratedImage.output_url.isnot(None))
+        .order_by(GeneratedImage.id)
+    ))
+
+
+def outputs_digest(urls: List[str]) -> str:
+    return hashlib.sha256("\n".join(urls).encode()).hexdigest()
+
+
+def stored_archive(db: Session, batch_id: int, digest: str) -> Optional[str]:
+    """Local path of the batch's kept archive, if it was built from these outputs."""
+    archive = db.get(BatchArchive, batch_id)
+    if archive is None or archive.outputs_digest != digest:
+        return None
+    return blob_path_for_url(archive.url)
+
+
+def _entry_name(index: int, url: str) -> str:
+    path = url.split("?")[0].lower()
+    ext = next((candidate for candidate in IMAGE_EXTENSIONS if path.endswith(candidate)), ".jpg")
+    return f"image_{index}{ext}"
+
+
+def _write_archive(urls: List[str], target) -> bool:
+    """Write the outputs into a ZIP on ``target``; False when some couldn't be fetched."""
+    import requests
+
+    complete = True
+    with zipfile.ZipFile(target, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for index, url in enumerate(urls, start=1):
+            name = _entry_name(index, url)
+            local_path = blob_path_for_url(url)
+            if local_path is not None:
+                # Stored in the local blob store, no HTTP round trip
+                zf.write(local_path, name)
+                continue
+            try:
+                response = requests.get(url, timeout=20)
+                response.raise_for_status()
+            except Exception:
+                logger.warning("Archive output unavailable", extra={"url": url}, exc_info=True)
+                complete = False
+                continue
+            zf.writestr(name, response.content)
+    return complete
+
+
+def build_archive(batch_id: int) -> str:
+    """Build (or find) the batch's archive for its current outputs; returns its local path."""
+    db = SessionLocal()
+    try:
+        urls = batch_outputs(db, batch_id)
+        digest = outputs_digest(urls)
+        path = stored_archive(db, batch_id, digest)
+        if path is not None:
+            return path
+
+        os.makedirs(blob_store.tmp_dir, exist_ok=True)
+        with span("build_zip", batch_id=batch_id, images=len(urls)):
+            with tempfile.TemporaryFile(dir=blob_store.tmp_dir) as tmp:
+                complete = _write_archive(urls, tmp)
+                size = tmp.tell()
+                tmp.seek(0)
+                blob_digest = blob_store.put(tmp)
+        ARCHIVE_BUILDS.labels("complete" if complete else "partial").inc()
+
+        if complete:
+            archive = db.get(BatchArchive, batch_id) or BatchArchive(batch_id=batch_id)
+            archive.outputs_digest = digest
+            archive.url = blob_url(blob_name(blob_digest, "archive.zip"))
+            archive.size = size
+            db.add(archive)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another process recorded the same batch first
+                db.rollback()
+        return blob_store.path_for(blob_digest)
+    finally:
+        db.close()
+
+
+_builders: Optional[ThreadPoolExecutor] = None
+_builds: Dict[int, Future] = {}
+_builds_lock = threading.Lock()
+
+
+def _build_finished(batch_id: int, future: Future) -> None:
+    with _builds_lock:
+        if _builds.get(batch_id) is future:
+            del _builds[batch_id]
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Archive build failed", extra={"batch_id": batch_id}, exc_info=future.exception())
+
+
+def ensure_archive(batch_id: int) -> Future:
+    """Build the batch's archive in the background, or join the build already running.
+
+    The future resolves to the archive's local path.
+    """
+    global _builders
+    with _builds_lock:
+        future = _builds.get(batch_id)
+        if future is not None:
+            return future
+        if _builders is None:
+            _builders = ThreadPoolExecutor(settings.ARCHIVE_BUILDERS, thread_name_prefix="archive-builder")
+        future = _builders.submit(build_archive, batch_id)
+        _builds[batch_id] = future
+    # Outside the lock: runs right away if the build has already finished
+    future.add_done_callback(lambda done: _build_finished(batch_id, done))
+    return future
+
+
+def shutdown_archive_builders() -> None:
+    global _builders
+    with _builds_lock:
+        if _builders is not None:
+            _builders.shutdown(wait=False, cancel_futures=True)
+            _builders = None
+        _builds.clear()
@@ -0,0 +1,103 @@
+import hashlib
+import io
+import mimetypes
+import os
+import re
+import tempfile
+from typing import BinaryIO, Optional
+
+from fastapi import UploadFile
+
+from app.core.config import settings
+
+CHUNK_SIZE = 1024 * 1024
+BLOB_NAME_RE = re.compile(r"^(?P<digest>[0-9a-f]{64})(?P<ext>\.[A-Za-z0-9]{1,8})?$")
+
+
+class BlobStore:
+    """Content-addressed blob store on the local filesystem.
+
+    Blobs are keyed by the SHA-256 of their bytes and sharded two levels deep
+    (``ab/cd/abcd...``), so identical uploads are stored once and no single
+    directory grows unbounded.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.isfile(self.path_for(digest))
+
+    def put(self, fileobj: BinaryIO) -> str:
+        """Stream ``fileobj`` into the store and return its hex digest."""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+            digest = hasher.hexdigest()
+            final_path = self.path_for(digest)
+            if os.path.exists(final_path):
+                # Already stored: keep the existing copy
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+            return digest
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put_bytes(self, data: bytes) -> str:
+        return self.put(io.BytesIO(data))
+
+
+def blob_name(digest: str, filename: Optional[str] = None) -> str:
+    """Public blob name; the extension only drives the served media type."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,8}", ext):
+        ext = ""
+    return f"{digest}{ext}"
+
+
+def blob_url(name: str) -> str:
+    return f"blobs/{name}"
+
+
+def parse_blob_name(name: str) -> Optional[tuple]:
+    match = BLOB_NAME_RE.match(name)
+    if not match:
+        return None
+    ext = match.group("ext") or ""
+    media_type = mimetypes.guess_type(f"blob{ext}")[0] or "application/octet-stream"
+    return match.group("digest"), media_type
+
+
+def blob_path_for_url(url: str) -> Optional[str]:
+    """Local file behind a relative blob URL, or None for anything else."""
+    if not url or not url.startswith("blobs/"):
+        return None
+    parsed = parse_blob_name(url[len("blobs/"):])
+    if parsed is None or not blob_store.exists(parsed[0]):
+        return None
+    return blob_store.path_for(parsed[0])
+
+
+def save_upload(file: UploadFile) -> str:
+    """Store an uploaded file and return the relative URL it is served from."""
+    digest = blob_store.put(file.file)
+    return blob_url(blob_name(digest, file.filename))
+
+
+blob_store = BlobStore(settings.BLOB_STORE_DIR)
@@ -0,0 +1,112 @@
+from typing import Iterable, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Batch, GarmentImage, GeneratedImage, ModelImage, Task
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def find_near_duplicate(phash: Optional[str], candidates: Iterable[GarmentImage],
+                        max_distance: int = None) -> Optional[GarmentImage]:
+    """First candidate whose perceptual hash is within ``max_distance`` bits."""
+    if not phash:
+        return None
+    if max_distance is None:
+        max_distance = settings.GARMENT_DEDUPE_MAX_DISTANCE
+    for candidate in candidates:
+        if candidate.phash and hamming_distance(phash, candidate.phash) <= max_distance:
+            return candidate
+    return None
+
+
+def find_previous_garment(db: Session, user_id: int, model_id: Optional[int],
+                          phash: Optional[str]) -> Optional[GarmentImage]:
+    """A garment from an earlier batch of this user with an output for every pose of ``model_id``.
+
+    Garments whose batch partly failed or was cancelled are skipped, so reuse
+    never hands out a short set of poses. Uses the indexed ``phash`` column,
+    so only exact hash matches are found across batches; near-duplicates are
+    collapsed within a batch.
+    """
+    if not phash:
+        return None
+    poses = (
+        select(func.count(func.distinct(ModelImage.pose_label)))
+        .where(ModelImage.model_id == model_id)
+        .scalar_subquery()
+    )
+    generated_poses = (
+        select(func.count(func.distinct(GeneratedImage.pose_label)))
+        .where(GeneratedImage.garment_image_id == GarmentImage.id, GeneratedImage.model_id == model_id)
+        .correlate(GarmentImage)
+        .scalar_subquery()
+    )
+    return (
+        db.query(GarmentImage)
+        .join(Batch, GarmentImage.batch_id == Batch.id)
+        .join(Task, Batch.task_id == Task.id)
+        .filter(
+            GarmentImage.phash == phash,
+            GarmentImage.duplicate_of_id.is_(None),
+            Task.user_id == user_id,
+            GarmentImage.generated_images.any(GeneratedImage.model_id == model_id),
+            generated_poses >= poses,
+        )
+        .order_by(GarmentImage.id.desc())
+        .first()
+    )
+
+
+def copy_outputs(db: Session, source: GarmentImage, target: GarmentImage,
+                 model_id: Optional[int] = None) -> List[GeneratedImage]:
+    """Point ``target`` at the images already generated for ``source``.
+
+    With ``model_id`` only that model's outputs are copied; a garment from a
+    matrix batch also carries the other models' images.
+    """
+    copies = []
+    for generated in source.generated_images:
+        if model_id is not None and generated.model_id != model_id:
+            continue
+        copy = GeneratedImage(
+            garment_image_id=target.id,
+            model_id=generated.model_id,
+            output_url=generated.output_url,
+            pose_label=generated.pose_label,
+        )
+        db.add(copy)
+        copies.append(copy)
+    return copies
+
+
+def mark_batch_duplicates(db: Session, garment_images: List[GarmentImage]) -> int:
+    """Collapse near-duplicate garments inside one batch onto their first copy."""
+    marked = 0
+    originals: List[GarmentImage] = []
+    for garment in garment_images:
+        if garment.duplicate_of_id is not None:
+            continue
+        original = find_near_duplicate(garment.phash, originals)
+        if original is None:
+            originals.append(garment)
+        else:
+            garment.duplicate_of_id = original.id
+            marked += 1
+    if marked:
+        db.commit()
+    return marked
+
+
+def fill_batch_duplicates(db: Session, garment_images: List[GarmentImage]) -> None:
+    """After generation, give in-batch duplicates the outputs of their original."""
+    by_id = {garment.id: garment for garment in garment_images}
+    for garment in garment_images:
+        original = by_id.get(garment.duplicate_of_id)
+        if original is not None and not garment.generated_images:
+            copy_outputs(db, original, garment)
+    db.commit()
@@ -0,0 +1,76 @@
+"""Manifests of generated images, for merchants' PIM imports.
+
+Rows come off a server-side cursor (``yield_per``), EXPORT_YIELD_PER at a
+time, and each such partition is encoded and sent as one chunk, so an
+export of any size holds one partition in memory and its first bytes go
+out before the query has finished.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Batch, GarmentImage, GeneratedImage, Task
+
+COLUMNS = (
+    "task_id", "batch_id", "garment_image_id", "garment_url", "garment_source_url",
+    "generated_image_id", "model_id", "pose_label", "output_url", "created_at", "batch_created_at",
+)
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def export_query(user_id: int, task_id: Optional[int] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None):
+    """The user's generated images, one row per output, oldest first."""
+    query = (
+        select(
+            Task.id, Batch.id, GarmentImage.id, GarmentImage.image_url, GarmentImage.source_url,
+            GeneratedImage.id, GeneratedImage.model_id, GeneratedImage.pose_label, GeneratedImage.output_url,
+            GeneratedImage.created_at, Batch.created_at,
+        )
+        .join(GeneratedImage.garment_image)
+        .join(GarmentImage.batch)
+        .join(Batch.task)
+        .where(Task.user_id == user_id)
+        .order_by(GeneratedImage.id)
+    )
+    if task_id is not None:
+        query = query.where(Task.id == task_id)
+    if since is not None:
+        query = query.where(GeneratedImage.created_at >= since)
+    if until is not None:
+        query = query.where(GeneratedImage.created_at < until)
+    return query
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_chunk(rows) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerows([("" if value is None else _value(value)) for value in row] for row in rows)
+    return out.getvalue()
+
+
+def _jsonl_chunk(rows) -> str:
+    return "".join(json.dumps(dict(zip(COLUMNS, map(_value, row)))) + "\n" for row in rows)
+
+
+def stream_export(db: Session, query, fmt: str, yield_per: Optional[int] = None) -> Iterator[bytes]:
+    """Encode ``query``'s rows as CSV or JSON lines, a cursor partition per chunk. Closes ``db`` when done."""
+    encode = _csv_chunk if fmt == "csv" else _jsonl_chunk
+    try:
+        if fmt == "csv":
+            yield _csv_chunk([COLUMNS]).encode()
+        result = db.execute(query.execution_options(yield_per=yield_per or settings.EXPORT_YIELD_PER))
+        for rows in result.partitions():
+            yield encode(rows).encode()
+    finally:
+        db.close()
@@ -1,22 +1,399 @@
-from typing import List
+import hashlib
+import io
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
 from fastapi import UploadFile
+
+from app.core.config import settings
 from app.models.batch import Batch
-from app.models.generated_image import GeneratedImage
 from app.services.storage import upload_file_to_storage
-# from app.workers.image_tasks import generate_images_task
 
-def generate_images(garment_image_url: str, model_id: int) -> dict:
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+TRYON_APPLICATION = "easel-ai/fashion-tryon"
+
+
+class TryOnResult:
+    """Outcome of one garment × model image try-on."""
+
+    def __init__(self, image_url: str, request_id: Optional[str] = None, raw: Optional[dict] = None):
+        self.image_url = image_url
+        self.request_id = request_id
+        self.raw = raw or {}
+
+
+class GenerationCancelled(Exception):
+    """The batch was cancelled while this combination was waiting or in flight."""
+
+
+def _raise_if_cancelled(cancel_event: Optional[threading.Event]) -> None:
+    if cancel_event is not None and cancel_event.is_set():
+        raise GenerationCancelled("Batch cancelled")
+
+
+class TryOnProvider:
+    """Interface every try-on backend implements.
+
+    ``generate`` blocks until the image is ready and raises on failure, with
+    HTTP errors surfacing as exceptions that carry a ``response`` so the rate
+    governor and retry policy can classify them. Once ``cancel_event`` is set
+    it raises GenerationCancelled as soon as the backend allows.
+
+    Backends with ``supports_callbacks`` can also ``submit``: queue the
+    request and return its id at once, the result arriving later as a POST
+    to ``webhook_url`` in fal's webhook format (see ``parse_callback``).
+    """
+
+    name = "base"
+    supports_callbacks = False
+
+    def generate(self, model_image_url: str, garment_image_url: str,
+                 cancel_event: threading.Event = None) -> TryOnResult:
+        raise NotImplementedError
+
+    def submit(self, model_image_url: str, garment_image_url: str, webhook_url: str) -> str:
+        """Queue a try-on whose result is POSTed to ``webhook_url``; returns the request id."""
+        raise NotImplementedError
+
+    def cancel(self, request_id: str) -> bool:
+        """Abort an in-flight request; False when the backend can't."""
+        return False
+
+
+def _clean_url(url: str) -> str:
+    return url.strip().replace('`', '')
+
+
+def _extract_image_url(result: dict) -> str:
+    if 'image' not in result or 'url' not in result['image']:
+        raise ValueError(f"Provider returned no image: {result}")
+    return _clean_url(result['image']['url'])
+
+
+def parse_callback(body: dict) -> Tuple[Optional[str], Optional[TryOnResult], Optional[str]]:
+    """``(request_id, result, error)`` from a fal webhook body; exactly one of result and error is set.
+
+    fal sends ``{"request_id", "status": "OK" | "ERROR", "payload", "error"}``.
+    """
+    request_id = body.get("request_id")
+    payload = body.get("payload") or {}
+    if body.get("status") == "OK":
+        try:
+            return request_id, TryOnResult(_extract_image_url(payload), request_id=request_id, raw=payload), None
+        except ValueError as e:
+            return request_id, None, str(e)
+    detail = payload.get("detail") if isinstance(payload, dict) else None
+    return request_id, None, str(body.get("error") or detail or "Provider reported an error")
+
+
+class FalProvider(TryOnProvider):
+    """fal.ai with long polling through ``fal_client.subscribe``."""
+
+    name = "fal"
+
+    def __init__(self, application: str = TRYON_APPLICATION):
+        self.application = application
+        self._client = None
+
+    @property
+    def client(self):
+        # Configured on first use rather than at import time
+        if self._client is None:
+            try:
+                import fal_client
+            except ImportError:
+                raise ImportError("fal package is not installed. Please install it with: pip install fal")
+            if not settings.FAL_KEY:
+                raise ValueError("FAL_KEY environment variable is not set")
+            os.environ["FAL_KEY"] = settings.FAL_KEY
+            self._client = fal_client
+        return self._client
+
+    def _on_queue_update(self, update):
+        if isinstance(update, self.client.InProgress):
+            for log in update.logs or []:
+                logger.debug("Provider log: %s", log["message"], extra={"provider": self.name})
+
+    def generate(self, model_image_url: str, garment_image_url: str,
+                 cancel_event: threading.Event = None) -> TryOnResult:
+        # subscribe() can't be interrupted, so cancellation only stops it starting
+        _raise_if_cancelled(cancel_event)
+        result = self.client.subscribe(
+            self.application,
+            arguments={
+                "full_body_image": _clean_url(model_image_url),
+                "clothing_image": _clean_url(garment_image_url),
+            },
+            with_logs=True,
+            on_queue_update=self._on_queue_update,
+        )
+        return TryOnResult(_extract_image_url(result), raw=result)
+
+
+class FalQueueProvider(FalProvider):
+    """fal.ai queue API: submit, then poll status until the result is ready."""
+
+    name = "fal_queue"
+
+    def __init__(self, application: str = TRYON_APPLICATION, poll_interval: float = 5.0,
+                 timeout: float = 60.0):
+        super().__init__(application)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def generate(self, model_image_url: str, garment_image_url: str,
+                 cancel_event: threading.Event = None) -> TryOnResult:
+        _raise_if_cancelled(cancel_event)
+        handle = self.client.submit(
+            self.application,
+            arguments={
+                "full_body_image": _clean_url(model_image_url),
+                "clothing_image": _clean_url(garment_image_url),
+                "gender": "female",  # Default to female, can be made configurable
+            },
+        )
+        deadline = time.monotonic() + self.timeout
+        while True:
+            status = handle.status()
+            if isinstance(status, self.client.Completed):
+                result = handle.get()
+                return TryOnResult(_extract_image_url(result), request_id=handle.request_id, raw=result)
+            if cancel_event is not None and cancel_event.is_set():
+                # Free the provider's queue slot rather than paying for an unwanted image
+                self.cancel(handle.request_id)
+                raise GenerationCancelled(f"Request {handle.request_id} cancelled")
+            if time.monotonic() >= deadline:
+                self.cancel(handle.request_id)
+                raise TimeoutError(f"Timed out waiting for request {handle.request_id}")
+            if cancel_event is not None:
+                cancel_event.wait(self.poll_interval)
+            else:
+                time.sleep(self.poll_interval)
+
+    def cancel(self, request_id: str) -> bool:
+        try:
+            self.client.cancel(self.application, request_id)
+            return True
+        except Exception:
+            return False
+
+
+class FalWebhookProvider(FalQueueProvider):
+    """fal.ai queue API with a webhook: submitted, then left to call back.
+
+    No worker thread waits on inference; ``generate`` still polls, for
+    callers that need the image in hand.
     """
-    Simulate AI image generation for each pose of the model.
-    Returns a dict: {pose_label: output_url}
+
+    name = "fal_webhook"
+    supports_callbacks = True
+
+    def submit(self, model_image_url: str, garment_image_url: str, webhook_url: str) -> str:
+        handle = self.client.submit(
+            self.application,
+            arguments={
+                "full_body_image": _clean_url(model_image_url),
+                "clothing_image": _clean_url(garment_image_url),
+                "gender": "female",
+            },
+            webhook_url=webhook_url,
+        )
+        return handle.request_id
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Latency distribution from a spec such as ``lognormal:1.5:0.4``.
+
+    Supported: ``fixed:<s>``, ``uniform:<low>:<high>``,
+    ``exponential:<mean>`` and ``lognormal:<median>:<sigma>``.
     """
-    # TODO: Replace with actual AI image generation logic
-    # For now, return dummy URLs for demonstration
-    poses = ["front", "side", "back"]
-    return {
-        pose: f"https://your-bucket.s3.amazonaws.com/generated/{model_id}_{pose}.jpg"
-        for pose in poses
-    }
+    kind, *args = spec.split(":")
+    values = [float(arg) for arg in args]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    if kind == "lognormal":
+        import math
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) if values[0] > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeTryOnProvider(TryOnProvider):
+    """Deterministic local stand-in for load tests; no network involved.
+
+    Latency and failures are drawn from an RNG seeded by the inputs and the
+    number of times that pair was requested, so a run replays identically
+    regardless of thread interleaving while retries can still succeed.
+    Outputs are small synthetic PNGs written to the local blob store.
+
+    With ``callbacks`` it stands in for fal's webhook mode too: ``submit``
+    returns at once and, after the drawn latency, POSTs the result to the
+    webhook URL from a timer thread, retrying a few times like fal does.
+    """
+
+    name = "fake"
+    CALLBACK_ATTEMPTS = 3
+
+    def __init__(self, latency: Callable[[random.Random], float] = None, failure_rate: float = 0.0,
+                 throttle_rate: float = 0.0, seed: int = 0, sleep: Callable[[float], None] = time.sleep,
+                 callbacks: bool = False, deliver: Callable[[str, dict], int] = None):
+        self.latency = latency or (lambda rng: 0.0)
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+        self._sleep = sleep
+        self._calls = Counter()
+        self._lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.supports_callbacks = callbacks
+        self._deliver = deliver or self._post
+        self._timers: Dict[str, threading.Timer] = {}
+        if callbacks:
+            # Pending generations record the provider they were submitted to by name
+            self.name = "fake_webhook"
+
+    @classmethod
+    def from_settings(cls, callbacks: bool = False) -> "FakeTryOnProvider":
+        return cls(
+            latency=parse_latency(settings.FAKE_TRYON_LATENCY),
+            failure_rate=settings.FAKE_TRYON_FAILURE_RATE,
+            throttle_rate=settings.FAKE_TRYON_THROTTLE_RATE,
+            seed=settings.FAKE_TRYON_SEED,
+            callbacks=callbacks,
+        )
+
+    def _rng(self, model_image_url: str, garment_image_url: str) -> random.Random:
+        with self._lock:
+            key = (model_image_url, garment_image_url)
+            self._calls[key] += 1
+            call = self._calls[key]
+        return random.Random(f"{self.seed}|{model_image_url}|{garment_image_url}|{call}")
+
+    def _error(self, status: int, headers: dict = None) -> "httpx.HTTPStatusError":
+        import httpx
+
+        request = httpx.Request("POST", f"https://fake.local/{TRYON_APPLICATION}")
+        response = httpx.Response(status, headers=headers, request=request)
+        return httpx.HTTPStatusError(f"Fake provider returned {status}", request=request, response=response)
+
+    def generate(self, model_image_url: str, garment_image_url: str,
+                 cancel_event: threading.Event = None) -> TryOnResult:
+        _raise_if_cancelled(cancel_event)
+        rng = self._rng(model_image_url, garment_image_url)
+        latency = max(0.0, self.latency(rng))
+        roll = rng.random()
+        self._sleep(latency)
+        _raise_if_cancelled(cancel_event)
+        with self._lock:
+            self.latencies.append(latency)
+        if roll < self.throttle_rate:
+            raise self._error(429, {"Retry-After": "1"})
+        if roll < self.throttle_rate + self.failure_rate:
+            raise self._error(503)
+        return self._render(model_image_url, garment_image_url)
+
+    def _render(self, model_image_url: str, garment_image_url: str) -> TryOnResult:
+        from PIL import Image, ImageDraw
+
+        from app.services.blob_store import blob_name, blob_store, blob_url
+        digest = hashlib.sha256(f"{model_image_url}|{garment_image_url}".encode()).digest()
+        image = Image.new("RGB", (192, 256), tuple(digest[:3]))
+        ImageDraw.Draw(image).rectangle([48, 64, 144, 208], fill=tuple(digest[3:6]))
+        out = io.BytesIO()
+        image.save(out, format="PNG")
+        url = blob_url(blob_name(blob_store.put_bytes(out.getvalue()), "tryon.png"))
+        return TryOnResult(url, request_id=f"fake-{digest.hex()[:16]}")
+
+    def submit(self, model_image_url: str, garment_image_url: str, webhook_url: str) -> str:
+        if not self.supports_callbacks:
+            raise NotImplementedError("Fake provider built without callbacks")
+        rng = self._rng(model_image_url, garment_image_url)
+        latency = max(0.0, self.latency(rng))
+        roll = rng.random()
+        # Like fal's queue, throttling is refused at submission; failures come back in the callback
+        if roll < self.throttle_rate:
+            raise self._error(429, {"Retry-After": "1"})
+        request_id = f"fake-{rng.getrandbits(64):016x}"
+
+        def fire():
+            with self._lock:
+                self._timers.pop(request_id, None)
+                self.latencies.append(latency)
+            if roll < self.throttle_rate + self.failure_rate:
+                body = {"request_id": request_id, "status": "ERROR", "error": "Fake provider returned 503",
+                        "payload": {"detail": "Fake inference failed"}}
+            else:
+                result = self._render(model_image_url, garment_image_url)
+                body = {"request_id": request_id, "status": "OK",
+                        "payload": {"image": {"url": result.image_url}}}
+            for attempt in range(1, self.CALLBACK_ATTEMPTS + 1):
+                try:
+                    if 200 <= self._deliver(webhook_url, body) < 300:
+                        return
+                except Exception:
+                    logger.warning("Fake provider callback failed", extra={"request_id": request_id},
+                                   exc_info=True)
+                self._sleep(0.5 * attempt)
+            logger.error("Fake provider gave up calling back", extra={"request_id": request_id})
+
+        timer = threading.Timer(latency, fire)
+        timer.daemon = True
+        with self._lock:
+            self._timers[request_id] = timer
+        timer.start()
+        return request_id
+
+    def cancel(self, request_id: str) -> bool:
+        """Drop a callback that hasn't fired yet."""
+        with self._lock:
+            timer = self._timers.pop(request_id, None)
+        if timer is None:
+            return False
+        timer.cancel()
+        return True
+
+    @staticmethod
+    def _post(url: str, body: dict) -> int:
+        import httpx
+
+        return httpx.post(url, json=body, timeout=10).status_code
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_tryon_provider(name: str = None) -> TryOnProvider:
+    """Shared provider instance for ``name`` (defaults to TRYON_PROVIDER)."""
+    name = name or settings.TRYON_PROVIDER
+    with _providers_lock:
+        if name not in _providers:
+            if name == "fal":
+                _providers[name] = FalProvider()
+            elif name == "fal_queue":
+                _providers[name] = FalQueueProvider()
+            elif name == "fal_webhook":
+                _providers[name] = FalWebhookProvider()
+            elif name == "fake":
+                _providers[name] = FakeTryOnProvider.from_settings()
+            elif name == "fake_webhook":
+                _providers[name] = FakeTryOnProvider.from_settings(callbacks=True)
+            else:
+                raise ValueError(f"Unknown try-on provider: {name}")
+        return _providers[name]
+
 
 async def process_batch(batch: Batch, garment_image: UploadFile, poses: List[str]) -> str:
     # Upload the garment image to storage
@@ -26,4 +403,4 @@ async def process_batch(batch: Batch, garment_image: UploadFile, poses: List[str
     batch.garment_image_url = garment_image_url
     batch.status = "processing"
     # Do NOT trigger Celery here to avoid circular import
-    return garment_image_url
\ No newline at end of file
+    return garment_image_url
@@ -0,0 +1,532 @@
+"""Bulk catalogue ingestion: garments streamed in, batches of a fixed size out.
+
+Input is either a ZIP archive, read entry by entry from the request body
+as it arrives (local file headers only, the central directory at the end
+is never needed), or JSON lines of image URLs downloaded concurrently.
+Images then flow through three overlapping stages:
+
+* normalize, in the preprocessing process pool
+* dedupe against the batch being filled and earlier batches, then upload
+  distinct garments, INGEST_UPLOAD_CONCURRENCY at a time
+* once a batch is full and its uploads are done, reserve its tokens,
+  commit it and hand it to the background batch runners
+
+so storage uploads keep going while earlier batches are committed and
+later images are still being read.
+"""
+import asyncio
+import json
+import logging
+import struct
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import INGESTED_IMAGES
+from app.core.outbound import MAX_REDIRECTS, BlockedURL, check_public_url
+from app.core.tracing import current_trace_context, span
+from app.models import Batch, GarmentImage, Task
+from app.services.admission import check_admission
+from app.services.dedupe import copy_outputs, find_near_duplicate, find_previous_garment
+from app.services.preprocessing import normalize_garment_async, upload_normalized_garment
+from app.services.scheduler import get_scheduler, get_tenant_policy
+from app.services.token import TokenService
+from app.workers.image_tasks import enqueue_generation, queued_combinations
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+MAX_FAILURES_REPORTED = 50
+
+LOCAL_FILE_HEADER = 0x04034B50
+CENTRAL_DIRECTORY_HEADER = 0x02014B50
+END_OF_CENTRAL_DIRECTORY = 0x06054B50
+DATA_DESCRIPTOR = 0x08074B50
+_LOCAL_HEADER = struct.Struct("<HHHHHIIIHH")
+_INFLATE_STEP = 1024 * 1024
+_MAX_LINE_BYTES = 64 * 1024
+
+
+class IngestError(Exception):
+    """The request body can't be read as the declared format."""
+
+
+@dataclass
+class IngestItem:
+    """One image out of the source, or why it couldn't be read."""
+
+    name: str
+    data: Optional[bytes] = None
+    error: Optional[str] = None
+
+
+class _ByteStream:
+    """Exact-size reads over an async iterator of arbitrarily sized chunks."""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+
+    async def _fill(self) -> bool:
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return False
+        self._buffer += chunk
+        return True
+
+    async def read_exactly(self, n: int) -> bytes:
+        while len(self._buffer) < n:
+            if not await self._fill():
+                raise IngestError("ZIP archive is truncated")
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    async def read_some(self) -> bytes:
+        """Whatever is buffered, or the next chunk; empty only at the end."""
+        while not self._buffer:
+            if not await self._fill():
+                return b""
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    async def skip(self, n: int) -> None:
+        while n > 0:
+            data = await self.read_exactly(min(n, _INFLATE_STEP))
+            n -= len(data)
+
+    def unread(self, data: bytes) -> None:
+        self._buffer[:0] = data
+
+    async def at_end(self) -> bool:
+        return not self._buffer and not await self._fill()
+
+
+def _zip64_sizes(extra: bytes, compressed: int, uncompressed: int):
+    """Sizes from a ZIP64 extra field, if there is one."""
+    offset = 0
+    while offset + 4 <= len(extra):
+        tag, size = struct.unpack_from("<HH", extra, offset)
+        if tag == 0x0001:
+            values = extra[offset + 4:offset + 4 + size]
+            if uncompressed == 0xFFFFFFFF and len(values) >= 8:
+                uncompressed, values = struct.unpack_from("<Q", values)[0], values[8:]
+            if compressed == 0xFFFFFFFF and len(values) >= 8:
+                compressed = struct.unpack_from("<Q", values)[0]
+            return True, compressed, uncompressed
+        offset += 4 + size
+    return False, compressed, uncompressed
+
+
+async def _read_until_descriptor(stream: _ByteStream, name: str, max_bytes: int, zip64: bool):
+    """A stored entry whose size only follows it, in the data descriptor.
+
+    The descriptor signature can occur inside the data, so a match counts
+    only when the size and CRC after it describe everything before it.
+    """
+    size_bytes = 8 if zip64 else 4
+    data = bytearray()
+    search_from = 0
+    while True:
+        at = data.find(DATA_DESCRIPTOR.to_bytes(4, "little"), search_from)
+        if at != -1 and len(data) >= at + 8 + 2 * size_bytes:
+            crc = int.from_bytes(data[at + 4:at + 8], "little")
+            size = int.from_bytes(data[at + 8:at + 8 + size_bytes], "little")
+            if size == at and zlib.crc32(data[:at]) == crc:
+                stream.unread(bytes(data[at + 8 + 2 * size_bytes:]))
+                return bytes(data[:at]), crc
+            search_from = at + 1
+            continue
+        if at == -1:
+            search_from = max(len(data) - 3, 0)
+            if len(data) > max_bytes:
+                raise IngestError(f"{name}: larger than {max_bytes} bytes")
+        chunk = await stream.read_some()
+        if not chunk:
+            raise IngestError("ZIP archive is truncated")
+        data += chunk
+
+
+async def iter_zip_entries(chunks: AsyncIterator[bytes], max_entry_bytes: int) -> AsyncIterator[IngestItem]:
+    """Files of a ZIP archive in order, without buffering more than one entry.
+
+    Entries may defer their sizes to a data descriptor, as streaming ZIP
+    writers do.
+    """
+    stream = _ByteStream(chunks)
+    if await stream.at_end():
+        raise IngestError("Request body is empty")
+    while True:
+        if await stream.at_end():
+            return
+        signature = int.from_bytes(await stream.read_exactly(4), "little")
+        if signature in (CENTRAL_DIRECTORY_HEADER, END_OF_CENTRAL_DIRECTORY):
+            return  # the index of what we've already read
+        if signature != LOCAL_FILE_HEADER:
+            raise IngestError("Not a ZIP archive")
+
+        _, flags, method, _, _, crc, compressed, uncompressed, name_length, extra_length = \
+            _LOCAL_HEADER.unpack(await stream.read_exactly(_LOCAL_HEADER.size))
+        name = (await stream.read_exactly(name_length)).decode("utf-8" if flags & 0x800 else "cp437")
+        zip64, compressed, uncompressed = _zip64_sizes(await stream.read_exactly(extra_length),
+                                                       compressed, uncompressed)
+        if flags & 0x1:
+            raise IngestError(f"{name}: encrypted entries are not supported")
+        has_descriptor = bool(flags & 0x8)
+
+        data = bytearray()
+        size = 0
+        if method == 0 and has_descriptor and compressed == 0:
+            data, crc = await _read_until_descriptor(stream, name, max_entry_bytes, zip64)
+            size = len(data)
+            has_descriptor = False
+        elif method == 0:
+            if compressed > max_entry_bytes:
+                await stream.skip(compressed)
+                size = compressed
+            else:
+                data += await stream.read_exactly(compressed)
+                size = len(data)
+        elif method == 8:
+            inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+            pending = b""
+            while not inflater.eof:
+                if not pending:
+                    pending = await stream.read_some()
+                    if not pending:
+                        raise IngestError("ZIP archive is truncated")
+                try:
+                    piece = inflater.decompress(pending, _INFLATE_STEP)
+                except zlib.error as e:
+                    raise IngestError(f"{name}: {e}")
+                pending = inflater.unconsumed_tail
+                size += len(piece)
+                # Keep inflating past the limit to find the next entry, but stop keeping it
+                if size <= max_entry_bytes:
+                    data += piece
+            stream.unread(inflater.unused_data + pending)
+        else:
+            raise IngestError(f"{name}: compression method {method} is not supported")
+
+        if has_descriptor:
+            head = await stream.read_exactly(4)
+            if int.from_bytes(head, "little") == DATA_DESCRIPTOR:
+                head = await stream.read_exactly(4)
+            crc = int.from_bytes(head, "little")
+            await stream.read_exactly(16 if zip64 else 8)
+
+        if name.endswith("/"):
+            continue
+        if size > max_entry_bytes:
+            yield IngestItem(name, error=f"larger than {max_entry_bytes} bytes")
+        elif zlib.crc32(data) != crc:
+            yield IngestItem(name, error="CRC mismatch, entry is corrupt")
+        else:
+            yield IngestItem(name, data=bytes(data))
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > _MAX_LINE_BYTES:
+            raise IngestError("Line too long")
+    if buffer:
+        yield buffer
+
+
+def _url_from_line(line: bytes) -> str:
+    value = json.loads(line)
+    if isinstance(value, dict):
+        value = value.get("url")
+    if not isinstance(value, str) or not value.startswith(("http://", "https://")):
+        raise ValueError("expected an http(s) URL or an object with one under \"url\"")
+    return value
+
+
+async def _fetch(client, url: str, max_bytes: int) -> IngestItem:
+    target = url
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            # Checked on every hop: a public host may redirect inwards
+            await run_in_threadpool(check_public_url, target)
+            async with client.stream("GET", target) as response:
+                if response.is_redirect:
+                    target = str(response.url.join(response.headers["location"]))
+                    continue
+                if response.status_code >= 400:
+                    return IngestItem(url, error=f"download failed: HTTP {response.status_code}")
+                data = bytearray()
+                async for chunk in response.aiter_bytes():
+                    data += chunk
+                    if len(data) > max_bytes:
+                        return IngestItem(url, error=f"larger than {max_bytes} bytes")
+            return IngestItem(url, data=bytes(data))
+        return IngestItem(url, error="download failed: too many redirects")
+    except BlockedURL as e:
+        logger.info("Refused catalogue URL %s: %s", target, e)
+        return IngestItem(url, error="download failed: not a public URL")
+    except Exception as e:
+        # The underlying error can describe hosts the user shouldn't learn about
+        logger.info("Catalogue download of %s failed: %r", target, e)
+        return IngestItem(url, error="download failed")
+
+
+async def iter_url_items(chunks: AsyncIterator[bytes], max_entry_bytes: int,
+                         concurrency: int, client=None) -> AsyncIterator[IngestItem]:
+    """Images behind a JSON-lines list of URLs, downloaded ``concurrency`` at a time.
+
+    Each line is a URL string or an object with a ``url``. Items come back
+    in completion order.
+    """
+    import httpx
+
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(timeout=30)
+    in_flight = set()
+    try:
+        async for line in _iter_lines(chunks):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                url = _url_from_line(line)
+            except ValueError as e:
+                yield IngestItem(line[:200].decode("utf-8", "replace"), error=str(e))
+                continue
+            while len(in_flight) >= concurrency:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            in_flight.add(asyncio.create_task(_fetch(client, url, max_entry_bytes)))
+        while in_flight:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        if owns_client:
+            await client.aclose()
+
+
+@dataclass
+class _Chunk:
+    """Garments for the next batch, and the uploads they are waiting on."""
+
+    garments: List[GarmentImage] = field(default_factory=list)
+    originals: List[GarmentImage] = field(default_factory=list)
+    reused: list = field(default_factory=list)
+    uploads: list = field(default_factory=list)
+
+
+class CatalogueIngest:
+    """Splits a stream of garment images for one task into batches of ``batch_size``."""
+
+    def __init__(self, db: AsyncSession, user_id: int, task: Task, batch_size: int):
+        self.db = db
+        self.user_id = user_id
+        # Plain ids: a rollback after a failed reservation expires ORM objects
+        self.task_id = task.id
+        self.model_id = task.model_id
+        self.batch_size = batch_size
+        self.poses = len(task.model.model_images)
+        self.batches = []
+        self.counts = {"received": 0, "batched": 0, "duplicates": 0, "failed": 0, "skipped": 0}
+        self.failures = []
+        self.stopped = None
+        self._db_lock = asyncio.Lock()
+        self._upload_slots = asyncio.Semaphore(settings.INGEST_UPLOAD_CONCURRENCY)
+        self._persisting = []
+        self._source_error = None
+
+    def _fail(self, name: str, error: str) -> None:
+        self.counts["failed"] += 1
+        INGESTED_IMAGES.labels("failed").inc()
+        if len(self.failures) < MAX_FAILURES_REPORTED:
+            self.failures.append({"name": name, "error": error})
+
+    def _stop(self, reason: str, detail: str, retry_after: int = 0) -> None:
+        if self.stopped is None:
+            self.stopped = {"reason": reason, "detail": detail, "retry_after": retry_after}
+
+    async def run(self, items: AsyncIterator[IngestItem]) -> dict:
+        self.policy = await self.db.run_sync(get_tenant_policy, self.user_id)
+        normalized = asyncio.Queue(maxsize=settings.PREPROCESS_WORKERS * 4)
+        reader = asyncio.create_task(self._normalize_all(items, normalized))
+        try:
+            await self._assemble(normalized)
+        finally:
+            reader.cancel()
+            await asyncio.gather(*self._persisting, return_exceptions=True)
+        # Whatever was read before the source broke off is still batched
+        if isinstance(self._source_error, IngestError):
+            self._stop("invalid_input", str(self._source_error))
+        elif self._source_error is not None:
+            raise self._source_error
+        return self.summary()
+
+    async def _normalize_all(self, items: AsyncIterator[IngestItem], out: asyncio.Queue) -> None:
+        slots = asyncio.Semaphore(settings.PREPROCESS_WORKERS * 2)
+        running = set()
+
+        async def normalize(item: IngestItem):
+            try:
+                await out.put((item, await normalize_garment_async(item.data)))
+            except Exception as e:
+                await out.put((item, e))
+            finally:
+                slots.release()
+
+        try:
+            async for item in items:
+                if self.stopped:
+                    break
+                self.counts["received"] += 1
+                if item.error is None and not item.name.lower().endswith(IMAGE_EXTENSIONS) \
+                        and not item.name.startswith(("http://", "https://")):
+                    self.counts["skipped"] += 1
+                    INGESTED_IMAGES.labels("skipped").inc()
+                    continue
+                if item.error is not None:
+                    await out.put((item, None))
+                    continue
+                await slots.acquire()
+                task = asyncio.create_task(normalize(item))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            await asyncio.gather(*running)
+        except Exception as e:
+            for task in running:
+                task.cancel()
+            self._source_error = e
+        await out.put(None)
+
+    async def _assemble(self, normalized: asyncio.Queue) -> None:
+        chunk = _Chunk()
+        while (entry := await normalized.get()) is not None:
+            item, result = entry
+            if self.stopped:
+                continue
+            if item.error is not None:
+                self._fail(item.name, item.error)
+                continue
+            if isinstance(result, Exception):
+                self._fail(item.name, f"not a readable image: {result}")
+                continue
+            await self._add(chunk, item, result)
+            if len(chunk.garments) >= self.batch_size:
+                self._persisting.append(asyncio.create_task(self._persist(chunk)))
+                chunk = _Chunk()
+        if chunk.garments and not self.stopped:
+            self._persisting.append(asyncio.create_task(self._persist(chunk)))
+
+    async def _add(self, chunk: _Chunk, item: IngestItem, normalized: dict) -> None:
+        garment = GarmentImage(width=normalized["width"], height=normalized["height"], phash=normalized["phash"])
+        garment.source_url = item.name if item.name.startswith(("http://", "https://")) else None
+        chunk.garments.append(garment)
+
+        original = find_near_duplicate(normalized["phash"], chunk.originals)
+        if original is not None:
+            garment.duplicate_of = original
+            return
+        async with self._db_lock:
+            previous = await self.db.run_sync(find_previous_garment, self.user_id, self.model_id,
+                                              normalized["phash"])
+        if previous is not None:
+            garment.image_url = previous.image_url
+            garment.duplicate_of_id = previous.id
+            chunk.reused.append((garment, previous))
+            return
+        chunk.originals.append(garment)
+        chunk.uploads.append(asyncio.create_task(self._upload(garment, item.name, normalized)))
+
+    async def _upload(self, garment: GarmentImage, name: str, normalized: dict) -> bool:
+        async with self._upload_slots:
+            if self.stopped:
+                return False
+            try:
+                garment.image_url = await run_in_threadpool(upload_normalized_garment, normalized)
+                return True
+            except Exception as e:
+                logger.warning("Could not upload ingested garment %s: %s", name, e)
+                self._fail(name, f"upload failed: {e}")
+                return False
+
+    async def _persist(self, chunk: _Chunk) -> None:
+        uploaded = await asyncio.gather(*chunk.uploads)
+        failed = {id(g) for g, ok in zip(chunk.originals, uploaded) if not ok}
+        # Copies of a garment that didn't upload go with it
+        garments = [g for g in chunk.garments
+                    if id(g) not in failed and id(g.duplicate_of) not in failed]
+        originals = [g for g in chunk.originals if id(g) not in failed]
+        if not garments:
+            return
+
+        async with self._db_lock:
+            if self.stopped:
+                return
+            with span("ingest.persist_batch", garments=len(garments)):
+                await self._commit_batch(garments, originals, chunk.reused)
+
+    async def _commit_batch(self, garments, originals, reused) -> None:
+        required_tokens = len(originals) * self.poses
+        admission = check_admission(get_scheduler(), self.policy, required_tokens, queued_combinations())
+        if not admission.admitted:
+            self._stop("queue_busy", f"Generation queue is busy (about {int(admission.queue_wait_seconds)}s "
+                                     "of backlog). Please retry later.", admission.retry_after)
+            return
+        if not await self.db.run_sync(
+                lambda session: TokenService(session).reserve_tokens(self.user_id, required_tokens)):
+            await self.db.rollback()
+            self._stop("insufficient_tokens", f"Insufficient tokens. Required: {required_tokens}")
+            return
+
+        batch = Batch(task_id=self.task_id, status="queued", created_at=datetime.utcnow().isoformat(),
+                      tokens_reserved=required_tokens)
+        for garment in garments:
+            if garment.duplicate_of is not None:
+                garment.image_url = garment.duplicate_of.image_url
+            batch.garment_images.append(garment)
+        duplicates = len(garments) - len(originals)
+        batch.duplicate_garments = duplicates
+        batch.tokens_saved = duplicates * self.poses
+        self.db.add(batch)
+        await self.db.flush()
+        reused_here = [(g, previous) for g, previous in reused if g in garments]
+        for garment, previous in reused_here:
+            await self.db.run_sync(copy_outputs, previous, garment, self.model_id)
+        await self.db.commit()
+
+        enqueue_generation(batch.id, self.user_id, trace_context=current_trace_context(),
+                           combinations=required_tokens)
+        self.counts["batched"] += len(garments)
+        self.counts["duplicates"] += duplicates
+        INGESTED_IMAGES.labels("uploaded").inc(len(originals))
+        INGESTED_IMAGES.labels("duplicate").inc(duplicates)
+        self.batches.append({
+            "batch_id": batch.id,
+            "garments": len(garments),
+            "duplicate_garments": duplicates,
+            "tokens_reserved": required_tokens,
+        })
+
+    def summary(self) -> dict:
+        return {
+            "task_id": self.task_id,
+            "batches": self.batches,
+            "images": self.counts,
+            "failures": self.failures,
+            "stopped": self.stopped,
+        }
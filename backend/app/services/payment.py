@@ -1,11 +1,14 @@
 import os
 import json
 from datetime import datetime, timedelta
-from typing import Any, Dict, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Tuple
 
-import requests
+from app.core.tracing import SpanKind, span
 from app.models.transaction import Transaction
 
+if TYPE_CHECKING:
+    import requests
+
 
 class PaymentService:
     """Encapsulates PayPal Orders v2 operations: create, capture/webhook, status."""
@@ -30,6 +33,15 @@ class PaymentService:
         self.orders_url: str = f"{self.base_url}/v2/checkout/orders"
         self.oauth_token_url: str = f"{self.base_url}/v1/oauth2/token"
 
+    def _request(self, method: str, url: str, **kwargs) -> "requests.Response":
+        """Call PayPal inside a client span."""
+        import requests
+
+        with span(f"paypal {method}", kind=SpanKind.CLIENT, **{"http.request.method": method, "url.full": url}) as current:
+            response = requests.request(method, url, **kwargs)
+            current.set_attribute("http.response.status_code", response.status_code)
+            return response
+
     def _get_access_token(self) -> str:
         """Fetch and cache PayPal OAuth access token using client credentials."""
         if self._access_token and self._token_expiry_utc and datetime.utcnow() < self._token_expiry_utc:
@@ -38,7 +50,7 @@ class PaymentService:
         auth = (self.client_id, self.client_secret)
         data = {"grant_type": "client_credentials"}
         headers = {"Accept": "application/json", "Accept-Language": "en_US"}
-        response = requests.post(self.oauth_token_url, data=data, headers=headers, auth=auth)
+        response = self._request("POST", self.oauth_token_url, data=data, headers=headers, auth=auth)
 
         try:
             token_data = response.json()
@@ -98,7 +110,7 @@ class PaymentService:
         }
 
         headers = self._paypal_headers()
-        response = requests.post(self.orders_url, json=payload, headers=headers)
+        response = self._request("POST", self.orders_url, json=payload, headers=headers)
 
         try:
             response_data = response.json()
@@ -302,7 +314,7 @@ class PaymentService:
 
         url = f"{self.orders_url}/{merchant_order_id}"
         headers = self._paypal_headers()
-        response = requests.get(url, headers=headers)
+        response = self._request("GET", url, headers=headers)
 
         try:
             data = response.json()
@@ -320,7 +332,7 @@ class PaymentService:
 
         url = f"{self.orders_url}/{merchant_order_id}/capture"
         headers = self._paypal_headers()
-        response = requests.post(url, headers=headers)
+        response = self._request("POST", url, headers=headers)
 
         try:
             data = response.json()
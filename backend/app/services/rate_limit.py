@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterator, Optional
+
+from filelock import FileLock, Timeout
+
+from app.core.config import settings
+
+# Used when a provider answers 429 without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 5.0
+MIN_RATE_MULTIPLIER = 0.05
+RATE_RECOVERY_STEP = 0.05
+
+
+class RateLimited(Exception):
+    """The provider kept throttling us after every allowed retry."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Provider rate limit hit, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds; accepts both delta-seconds and HTTP-date forms."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_from_error(exc: BaseException) -> Optional[float]:
+    """Seconds to back off if ``exc`` (or its cause) is an HTTP 429, else None.
+
+    fal_client wraps httpx errors in FalClientError, so the response sits on
+    the chained ``__cause__``.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, "response", None)
+        if response is not None and getattr(response, "status_code", None) == 429:
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+            return DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+class InProcessBackend:
+    """Governor state shared by the threads of one process."""
+
+    def __init__(self, max_concurrency: int):
+        self._lock = threading.Lock()
+        self._state: dict = {}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    @contextmanager
+    def state(self) -> Iterator[dict]:
+        with self._lock:
+            yield self._state
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        self._slots.acquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+class FileBackend:
+    """Governor state shared across worker processes on one host.
+
+    Bucket state lives in a JSON file guarded by a file lock; concurrency
+    slots are individual lock files, which the OS releases if a process dies
+    mid-request.
+    """
+
+    def __init__(self, directory: str, max_concurrency: int, poll_interval: float = 0.05):
+        os.makedirs(directory, exist_ok=True)
+        self._state_path = os.path.join(directory, "state.json")
+        self._state_lock = FileLock(os.path.join(directory, "state.lock"))
+        self._slot_locks = [
+            FileLock(os.path.join(directory, f"slot-{index}.lock"))
+            for index in range(max_concurrency)
+        ]
+        self._poll_interval = poll_interval
+
+    @contextmanager
+    def state(self) -> Iterator[dict]:
+        with self._state_lock:
+            try:
+                with open(self._state_path) as f:
+                    state = json.load(f)
+            except (FileNotFoundError, ValueError):
+                state = {}
+            yield state
+            tmp_path = f"{self._state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self._state_path)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        while True:
+            for lock in self._slot_locks:
+                try:
+                    lock.acquire(timeout=0)
+                except Timeout:
+                    continue
+                try:
+                    yield
+                finally:
+                    lock.release()
+                return
+            time.sleep(self._poll_interval)
+
+
+class RateGovernor:
+    """Token bucket plus concurrency cap in front of a rate-limited provider.
+
+    On a 429 the whole governor pauses for the Retry-After period and halves
+    its effective rate; each success recovers it a step at a time (AIMD), so
+    throughput settles just under the provider's ceiling.
+    """
+
+    def __init__(self, rate: float, burst: int, backend, max_throttle_retries: int = 5,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.backend = backend
+        self.max_throttle_retries = max_throttle_retries
+        self._clock = clock
+        self._sleep = sleep
+
+    def _reserve_token(self) -> float:
+        """Take a token if one is available; otherwise return how long to wait."""
+        now = self._clock()
+        with self.backend.state() as state:
+            paused_until = state.get("paused_until", 0.0)
+            if now < paused_until:
+                return paused_until - now
+            rate = self.rate * state.get("multiplier", 1.0)
+            tokens = state.get("tokens", float(self.burst))
+            last = state.get("updated_at", now)
+            tokens = min(float(self.burst), tokens + max(0.0, now - last) * rate)
+            state["updated_at"] = now
+            if tokens >= 1.0:
+                state["tokens"] = tokens - 1.0
+                return 0.0
+            state["tokens"] = tokens
+            return (1.0 - tokens) / rate
+
+    def acquire_token(self) -> None:
+        while True:
+            wait = self._reserve_token()
+            if wait <= 0:
+                return
+            self._sleep(wait)
+
+    def record_success(self) -> None:
+        with self.backend.state() as state:
+            multiplier = state.get("multiplier", 1.0)
+            if multiplier < 1.0:
+                state["multiplier"] = min(1.0, multiplier + RATE_RECOVERY_STEP)
+
+    def record_throttle(self, retry_after: float) -> None:
+        with self.backend.state() as state:
+            state["multiplier"] = max(MIN_RATE_MULTIPLIER, state.get("multiplier", 1.0) / 2)
+            state["paused_until"] = max(state.get("paused_until", 0.0), self._clock() + retry_after)
+            state["tokens"] = 0.0
+
+    @property
+    def multiplier(self) -> float:
+        with self.backend.state() as state:
+            return state.get("multiplier", 1.0)
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run ``fn`` under the governor, re-trying it when the provider throttles."""
+        for _ in range(self.max_throttle_retries + 1):
+            with self.backend.slot():
+                self.acquire_token()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    retry_after = retry_after_from_error(e)
+                    if retry_after is None:
+                        raise
+                    self.record_throttle(retry_after)
+                    continue
+            self.record_success()
+            return result
+        raise RateLimited(retry_after)
+
+
+_fal_governor: Optional[RateGovernor] = None
+_fal_governor_lock = threading.Lock()
+
+
+def get_fal_governor() -> RateGovernor:
+    """Process-wide governor every fal.ai submission goes through."""
+    global _fal_governor
+    with _fal_governor_lock:
+        if _fal_governor is None:
+            if settings.FAL_GOVERNOR_BACKEND == "file":
+                backend = FileBackend(settings.FAL_GOVERNOR_DIR, settings.FAL_MAX_CONCURRENCY)
+            else:
+                backend = InProcessBackend(settings.FAL_MAX_CONCURRENCY)
+            _fal_governor = RateGovernor(
+                rate=settings.FAL_RATE_PER_SECOND,
+                burst=settings.FAL_BURST,
+                backend=backend,
+                max_throttle_retries=settings.FAL_MAX_THROTTLE_RETRIES,
+            )
+        return _fal_governor
@@ -0,0 +1,223 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from app.core.config import settings
+from app.services.rate_limit import RateLimited
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+CIRCUIT_OPEN = "circuit_open"
+
+# HTTP statuses worth retrying; every other 4xx means the request itself is bad
+TRANSIENT_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Submissions are paused because the provider is failing."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"Circuit open, provider paused for {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+class RetryError(Exception):
+    """A call failed for good; carries how many attempts were made."""
+
+    def __init__(self, last_error: BaseException, attempts: int, kind: str):
+        super().__init__(f"{kind} failure after {attempts} attempt(s): {last_error}")
+        self.last_error = last_error
+        self.attempts = attempts
+        self.kind = kind
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+        if isinstance(status, int):
+            return status
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def classify_error(exc: BaseException) -> str:
+    """Transient errors are worth retrying; permanent ones will fail again."""
+    if isinstance(exc, CircuitOpenError):
+        return CIRCUIT_OPEN
+    if isinstance(exc, (RateLimited, TimeoutError, ConnectionError)):
+        return TRANSIENT
+    status = _status_code(exc)
+    if status is not None:
+        return TRANSIENT if status in TRANSIENT_STATUSES else PERMANENT
+    # Network-level failures from httpx/requests carry no response
+    module = type(exc).__module__ or ""
+    if module.startswith(("httpx", "httpcore", "requests", "urllib3")):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float,
+                 rng: random.Random = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng or random.Random()
+
+    def delay(self, attempt: int) -> float:
+        """Sleep before retry number ``attempt`` (1-based)."""
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker:
+    """Opens when the failure rate over a sliding window crosses a threshold.
+
+    While open every call fails fast with CircuitOpenError; after
+    ``open_seconds`` a single probe is let through and its outcome decides
+    whether the circuit closes again.
+    """
+
+    def __init__(self, failure_rate: float, min_requests: int, window_seconds: float,
+                 open_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (timestamp, succeeded)
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(self._clock())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.open_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError unless a call may go ahead; True when it is the half-open probe."""
+        with self._lock:
+            now = self._clock()
+            state = self._state(now)
+            if state == "open":
+                raise CircuitOpenError(self.open_seconds - (now - self._opened_at))
+            if state == "half_open":
+                if self._probe_in_flight:
+                    raise CircuitOpenError(self.open_seconds)
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self) -> None:
+        """A probe that ended without an outcome recorded reopens the circuit, so another can follow."""
+        with self._lock:
+            if self._probe_in_flight:
+                self._probe_in_flight = False
+                self._opened_at = self._clock()
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                # Probe succeeded: start over with a clean window
+                self._opened_at = None
+                self._probe_in_flight = False
+                self._outcomes.clear()
+            self._record(True)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            now = self._clock()
+            if self._opened_at is not None:
+                self._opened_at = now
+                self._probe_in_flight = False
+                return
+            self._record(False)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.failure_rate:
+                self._opened_at = now
+
+    def _record(self, succeeded: bool) -> None:
+        now = self._clock()
+        self._outcomes.append((now, succeeded))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+
+def call_with_retry(fn: Callable, policy: RetryPolicy, breaker: Optional[CircuitBreaker] = None,
+                    sleep: Callable[[float], None] = time.sleep):
+    """Run ``fn`` until it succeeds, fails permanently or runs out of attempts.
+
+    Returns ``(result, attempts)``; raises RetryError otherwise.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        probe = False
+        try:
+            if breaker is not None:
+                probe = breaker.before_call()
+            result = fn()
+        except Exception as e:
+            kind = classify_error(e)
+            if breaker is not None:
+                if kind == TRANSIENT:
+                    breaker.record_failure()
+                elif kind == PERMANENT:
+                    # The provider answered, if only to refuse: it is reachable
+                    breaker.record_success()
+            if kind == PERMANENT or attempt >= policy.max_attempts:
+                raise RetryError(e, attempt, kind) from e
+            delay = policy.delay(attempt)
+            if kind == CIRCUIT_OPEN:
+                # Wait for the breaker rather than spinning through attempts
+                delay = max(delay, e.retry_in)
+            sleep(delay)
+            continue
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result, attempt
+        finally:
+            if probe:
+                breaker.release_probe()
+
+
+_fal_retry_policy: Optional[RetryPolicy] = None
+_fal_breaker: Optional[CircuitBreaker] = None
+
+
+def get_fal_retry_policy() -> RetryPolicy:
+    global _fal_retry_policy
+    if _fal_retry_policy is None:
+        _fal_retry_policy = RetryPolicy(
+            max_attempts=settings.FAL_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.FAL_RETRY_BASE_DELAY,
+            max_delay=settings.FAL_RETRY_MAX_DELAY,
+        )
+    return _fal_retry_policy
+
+
+def get_fal_breaker() -> CircuitBreaker:
+    global _fal_breaker
+    if _fal_breaker is None:
+        _fal_breaker = CircuitBreaker(
+            failure_rate=settings.FAL_BREAKER_FAILURE_RATE,
+            min_requests=settings.FAL_BREAKER_MIN_REQUESTS,
+            window_seconds=settings.FAL_BREAKER_WINDOW_SECONDS,
+            open_seconds=settings.FAL_BREAKER_OPEN_SECONDS,
+        )
+    return _fal_breaker
@@ -0,0 +1,211 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import GENERATION_QUEUE_DEPTH
+from app.services.subscription import subscription_service
+
+
+@dataclass
+class TenantPolicy:
+    """Scheduling weight and concurrency cap for one user."""
+
+    priority: float
+    max_concurrency: int
+
+
+def get_tenant_policy(db: Session, user_id: int) -> TenantPolicy:
+    """Read ``priority`` and ``max_concurrency`` from the user's active plan limits."""
+    priority = settings.SCHEDULER_DEFAULT_PRIORITY
+    max_concurrency = settings.SCHEDULER_DEFAULT_MAX_CONCURRENCY
+    subscription = subscription_service.get_active_subscription(db, user_id)
+    limits = subscription.plan.limits if subscription and subscription.plan else None
+    if isinstance(limits, dict):
+        priority = float(limits.get("priority", priority))
+        max_concurrency = int(limits.get("max_concurrency", max_concurrency))
+    return TenantPolicy(priority=max(priority, 0.01), max_concurrency=max(max_concurrency, 1))
+
+
+class _Tenant:
+    def __init__(self, policy: TenantPolicy):
+        self.policy = policy
+        self.queue = deque()  # (future, fn)
+        self.running = 0
+        self.virtual_time = 0.0
+
+
+class FairScheduler:
+    """Weighted fair queuing of generation work across users.
+
+    Each user has a virtual clock that advances by ``1 / priority`` per job
+    dispatched; free workers always take the next job of the user with the
+    lowest clock who is under their concurrency cap. A user returning from
+    idle starts at the current virtual time, so idling builds no credit,
+    and a 500-garment batch can't hold the pool against a 2-garment one.
+    """
+
+    def __init__(self, workers: int, smoothing: float = 0.2):
+        self.workers = workers
+        self.smoothing = smoothing
+        self._job_seconds: Optional[float] = None
+        self._lock = threading.Condition()
+        self._tenants: Dict[int, _Tenant] = {}
+        self._virtual_time = 0.0
+        self._threads = []
+        self._stopped = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            self._stopped = False
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"generation-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            self._stopped = True
+            self._lock.notify_all()
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def submit(self, tenant_id: int, policy: TenantPolicy, fn: Callable, *args, **kwargs) -> Future:
+        """Queue ``fn(*args, **kwargs)`` for ``tenant_id``; the future holds its result."""
+        future = Future()
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is None:
+                tenant = self._tenants[tenant_id] = _Tenant(policy)
+                tenant.virtual_time = self._virtual_time
+            tenant.policy = policy
+            # Run in a copy of the caller's context so trace and log fields follow the job
+            context = contextvars.copy_context()
+            tenant.queue.append((future, lambda: context.run(fn, *args, **kwargs)))
+            GENERATION_QUEUE_DEPTH.inc()
+            self._lock.notify()
+        self.start()
+        return future
+
+    def _next_job(self):
+        """Pick the eligible tenant with the lowest virtual time (lock held)."""
+        chosen_id, chosen = None, None
+        for tenant_id, tenant in self._tenants.items():
+            if not tenant.queue or tenant.running >= tenant.policy.max_concurrency:
+                continue
+            if chosen is None or tenant.virtual_time < chosen.virtual_time:
+                chosen_id, chosen = tenant_id, tenant
+        if chosen is None:
+            return None
+        future, job = chosen.queue.popleft()
+        GENERATION_QUEUE_DEPTH.dec()
+        if not future.set_running_or_notify_cancel():
+            self._forget_if_idle(chosen_id)
+            return chosen_id, None, None
+        self._virtual_time = chosen.virtual_time
+        chosen.virtual_time += 1.0 / chosen.policy.priority
+        chosen.running += 1
+        return chosen_id, future, job
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                picked = self._next_job()
+                while picked is None:
+                    if self._stopped:
+                        return
+                    self._lock.wait()
+                    picked = self._next_job()
+            tenant_id, future, job = picked
+            if future is None:
+                continue  # cancelled while queued
+            started = time.perf_counter()
+            elapsed = None
+            try:
+                result = job()
+                # Only completed jobs count; a fast failure says little about throughput
+                elapsed = time.perf_counter() - started
+                future.set_result(result)
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    if elapsed is not None:
+                        self._observe(elapsed)
+                    self._tenants[tenant_id].running -= 1
+                    self._forget_if_idle(tenant_id)
+                    self._lock.notify_all()
+
+    def _forget_if_idle(self, tenant_id: int) -> None:
+        # An idle tenant rejoins at the current virtual time, so dropping it loses nothing
+        tenant = self._tenants[tenant_id]
+        if not tenant.queue and not tenant.running:
+            del self._tenants[tenant_id]
+
+    def _observe(self, seconds: float) -> None:
+        if self._job_seconds is None:
+            self._job_seconds = seconds
+        else:
+            self._job_seconds += self.smoothing * (seconds - self._job_seconds)
+
+    def job_seconds(self) -> Optional[float]:
+        """Moving average of how long a completed job took; None before the first."""
+        with self._lock:
+            return self._job_seconds
+
+    def queue_depths(self) -> Dict[int, int]:
+        with self._lock:
+            return {tenant_id: len(tenant.queue) for tenant_id, tenant in self._tenants.items()}
+
+    def running(self) -> Dict[int, int]:
+        with self._lock:
+            return {tenant_id: tenant.running for tenant_id, tenant in self._tenants.items()}
+
+
+class SchedulerCollector:
+    """Per-tenant queue depth and running jobs, read when scraped."""
+
+    def __init__(self, scheduler: FairScheduler):
+        self.scheduler = scheduler
+
+    def collect(self):
+        queued = GaugeMetricFamily("vestureai_scheduler_queued", "Generation jobs queued per user", labels=["user_id"])
+        for tenant_id, depth in self.scheduler.queue_depths().items():
+            queued.add_metric([str(tenant_id)], depth)
+        yield queued
+        running = GaugeMetricFamily("vestureai_scheduler_running", "Generation jobs running per user", labels=["user_id"])
+        for tenant_id, count in self.scheduler.running().items():
+            running.add_metric([str(tenant_id)], count)
+        yield running
+
+
+_scheduler: Optional[FairScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> FairScheduler:
+    """Process-wide scheduler in front of the generation worker pool."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairScheduler(settings.SCHEDULER_WORKERS)
+            REGISTRY.register(SchedulerCollector(_scheduler))
+        return _scheduler
+
+
+def shutdown_scheduler() -> None:
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.shutdown(wait=False)
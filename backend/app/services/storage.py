@@ -1,70 +1,281 @@
-from typing import Any
-import boto3
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterable, Iterator, List, Optional
+import asyncio
+import logging
 from botocore.exceptions import NoCredentialsError, ClientError
 import os
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 import tempfile
+from app.core.config import settings
+from app.core.metrics import UPLOAD_SECONDS
+from app.core.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# S3 rejects multipart parts smaller than this, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+# delete_objects accepts at most this many keys per call
+DELETE_BATCH_SIZE = 1000
 
 class StorageService:
-    def __init__(self, bucket_name: str):
+    def __init__(self, bucket_name: str, s3_client=None,
+                 multipart_chunksize: int = None, max_concurrency: int = None):
+        # boto3 takes a few hundred ms to import, so only storage users pay for it
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
         self.bucket_name = bucket_name
-        self.s3_client = boto3.client('s3')
+        self.multipart_chunksize = max(MIN_PART_SIZE, multipart_chunksize or settings.STORAGE_MULTIPART_CHUNKSIZE)
+        self.max_concurrency = max_concurrency or settings.STORAGE_MAX_CONCURRENCY
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_chunksize,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_concurrency,
+        )
+        if s3_client is None:
+            settings.require("MINIO_URL", "MINIO_ACCESS_KEY", "MINIO_SECRET_KEY")
+        self.s3_client = s3_client or boto3.client(
+            's3',
+            endpoint_url=settings.MINIO_URL,
+            aws_access_key_id=settings.MINIO_ACCESS_KEY,
+            aws_secret_access_key=settings.MINIO_SECRET_KEY,
+            region_name=settings.S3_REGION,
+            # MinIO expects SigV4 presigning and bucket-in-path URLs
+            config=Config(signature_version='s3v4', s3={'addressing_style': 'path'}),
+        )
 
+    @traced("s3.upload_file")
     def upload_file(self, file_path: str, object_name: str) -> bool:
         try:
-            self.s3_client.upload_file(file_path, self.bucket_name, object_name)
+            self.s3_client.upload_file(file_path, self.bucket_name, object_name, Config=self.transfer_config)
             return True
         except FileNotFoundError:
-            print(f"The file was not found: {file_path}")
+            logger.error("The file was not found: %s", file_path)
             return False
         except NoCredentialsError:
-            print("Credentials not available")
+            logger.error("Credentials not available")
             return False
         except ClientError as e:
-            print(f"Failed to upload file: {e}")
+            logger.error("Failed to upload file: %s", e)
             return False
 
+    @traced("s3.download_file")
     def download_file(self, object_name: str, file_path: str) -> bool:
         try:
-            self.s3_client.download_file(self.bucket_name, object_name, file_path)
+            self.s3_client.download_file(self.bucket_name, object_name, file_path, Config=self.transfer_config)
+            return True
+        except ClientError as e:
+            logger.error("Failed to download file: %s", e)
+            return False
+
+    @traced("s3.upload_fileobj")
+    def upload_fileobj(self, fileobj: BinaryIO, object_name: str, content_type: str = None) -> bool:
+        """Stream a file-like object, using parallel multipart for large bodies."""
+        extra_args = {'ContentType': content_type} if content_type else None
+        try:
+            self.s3_client.upload_fileobj(fileobj, self.bucket_name, object_name,
+                                          ExtraArgs=extra_args, Config=self.transfer_config)
+            return True
+        except NoCredentialsError:
+            logger.error("Credentials not available")
+            return False
+        except ClientError as e:
+            logger.error("Failed to upload file: %s", e)
+            return False
+
+    @traced("s3.download_fileobj")
+    def download_fileobj(self, object_name: str, fileobj: BinaryIO) -> bool:
+        try:
+            self.s3_client.download_fileobj(self.bucket_name, object_name, fileobj, Config=self.transfer_config)
             return True
         except ClientError as e:
-            print(f"Failed to download file: {e}")
+            logger.error("Failed to download file: %s", e)
+            return False
+
+    @traced("s3.upload_stream")
+    async def upload_stream(self, chunks: AsyncIterator[bytes], object_name: str,
+                            content_type: str = None) -> bool:
+        """Upload an async byte stream as a multipart upload without buffering it whole.
+
+        At most ``max_concurrency`` parts are in flight at once, so memory stays
+        bounded by roughly ``max_concurrency * multipart_chunksize``.
+        """
+        extra_args = {'ContentType': content_type} if content_type else {}
+        buffer = bytearray()
+        upload_id = None
+        part_tasks: List[asyncio.Task] = []
+        slots = asyncio.Semaphore(self.max_concurrency)
+
+        async def send_part(part_number: int, body: bytes) -> dict:
+            try:
+                response = await asyncio.to_thread(
+                    self.s3_client.upload_part,
+                    Bucket=self.bucket_name, Key=object_name, UploadId=upload_id,
+                    PartNumber=part_number, Body=body,
+                )
+                return {'ETag': response['ETag'], 'PartNumber': part_number}
+            finally:
+                slots.release()
+
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                while len(buffer) >= self.multipart_chunksize:
+                    if upload_id is None:
+                        response = await asyncio.to_thread(
+                            self.s3_client.create_multipart_upload,
+                            Bucket=self.bucket_name, Key=object_name, **extra_args,
+                        )
+                        upload_id = response['UploadId']
+                    body = bytes(buffer[:self.multipart_chunksize])
+                    del buffer[:self.multipart_chunksize]
+                    await slots.acquire()
+                    part_tasks.append(asyncio.create_task(send_part(len(part_tasks) + 1, body)))
+
+            if upload_id is None:
+                # Small enough for a single request
+                await asyncio.to_thread(
+                    self.s3_client.put_object,
+                    Bucket=self.bucket_name, Key=object_name, Body=bytes(buffer), **extra_args,
+                )
+                return True
+
+            if buffer:
+                await slots.acquire()
+                part_tasks.append(asyncio.create_task(send_part(len(part_tasks) + 1, bytes(buffer))))
+            parts = await asyncio.gather(*part_tasks)
+            await asyncio.to_thread(
+                self.s3_client.complete_multipart_upload,
+                Bucket=self.bucket_name, Key=object_name, UploadId=upload_id,
+                MultipartUpload={'Parts': list(parts)},
+            )
+            return True
+        except Exception as e:
+            for task in part_tasks:
+                task.cancel()
+            if upload_id is not None:
+                try:
+                    await asyncio.to_thread(
+                        self.s3_client.abort_multipart_upload,
+                        Bucket=self.bucket_name, Key=object_name, UploadId=upload_id,
+                    )
+                except ClientError:
+                    pass
+            logger.error("Failed to upload stream: %s", e)
             return False
 
+    def iter_files(self, prefix: str = '', page_size: int = 1000) -> Iterator[str]:
+        """Yield every key under ``prefix``, one listing page at a time."""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=self.bucket_name, Prefix=prefix,
+            PaginationConfig={'PageSize': page_size},
+        )
+        for page in pages:
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
     def list_files(self, prefix: str = '') -> list:
         try:
-            response = self.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix)
-            return [obj['Key'] for obj in response.get('Contents', [])]
+            return list(self.iter_files(prefix))
         except ClientError as e:
-            print(f"Failed to list files: {e}")
+            logger.error("Failed to list files: %s", e)
             return []
 
+    @traced("s3.delete_file")
     def delete_file(self, object_name: str) -> bool:
         try:
             self.s3_client.delete_object(Bucket=self.bucket_name, Key=object_name)
             return True
         except ClientError as e:
-            print(f"Failed to delete file: {e}")
+            logger.error("Failed to delete file: %s", e)
             return False
 
+    @traced("s3.delete_files")
+    def delete_files(self, object_names: Iterable[str]) -> List[str]:
+        """Bulk delete via delete_objects; returns the keys that failed."""
+        failed: List[str] = []
+        batch: List[str] = []
+
+        def flush():
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+                )
+                failed.extend(error['Key'] for error in response.get('Errors', []))
+            except ClientError as e:
+                logger.error("Failed to delete files: %s", e)
+                failed.extend(batch)
+            batch.clear()
+
+        for object_name in object_names:
+            batch.append(object_name)
+            if len(batch) == DELETE_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+        return failed
+
+    def generate_presigned_put(self, object_name: str, content_type: str, expires_in: int) -> str:
+        """URL the client can PUT the object body to directly."""
+        return self.s3_client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': self.bucket_name, 'Key': object_name, 'ContentType': content_type},
+            ExpiresIn=expires_in,
+        )
+
+    def generate_presigned_post(self, object_name: str, content_type: str, max_bytes: int,
+                                expires_in: int) -> Dict[str, Any]:
+        """Form URL and fields for a browser POST upload, capped at ``max_bytes``."""
+        return self.s3_client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=object_name,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_bytes],
+            ],
+            ExpiresIn=expires_in,
+        )
+
+    @traced("s3.head_object")
+    def head_object(self, object_name: str) -> Optional[Dict[str, Any]]:
+        """Object metadata, or None if the object does not exist."""
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=object_name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def object_url(self, object_name: str) -> str:
+        return f"{settings.MINIO_URL.rstrip('/')}/{self.bucket_name}/{object_name}"
+
+_storage_service: Optional[StorageService] = None
+
+def get_storage_service() -> StorageService:
+    global _storage_service
+    if _storage_service is None:
+        _storage_service = StorageService(bucket_name=settings.S3_BUCKET)
+    return _storage_service
+
 async def upload_file_to_storage(upload_file: UploadFile, object_name: str = None) -> str:
     """
     Uploads an UploadFile to S3 and returns the file URL.
     """
-    storage_service = StorageService(bucket_name=os.getenv("S3_BUCKET", "your-bucket-name"))
+    storage_service = get_storage_service()
     suffix = os.path.splitext(upload_file.filename)[-1]
     object_name = object_name or f"uploads/{next(tempfile._get_candidate_names())}{suffix}"
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await upload_file.read()
-        tmp.write(content)
-        tmp.flush()
-        storage_service.upload_file(tmp.name, object_name)
-    # Construct the S3 URL (adjust as needed for your setup)
-    s3_url = f"https://{storage_service.bucket_name}.s3.amazonaws.com/{object_name}"
-    return s3_url
+    # Stream the spooled upload straight to storage; no temp file or full read
+    with UPLOAD_SECONDS.labels("s3").time():
+        await run_in_threadpool(
+            storage_service.upload_fileobj, upload_file.file, object_name, upload_file.content_type
+        )
+    return storage_service.object_url(object_name)
 
 # Usage example (to be removed or commented out in production):
 # storage_service = StorageService(bucket_name='your-bucket-name')
-# storage_service.upload_file('path/to/local/file.jpg', 'models/1/pose_label.jpg')
\ No newline at end of file
+# storage_service.upload_file('path/to/local/file.jpg', 'models/1/pose_label.jpg')
@@ -1,13 +1,15 @@
 # app/services/token.py
 from datetime import datetime, timedelta
 from typing import Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import and_, select
 from fastapi import HTTPException, status
 from fastapi import APIRouter, Depends, HTTPException, Request
 from app.models.user import TokenHistory
 from app.models import User, Subscription, Plan
-from app.core.config import get_db
+from app.core.config import get_async_db, get_db
+from app.core.replicas import get_async_read_db
 
 
 
@@ -102,6 +104,31 @@ class TokenService:
             "source": source
         }
     
+    def reserve_tokens(self, user_id: int, tokens_to_reserve: int,
+                       source: str = "batch_reserve") -> bool:
+        """Atomically take tokens up front; False when the balance is too low.
+
+        The caller commits, so the reservation lands with the work it pays for.
+        """
+        reserved = self.db.query(User).filter(
+            User.id == user_id,
+            User.token_balance >= tokens_to_reserve
+        ).update({User.token_balance: User.token_balance - tokens_to_reserve}, synchronize_session=False)
+        if not reserved:
+            return False
+        self._record_token_history(user_id=user_id, change=-tokens_to_reserve, source=source)
+        return True
+
+    def refund_tokens(self, user_id: int, tokens_to_refund: int,
+                      source: str = "batch_refund") -> None:
+        """Return reserved tokens for work that failed or never ran; the caller commits."""
+        if tokens_to_refund <= 0:
+            return
+        self.db.query(User).filter(User.id == user_id).update(
+            {User.token_balance: User.token_balance + tokens_to_refund}, synchronize_session=False
+        )
+        self._record_token_history(user_id=user_id, change=tokens_to_refund, source=source)
+
     def get_token_balance_with_plan_limit(self, user_id: int) -> dict:
         """Get user's token balance along with their plan's token limit"""
         user = self.db.query(User).filter(User.id == user_id).first()
@@ -204,9 +231,7 @@ class TokenService:
     
     def _is_token_valid(self, valid_until: Optional[datetime]) -> bool:
         """Check if tokens are still valid"""
-        if not valid_until:
-            return False
-        return datetime.utcnow() < valid_until
+        return _is_token_valid(valid_until)
     
     def _calculate_new_validity(self, current_validity: Optional[datetime], 
                                days_to_add: int) -> datetime:
@@ -230,6 +255,82 @@ class TokenService:
         self.db.add(history_record)
 
 
+def _is_token_valid(valid_until: Optional[datetime]) -> bool:
+    if not valid_until:
+        return False
+    return datetime.utcnow() < valid_until
+
+
+class AsyncTokenService:
+    """Read-only token queries for ``async def`` handlers on the async session"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_token_balance_with_plan_limit(self, user_id: int) -> dict:
+        """Get user's token balance along with their plan's token limit"""
+        user = await self.db.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        active_subscription = await self.db.scalar(
+            select(Subscription)
+            .options(selectinload(Subscription.plan))
+            .where(
+                Subscription.user_id == user_id,
+                Subscription.status == "active",
+                Subscription.current_period_end > datetime.utcnow()
+            )
+            .limit(1)
+        )
+
+        plan_limit = 0
+        plan_name = "No Plan"
+
+        if active_subscription and active_subscription.plan:
+            plan = active_subscription.plan
+            plan_limit = plan.limits.get("token_limit", 0) if plan.limits else 0
+            plan_name = plan.name
+
+        return {
+            "user_id": user_id,
+            "token_balance": user.token_balance or 0,
+            "plan_token_limit": plan_limit,
+            "plan_name": plan_name,
+            "usage_percentage": round((user.token_balance or 0) / plan_limit * 100, 2) if plan_limit > 0 else 0,
+            "token_valid_until": user.token_valid_until,
+            "is_valid": _is_token_valid(user.token_valid_until)
+        }
+
+    async def get_token_history(self, user_id: int, limit: int = 50) -> list:
+        """Get user's token history"""
+        history = await self.db.scalars(
+            select(TokenHistory)
+            .where(TokenHistory.user_id == user_id)
+            .order_by(TokenHistory.timestamp.desc())
+            .limit(limit)
+        )
+        return [
+            {
+                "id": record.id,
+                "change": record.change,
+                "source": record.source,
+                "timestamp": record.timestamp,
+                "validity_extension": record.validity_extension
+            }
+            for record in history
+        ]
+
+
 # Dependency to get TokenService instance
 def get_token_service(db: Session = Depends(get_db)) -> TokenService:
     return TokenService(db)
+
+
+def get_async_token_service(db: AsyncSession = Depends(get_async_db)) -> AsyncTokenService:
+    return AsyncTokenService(db)
+
+
+def get_async_read_token_service(db: AsyncSession = Depends(get_async_read_db)) -> AsyncTokenService:
+    """Token service for read-only handlers, on a replica when one is fit to serve."""
+    return AsyncTokenService(db)
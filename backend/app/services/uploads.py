@@ -0,0 +1,131 @@
+import os
+import uuid
+from datetime import datetime
+from typing import List
+
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.config import get_db, settings
+from app.models.upload_session import UploadSession
+from app.services.storage import StorageService, get_storage_service
+
+UPLOAD_PURPOSES = ("garment", "model")
+
+
+class UploadService:
+    """Direct-to-storage uploads: presigned tickets out, completion callbacks in.
+
+    The API only ever signs URLs and checks object metadata; the image bytes
+    go from the client straight to S3/MinIO.
+    """
+
+    def __init__(self, db: Session, storage: StorageService = None):
+        self.db = db
+        self._storage = storage
+
+    @property
+    def storage(self) -> StorageService:
+        # Only signing and completion talk to storage; lookups don't need a client
+        if self._storage is None:
+            self._storage = get_storage_service()
+        return self._storage
+
+    def create_session(self, user_id: int, filename: str, content_type: str,
+                       purpose: str = "garment", method: str = "put") -> dict:
+        """Register a pending upload and return the presigned ticket for it"""
+        if purpose not in UPLOAD_PURPOSES:
+            raise HTTPException(status_code=400, detail=f"Unknown upload purpose: {purpose}")
+        if method not in ("put", "post"):
+            raise HTTPException(status_code=400, detail=f"Unknown upload method: {method}")
+        if not content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="Only image uploads are supported")
+
+        ext = os.path.splitext(filename or "")[1].lower()
+        object_key = f"uploads/{purpose}s/{user_id}/{uuid.uuid4().hex}{ext}"
+        session = UploadSession(
+            user_id=user_id,
+            object_key=object_key,
+            filename=filename,
+            content_type=content_type,
+            purpose=purpose,
+            status="pending",
+        )
+        self.db.add(session)
+        self.db.commit()
+        self.db.refresh(session)
+
+        expires_in = settings.UPLOAD_URL_EXPIRES_SECONDS
+        if method == "post":
+            presigned = self.storage.generate_presigned_post(
+                object_key, content_type, settings.UPLOAD_MAX_BYTES, expires_in
+            )
+            url, fields = presigned["url"], presigned["fields"]
+        else:
+            url = self.storage.generate_presigned_put(object_key, content_type, expires_in)
+            fields = {}
+
+        return {
+            "id": session.id,
+            "object_key": object_key,
+            "method": method,
+            "url": url,
+            "fields": fields,
+            "expires_in": expires_in,
+        }
+
+    def complete_session(self, user_id: int, session_id: int) -> UploadSession:
+        """Confirm the object landed in storage and mark the upload usable"""
+        session = self._get_owned_session(user_id, session_id)
+        if session.status == "completed":
+            return session
+
+        head = self.storage.head_object(session.object_key)
+        if head is None:
+            raise HTTPException(status_code=409, detail="Upload has not reached storage yet")
+        size = int(head.get("ContentLength", 0))
+        if size > settings.UPLOAD_MAX_BYTES:
+            self.storage.delete_file(session.object_key)
+            raise HTTPException(status_code=413, detail="Uploaded object is too large")
+
+        session.status = "completed"
+        session.size_bytes = size
+        session.url = self.storage.object_url(session.object_key)
+        session.completed_at = datetime.utcnow()
+        self.db.commit()
+        self.db.refresh(session)
+        return session
+
+    def get_completed_sessions(self, user_id: int, session_ids: List[int],
+                               purpose: str) -> List[UploadSession]:
+        """Completed uploads owned by the user, in the order requested"""
+        if not session_ids:
+            return []
+        sessions = self.db.query(UploadSession).filter(
+            UploadSession.id.in_(session_ids),
+            UploadSession.user_id == user_id,
+        ).all()
+        by_id = {session.id: session for session in sessions}
+        result = []
+        for session_id in session_ids:
+            session = by_id.get(session_id)
+            if session is None:
+                raise HTTPException(status_code=404, detail=f"Upload {session_id} not found")
+            if session.status != "completed" or session.purpose != purpose:
+                raise HTTPException(status_code=400, detail=f"Upload {session_id} is not a completed {purpose} upload")
+            result.append(session)
+        return result
+
+    def _get_owned_session(self, user_id: int, session_id: int) -> UploadSession:
+        session = self.db.query(UploadSession).filter(
+            UploadSession.id == session_id,
+            UploadSession.user_id == user_id,
+        ).first()
+        if not session:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return session
+
+
+# Dependency to get UploadService instance
+def get_upload_service(db: Session = Depends(get_db)) -> UploadService:
+    return UploadService(db)
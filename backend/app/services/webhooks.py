@@ -0,0 +1,266 @@
+"""Completion webhooks to customer endpoints, delivered from a durable outbox.
+
+The worker records a ``webhook_deliveries`` row per matching endpoint in
+the same transaction that finishes the batch, so an event is never lost
+to a crash between the two. ``WebhookDispatcher`` then works through due
+rows: it claims one by pushing its ``next_attempt_at`` out by a lease
+(a sender that dies lets the claim lapse and the row comes due again),
+POSTs the signed payload, and on failure reschedules it with
+exponential backoff until WEBHOOK_MAX_ATTEMPTS. At most an endpoint's
+``max_concurrency`` deliveries to it are in flight per process.
+
+Receivers verify ``X-VestureAI-Signature: t=<unix time>,v1=<hex>``, the
+HMAC-SHA256 of ``"<t>.<body>"`` under the endpoint's secret, and can
+dedupe on ``X-VestureAI-Delivery``: a delivery may arrive more than once.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import WEBHOOK_DELIVERIES
+from app.core.outbound import BlockedURL, check_public_url
+from app.database import SessionLocal
+from app.models import Batch, GarmentImage, GeneratedImage, WebhookDelivery, WebhookEndpoint
+from app.services.resilience import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ("batch.completed", "batch.failed")
+BATCH_EVENTS = {"done": "batch.completed", "failed": "batch.failed"}
+SIGNATURE_HEADER = "X-VestureAI-Signature"
+EVENT_HEADER = "X-VestureAI-Event"
+DELIVERY_HEADER = "X-VestureAI-Delivery"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def record_batch_event(db: Session, batch: Batch, user_id: int) -> int:
+    """Queue the batch's completion event for the user's matching endpoints; the caller commits.
+
+    Returns how many deliveries were queued.
+    """
+    event = BATCH_EVENTS.get(batch.status)
+    if event is None:
+        return 0
+    endpoints = [
+        endpoint for endpoint in db.query(WebhookEndpoint).filter(
+            WebhookEndpoint.user_id == user_id,
+            WebhookEndpoint.active.is_(True),
+            or_(WebhookEndpoint.task_id.is_(None), WebhookEndpoint.task_id == batch.task_id),
+        )
+        if event in (endpoint.events or ())
+    ]
+    if not endpoints:
+        return 0
+
+    generated = db.query(func.count(GeneratedImage.id)).join(GeneratedImage.garment_image).filter(
+        GarmentImage.batch_id == batch.id
+    ).scalar()
+    payload = {
+        "type": event,
+        "created_at": _utcnow().isoformat(),
+        "data": {
+            "batch_id": batch.id,
+            "task_id": batch.task_id,
+            "status": batch.status,
+            "generated_images": generated,
+            "failed_combinations": batch.failed_combinations or 0,
+            "tokens_reserved": batch.tokens_reserved or 0,
+        },
+    }
+    now = _utcnow()
+    db.add_all([
+        WebhookDelivery(endpoint_id=endpoint.id, event=event, payload=payload, next_attempt_at=now)
+        for endpoint in endpoints
+    ])
+    return len(endpoints)
+
+
+class WebhookDispatcher:
+    """Sends due outbox rows from a background thread, woken early when new ones are recorded."""
+
+    def __init__(self, senders: int, poll_seconds: float, retry_policy: RetryPolicy,
+                 session_factory: Callable[[], Session] = SessionLocal, post: Optional[Callable] = None):
+        self.senders = senders
+        self.poll_seconds = poll_seconds
+        self.retry_policy = retry_policy
+        self._session_factory = session_factory
+        self._post = post
+        self._in_flight: Dict[int, int] = {}  # endpoint id -> deliveries being sent
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(senders, thread_name_prefix="webhook-sender")
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="webhook-dispatcher", daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.dispatch_due()
+            except Exception:
+                logger.exception("Webhook dispatch failed")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def dispatch_due(self) -> int:
+        """Claim due deliveries whose endpoints have room and hand them to senders."""
+        db = self._session_factory()
+        submitted = 0
+        try:
+            now = _utcnow()
+            due = (
+                db.query(WebhookDelivery.id, WebhookDelivery.endpoint_id, WebhookEndpoint.max_concurrency)
+                .join(WebhookDelivery.endpoint)
+                .filter(WebhookDelivery.status.in_(("pending", "sending")), WebhookDelivery.next_attempt_at <= now)
+                .order_by(WebhookDelivery.next_attempt_at)
+                .limit(self.senders * 4)
+                .all()
+            )
+            for delivery_id, endpoint_id, max_concurrency in due:
+                limit = max_concurrency or settings.WEBHOOK_ENDPOINT_CONCURRENCY
+                with self._lock:
+                    if self._in_flight.get(endpoint_id, 0) >= limit:
+                        continue
+                # Only one process wins the claim: it moves next_attempt_at past now
+                claimed = db.query(WebhookDelivery).filter(
+                    WebhookDelivery.id == delivery_id,
+                    WebhookDelivery.status.in_(("pending", "sending")),
+                    WebhookDelivery.next_attempt_at <= now,
+                ).update({
+                    WebhookDelivery.status: "sending",
+                    WebhookDelivery.next_attempt_at: now + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS),
+                }, synchronize_session=False)
+                db.commit()
+                if not claimed:
+                    continue
+                with self._lock:
+                    self._in_flight[endpoint_id] = self._in_flight.get(endpoint_id, 0) + 1
+                self._executor.submit(self._send, delivery_id, endpoint_id)
+                submitted += 1
+        finally:
+            db.close()
+        return submitted
+
+    def _http_post(self, url: str, body: bytes, headers: Dict[str, str]) -> int:
+        # Checked again at send time: the host may resolve elsewhere by now
+        check_public_url(url)
+        if self._post is not None:
+            return self._post(url, body, headers)
+        import httpx
+
+        # Redirects are not followed, so they can't lead into the private network
+        return httpx.post(url, content=body, headers=headers, timeout=settings.WEBHOOK_TIMEOUT_SECONDS,
+                          follow_redirects=False).status_code
+
+    def _send(self, delivery_id: int, endpoint_id: int) -> None:
+        db = self._session_factory()
+        try:
+            delivery = db.get(WebhookDelivery, delivery_id)
+            if delivery is None:
+                return
+            endpoint = delivery.endpoint
+            body = json.dumps({"id": delivery.id, **delivery.payload}, separators=(",", ":")).encode()
+            headers = {
+                "Content-Type": "application/json",
+                EVENT_HEADER: delivery.event,
+                DELIVERY_HEADER: str(delivery.id),
+                SIGNATURE_HEADER: sign(endpoint.secret, int(time.time()), body),
+            }
+            status, error = None, None
+            if not endpoint.active:
+                error = "endpoint disabled"
+            else:
+                try:
+                    status = self._http_post(endpoint.url, body, headers)
+                    if not 200 <= status < 300:
+                        error = f"HTTP {status}"
+                except BlockedURL:
+                    error = "endpoint is not a public address"
+                except Exception as e:
+                    # Shown to the endpoint's owner, so no details of what the request reached
+                    logger.info("Webhook delivery %s failed: %r", delivery_id, e)
+                    error = f"request failed: {type(e).__name__}"
+
+            delivery.attempts += 1
+            delivery.response_status = status
+            delivery.last_error = error
+            if error is None:
+                delivery.status = "delivered"
+                delivery.delivered_at = _utcnow()
+                WEBHOOK_DELIVERIES.labels("delivered").inc()
+            elif not endpoint.active or delivery.attempts >= self.retry_policy.max_attempts:
+                delivery.status = "failed"
+                WEBHOOK_DELIVERIES.labels("failed").inc()
+                logger.warning("Webhook delivery gave up", extra={
+                    "delivery_id": delivery.id, "endpoint_id": endpoint_id, "attempts": delivery.attempts,
+                    "error": error,
+                })
+            else:
+                delivery.status = "pending"
+                delivery.next_attempt_at = _utcnow() + timedelta(seconds=self.retry_policy.delay(delivery.attempts))
+                WEBHOOK_DELIVERIES.labels("retry").inc()
+            db.commit()
+        except Exception:
+            logger.exception("Webhook delivery crashed", extra={"delivery_id": delivery_id})
+        finally:
+            db.close()
+            with self._lock:
+                self._in_flight[endpoint_id] -= 1
+                if not self._in_flight[endpoint_id]:
+                    del self._in_flight[endpoint_id]
+            # Deliveries held back by this endpoint's limit can go now
+            self._wake.set()
+
+
+_dispatcher: Optional[WebhookDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_webhook_dispatcher() -> WebhookDispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = WebhookDispatcher(
+                settings.WEBHOOK_SENDERS,
+                settings.WEBHOOK_POLL_SECONDS,
+                RetryPolicy(settings.WEBHOOK_MAX_ATTEMPTS, settings.WEBHOOK_BASE_DELAY, settings.WEBHOOK_MAX_DELAY),
+            )
+            _dispatcher.start()
+        return _dispatcher
+
+
+def shutdown_webhook_dispatcher() -> None:
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.shutdown()
+            _dispatcher = None
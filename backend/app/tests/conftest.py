@@ -0,0 +1,100 @@
+import os
+import tempfile
+
+# Settings are read at import time, so the environment must be in place
+# before anything under ``app`` is imported.
+_tmp_dir = tempfile.mkdtemp(prefix="vestureai-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("EMAIL_USERNAME", "test")
+os.environ.setdefault("EMAIL_PASSWORD", "test")
+os.environ.setdefault("EMAIL_FROM", "test@example.com")
+os.environ.setdefault("STRIPE_API_KEY", "test")
+os.environ.setdefault("MINIO_URL", "http://localhost:9000")
+os.environ.setdefault("MINIO_ACCESS_KEY", "test")
+os.environ.setdefault("MINIO_SECRET_KEY", "test")
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("FAL_KEY", "test")
+os.environ.setdefault("BLOB_STORE_DIR", os.path.join(_tmp_dir, "blobs"))
+
+import ipaddress
+import socket
+import threading
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import Base, SessionLocal, engine
+import app.models  # noqa: F401  register all tables
+from app.models import Batch
+from app.models.user import User
+
+
+@pytest.fixture(scope="session", autouse=True)
+def create_tables():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def client():
+    from app.main import app
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(db):
+    user = User(email=f"{uuid.uuid4().hex[:8]}@example.com", password_hash="password", token_balance=100)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@pytest.fixture
+def auth_headers(user):
+    from app.core.auth import create_access_token
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+
+
+@pytest.fixture
+def wait_for_batch(db):
+    """Poll until the batch runners are finished with a batch, and return it."""
+    def wait(batch_id):
+        for _ in range(200):
+            db.expire_all()
+            batch = db.get(Batch, batch_id)
+            if batch.status not in ("queued", "processing"):
+                return batch
+            threading.Event().wait(0.05)
+        raise AssertionError(f"batch {batch_id} still {batch.status}")
+    return wait
+
+
+@pytest.fixture
+def fake_dns(monkeypatch):
+    """Resolve host names from the returned dict instead of the network."""
+    records = {}
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        try:
+            address = str(ipaddress.ip_address(host))
+        except ValueError:
+            if host not in records:
+                raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+            address = records[host]
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    return records
@@ -0,0 +1,83 @@
+import io
+from contextlib import contextmanager
+
+from PIL import Image
+
+from app.core.config import settings
+from app.models import Model, ModelImage, Task
+from app.services.admission import check_admission
+from app.services.scheduler import FairScheduler, TenantPolicy
+
+
+class _Backlog(FairScheduler):
+    """A scheduler whose workers only start on ``drain``, so submitted jobs stay queued."""
+
+    def start(self):
+        pass
+
+    def drain(self):
+        FairScheduler.start(self)
+        self.shutdown()
+
+
+@contextmanager
+def _backlog(jobs, workers=4, job_seconds=10.0):
+    scheduler = _Backlog(workers=workers)
+    scheduler._observe(job_seconds)
+    futures = [scheduler.submit(99, TenantPolicy(1, 2), lambda: None) for _ in range(jobs)]
+    try:
+        yield scheduler
+    finally:
+        # Run the queue dry so the shared queue-depth gauge is back where it was
+        scheduler.drain()
+        for future in futures:
+            future.result(timeout=5)
+
+
+def test_eta_from_depth_and_observed_latency():
+    with _backlog(jobs=8) as scheduler:
+        decision = check_admission(scheduler, TenantPolicy(priority=1, max_concurrency=2), combinations=6)
+    assert decision.admitted
+    # 8 queued jobs over 4 workers at 10s each, then 6 of our own two at a time
+    assert decision.queue_wait_seconds == 20.0
+    assert decision.eta_seconds == 50.0
+
+
+def test_batches_waiting_for_a_runner_count_as_backlog():
+    with _backlog(jobs=0) as scheduler:
+        decision = check_admission(scheduler, TenantPolicy(priority=1, max_concurrency=2), combinations=6, waiting=8)
+    assert decision.queue_wait_seconds == 20.0
+    assert decision.eta_seconds == 50.0
+
+
+def test_low_priority_deferred_before_high_priority(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_DEFER_WAIT_SECONDS", 100)
+    monkeypatch.setattr(settings, "ADMISSION_REJECT_WAIT_SECONDS", 500)
+    with _backlog(jobs=60) as scheduler:  # 150s of backlog
+        deferred = check_admission(scheduler, TenantPolicy(priority=1, max_concurrency=2), combinations=1)
+        assert not deferred.admitted
+        assert deferred.retry_after == 50
+        assert check_admission(scheduler, TenantPolicy(priority=4, max_concurrency=2), combinations=1).admitted
+
+        monkeypatch.setattr(settings, "ADMISSION_REJECT_WAIT_SECONDS", 120)
+        assert not check_admission(scheduler, TenantPolicy(priority=4, max_concurrency=2), combinations=1).admitted
+
+
+def test_create_batch_returns_429_with_retry_after(client, db, user, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_REJECT_WAIT_SECONDS", 0)
+    model = Model(name="busy", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add(ModelImage(model_id=model.id, url="blobs/front.png", pose_label="front"))
+    task = Task(user_id=user.id, model_id=model.id, name="busy")
+    db.add(task)
+    db.commit()
+
+    garment = io.BytesIO()
+    Image.new("RGB", (64, 96), (20, 90, 160)).save(garment, format="JPEG")
+    response = client.post("/batches/", data={"task_id": str(task.id)},
+                           files=[("files", ("shirt.jpg", garment.getvalue(), "image/jpeg"))], headers=auth_headers)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    db.expire_all()
+    assert user.token_balance == 100
@@ -0,0 +1,76 @@
+import io
+import threading
+import zipfile
+
+from app.models import Batch, BatchArchive, GarmentImage, GeneratedImage, Model, Task
+from app.services import archives
+from app.services.blob_store import blob_store, blob_url
+
+
+def _finished_batch(db, user, outputs):
+    model = Model(name="archive", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    task = Task(user_id=user.id, model_id=model.id, name="archive")
+    db.add(task)
+    db.flush()
+    batch = Batch(task_id=task.id, status="done")
+    db.add(batch)
+    db.flush()
+    garment = GarmentImage(batch_id=batch.id, image_url="blobs/garment.png")
+    db.add(garment)
+    db.flush()
+    for data in outputs:
+        url = blob_url(f"{blob_store.put_bytes(data)}.png")
+        db.add(GeneratedImage(garment_image_id=garment.id, model_id=model.id, pose_label="front", output_url=url))
+    db.commit()
+    return batch, garment
+
+
+def test_archive_is_kept_and_served_with_ranges(client, db, user):
+    batch, _ = _finished_batch(db, user, [b"first output", b"second output"])
+
+    first = client.get(f"/batches/{batch.id}/download")
+    assert first.status_code == 200
+    assert first.headers["content-length"] == str(len(first.content))
+    with zipfile.ZipFile(io.BytesIO(first.content)) as archive:
+        assert archive.namelist() == ["image_1.png", "image_2.png"]
+        assert archive.read("image_2.png") == b"second output"
+    assert db.get(BatchArchive, batch.id) is not None
+
+    partial = client.get(f"/batches/{batch.id}/download", headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.content == first.content[10:20]
+    assert partial.headers["etag"] == first.headers["etag"]
+
+
+def test_archive_rebuilt_when_outputs_change(client, db, user):
+    batch, garment = _finished_batch(db, user, [b"only output"])
+    etag = client.get(f"/batches/{batch.id}/download").headers["etag"]
+
+    db.add(GeneratedImage(garment_image_id=garment.id, model_id=garment.batch.task.model_id, pose_label="side",
+                          output_url=blob_url(f"{blob_store.put_bytes(b'late output')}.png")))
+    db.commit()
+
+    response = client.get(f"/batches/{batch.id}/download")
+    assert response.headers["etag"] != etag
+    assert len(zipfile.ZipFile(io.BytesIO(response.content)).namelist()) == 2
+
+
+def test_concurrent_first_downloads_share_one_build(db, user, monkeypatch):
+    batch, _ = _finished_batch(db, user, [b"output"])
+    release = threading.Event()
+    builds = []
+
+    def slow_build(batch_id):
+        builds.append(batch_id)
+        release.wait(5)
+        return "archive-path"
+
+    monkeypatch.setattr(archives, "build_archive", slow_build)
+    futures = [archives.ensure_archive(batch.id) for _ in range(3)]
+    release.set()
+
+    assert {future.result(5) for future in futures} == {"archive-path"}
+    assert futures[0] is futures[1] is futures[2]
+    assert builds == [batch.id]
@@ -37,4 +37,48 @@
 
 # def test_get_nonexistent_batch():
 #     response = client.get("/batches/999")
-#     assert response.status_code == 404  # Not Found for nonexistent batch
\ No newline at end of file
+#     assert response.status_code == 404  # Not Found for nonexistent batch
+
+import io
+
+from PIL import Image
+
+from app.models import Model, ModelImage, Task
+from app.models.user import User
+
+
+def _task(db, user):
+    model = Model(name="batches", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add(ModelImage(model_id=model.id, url="blobs/front.png", pose_label="front"))
+    task = Task(user_id=user.id, model_id=model.id, name="batches")
+    db.add(task)
+    db.commit()
+    return task
+
+
+def test_unreadable_garment_is_a_bad_request(client, db, user, auth_headers):
+    task = _task(db, user)
+    good = io.BytesIO()
+    Image.new("RGB", (48, 64), (200, 40, 40)).save(good, format="PNG")
+
+    response = client.post("/batches/", data={"task_id": str(task.id)}, headers=auth_headers, files=[
+        ("files", ("shirt.png", good.getvalue(), "image/png")),
+        ("files", ("notes.png", b"not an image at all", "image/png")),
+    ])
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "notes.png is not a readable image"
+    db.expire_all()
+    assert db.get(User, user.id).token_balance == 100
+
+
+def test_non_numeric_upload_id_is_a_bad_request(client, db, user, auth_headers):
+    task = _task(db, user)
+
+    response = client.post("/batches/", data={"task_id": str(task.id), "upload_ids": ["7", "abc"]},
+                           headers=auth_headers)
+
+    assert response.status_code == 400
+    assert "upload_ids" in response.json()["detail"]
@@ -0,0 +1,37 @@
+from app.core.config import settings
+from app.services import image_generation
+from benchmarks.compare import compare
+from benchmarks.db_concurrency import run as run_db_concurrency
+from benchmarks.pipeline import percentile, run_cell
+
+
+def test_percentile_nearest_rank():
+    samples = [float(n) for n in range(1, 101)]
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile([], 95) == 0.0
+
+
+def test_pipeline_cell_runs_offline(monkeypatch):
+    monkeypatch.setattr(settings, "TRYON_PROVIDER", "fake")
+    monkeypatch.setattr(settings, "GARMENT_STORAGE", "blob")
+    monkeypatch.setattr(settings, "FAKE_TRYON_LATENCY", "fixed:0")
+    monkeypatch.setattr(image_generation, "_providers", {})
+
+    cell = run_cell(garments=2, poses=2, users=2)
+
+    assert cell["errors"] == []
+    assert cell["combinations"] == 8
+    assert cell["latency_seconds"]["generate"]["count"] == 2
+    assert cell["queries"]["per_batch"]["create"] > 0
+    assert cell["peak_rss_mb"] > 0
+
+    slower = dict(cell, throughput={"images_per_second": cell["throughput"]["images_per_second"] / 2})
+    regressions = [line for line, regressed in compare({"cells": [cell]}, {"cells": [slower]}, 0.1) if regressed]
+    assert len(regressions) == 1 and "images/s" in regressions[0]
+
+
+def test_db_concurrency_modes_all_answer(tmp_path):
+    results = run_db_concurrency(f"sqlite:///{tmp_path / 'bench.db'}", requests=4, delay=0)
+    assert [mode["mode"] for mode in results["modes"]] == ["blocking", "threadpool", "async"]
+    assert all(mode["errors"] == 0 for mode in results["modes"])
@@ -0,0 +1,41 @@
+import io
+
+from app.services.blob_store import blob_store, blob_name, blob_url
+
+
+def test_put_dedupes_identical_content():
+    first = blob_store.put(io.BytesIO(b"same garment bytes"))
+    second = blob_store.put(io.BytesIO(b"same garment bytes"))
+    assert first == second
+    path = blob_store.path_for(first)
+    assert path.endswith(f"{first[:2]}/{first[2:4]}/{first}")
+
+
+def test_get_blob_sends_immutable_cache_headers(client):
+    digest = blob_store.put_bytes(b"\x89PNG fake image")
+    response = client.get(f"/{blob_url(blob_name(digest, 'shirt.PNG'))}")
+    assert response.status_code == 200
+    assert response.content == b"\x89PNG fake image"
+    assert response.headers["etag"] == f'"{digest}"'
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["content-type"] == "image/png"
+
+
+def test_get_blob_if_none_match_returns_304(client):
+    digest = blob_store.put_bytes(b"cached image")
+    response = client.get(f"/blobs/{digest}.jpg", headers={"If-None-Match": f'"{digest}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_get_blob_range(client):
+    digest = blob_store.put_bytes(b"0123456789")
+    response = client.get(f"/blobs/{digest}", headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206
+    assert response.content == b"2345"
+    assert response.headers["content-range"] == "bytes 2-5/10"
+
+
+def test_get_blob_unknown_digest(client):
+    assert client.get(f"/blobs/{'0' * 64}.jpg").status_code == 404
+    assert client.get("/blobs/not-a-digest.jpg").status_code == 404
@@ -0,0 +1,143 @@
+import io
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.models import Batch, GarmentImage, GeneratedImage, Model, ModelImage, PendingGeneration, Task
+from app.models.user import User
+from app.services import image_generation
+from app.services.image_generation import FakeTryOnProvider
+from app.workers.callbacks import expire_stale_generations
+
+
+@pytest.fixture
+def callback_provider(client, monkeypatch):
+    """The fake provider in callback mode, calling back into the app through the test client."""
+    calls = []
+
+    def deliver(url, body):
+        calls.append((url, body))
+        return client.post(url, json=body).status_code
+
+    provider = FakeTryOnProvider(callbacks=True, deliver=deliver)
+    monkeypatch.setattr(settings, "TRYON_PROVIDER", "fake_webhook")
+    monkeypatch.setattr(settings, "GARMENT_STORAGE", "blob")
+    monkeypatch.setattr(settings, "PROVIDER_CALLBACK_BASE_URL", "http://testserver")
+    monkeypatch.setattr(image_generation, "_providers", {"fake_webhook": provider})
+    provider.calls = calls
+    return provider
+
+
+def _task(db, user, poses):
+    model = Model(name="callback", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add_all([ModelImage(model_id=model.id, url=f"blobs/{pose}.png", pose_label=pose) for pose in poses])
+    task = Task(user_id=user.id, model_id=model.id, name="callback")
+    db.add(task)
+    db.commit()
+    return task
+
+
+def _garment(seed):
+    out = io.BytesIO()
+    Image.frombytes("RGB", (48, 64), random.Random(seed).randbytes(48 * 64 * 3)).save(out, format="PNG")
+    return ("files", (f"garment-{seed}.png", out.getvalue(), "image/png"))
+
+
+def test_results_arrive_by_callback(client, db, user, auth_headers, callback_provider, wait_for_batch):
+    task = _task(db, user, ["front", "side"])
+
+    response = client.post("/batches/", data={"task_id": str(task.id)}, files=[_garment(1)], headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    batch = wait_for_batch(response.json()["id"])
+    assert batch.status == "done"
+    pending = db.query(PendingGeneration).filter(PendingGeneration.batch_id == batch.id).all()
+    assert sorted(p.status for p in pending) == ["completed", "completed"]
+    assert all(p.request_id for p in pending)
+    outputs = db.query(GeneratedImage).join(GarmentImage).filter(GarmentImage.batch_id == batch.id).all()
+    assert sorted(o.pose_label for o in outputs) == ["front", "side"]
+    assert db.get(User, user.id).token_balance == 100 - 2
+
+    # Providers retry webhooks; a repeat changes nothing
+    url, body = callback_provider.calls[0]
+    assert client.post(url, json=body).json() == {"status": "completed"}
+    db.expire_all()
+    assert db.query(GeneratedImage).join(GarmentImage).filter(GarmentImage.batch_id == batch.id).count() == 2
+
+
+def test_failed_callbacks_refund_and_fail_the_batch(client, db, user, auth_headers, callback_provider, wait_for_batch):
+    callback_provider.failure_rate = 1.0
+    task = _task(db, user, ["front"])
+
+    response = client.post("/batches/", data={"task_id": str(task.id)}, files=[_garment(2)], headers=auth_headers)
+
+    batch = wait_for_batch(response.json()["id"])
+    assert (batch.status, batch.failed_combinations) == ("failed", 1)
+    assert db.get(User, user.id).token_balance == 100
+
+
+def test_callback_needs_the_token(client, db, user, auth_headers, callback_provider, wait_for_batch):
+    task = _task(db, user, ["front"])
+    batch_id = client.post("/batches/", data={"task_id": str(task.id)}, files=[_garment(3)],
+                           headers=auth_headers).json()["id"]
+    wait_for_batch(batch_id)
+    pending = db.query(PendingGeneration).filter(PendingGeneration.batch_id == batch_id).one()
+
+    forged = {"request_id": pending.request_id, "status": "OK", "payload": {"image": {"url": "https://evil.example"}}}
+    assert client.post(f"/callbacks/tryon/{pending.id}?token=guess", json=forged).status_code == 404
+    other = {**forged, "request_id": "someone-else"}
+    assert client.post(f"/callbacks/tryon/{pending.id}?token={pending.token}", json=other).status_code == 409
+
+
+def test_cancel_withdraws_submitted_generations(client, db, user, auth_headers, callback_provider):
+    callback_provider.latency = lambda rng: 30.0
+    task = _task(db, user, ["front", "side"])
+    batch_id = client.post("/batches/", data={"task_id": str(task.id)}, files=[_garment(4)],
+                           headers=auth_headers).json()["id"]
+    for _ in range(200):
+        db.expire_all()
+        statuses = [p.status for p in db.query(PendingGeneration).filter(PendingGeneration.batch_id == batch_id)]
+        if statuses == ["submitted", "submitted"]:
+            break
+        threading.Event().wait(0.05)
+    assert statuses == ["submitted", "submitted"]
+
+    response = client.post(f"/batches/{batch_id}/cancel", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert (response.json()["status"], response.json()["tokens_refunded"]) == ("cancelled", 2)
+    db.expire_all()
+    pending = db.query(PendingGeneration).filter(PendingGeneration.batch_id == batch_id).all()
+    assert {p.status for p in pending} == {"cancelled"}
+    # Withdrawn from the provider: no callbacks are left to come in
+    assert callback_provider._timers == {}
+    assert callback_provider.calls == []
+    assert db.get(User, user.id).token_balance == 100
+
+
+def test_generations_that_never_call_back_expire(db, user):
+    task = _task(db, user, ["front"])
+    batch = Batch(task_id=task.id, status="processing", tokens_reserved=1)
+    db.add(batch)
+    db.flush()
+    garment = GarmentImage(batch_id=batch.id, image_url="blobs/garment.png")
+    db.add(garment)
+    db.flush()
+    db.add(PendingGeneration(batch_id=batch.id, garment_image_id=garment.id, model_id=task.model_id,
+                             pose_label="front", provider="fake", request_id="lost-1", token="t",
+                             status="submitted", attempts=1,
+                             submitted_at=datetime.now(timezone.utc) - timedelta(hours=1)))
+    db.get(User, user.id).token_balance -= 1
+    db.commit()
+
+    assert expire_stale_generations(db, timeout_seconds=60) == 1
+
+    db.expire_all()
+    assert db.get(Batch, batch.id).status == "failed"
+    assert db.get(User, user.id).token_balance == 100
@@ -0,0 +1,155 @@
+import threading
+
+import pytest
+
+from app.models import Batch, GarmentImage, GeneratedImage, Model, ModelImage, Task
+from app.models.user import TokenHistory, User
+from app.services.image_generation import FalQueueProvider, GenerationCancelled, TryOnProvider
+from app.workers import image_tasks
+from app.workers.image_tasks import generate_images_task, recover_queued_batches
+
+
+class _BlockingProvider(TryOnProvider):
+    """Holds every call until the batch is cancelled."""
+
+    name = "blocking"
+
+    def __init__(self):
+        self.started = threading.Event()
+
+    def generate(self, model_image_url, garment_image_url, cancel_event=None):
+        self.started.set()
+        cancel_event.wait(5)
+        raise GenerationCancelled("Batch cancelled")
+
+
+def _reserved_batch(db, user, status="queued"):
+    """A 3 garment × 2 pose batch whose 6 tokens were taken at creation."""
+    model = Model(name="cancel", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add_all([
+        ModelImage(model_id=model.id, url="blobs/front.png", pose_label="front"),
+        ModelImage(model_id=model.id, url="blobs/side.png", pose_label="side"),
+    ])
+    task = Task(user_id=user.id, model_id=model.id, name="cancel")
+    db.add(task)
+    db.flush()
+    batch = Batch(task_id=task.id, status=status, tokens_reserved=6, tokens_refunded=0)
+    db.add(batch)
+    db.flush()
+    db.add_all([GarmentImage(batch_id=batch.id, image_url=f"blobs/garment-{i}.jpg") for i in range(3)])
+    db.get(User, user.id).token_balance -= 6
+    db.commit()
+    return batch
+
+
+def test_cancel_queued_batch_refunds_everything(client, db, user, auth_headers):
+    batch = _reserved_batch(db, user)
+
+    response = client.post(f"/batches/{batch.id}/cancel", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert response.json()["tokens_refunded"] == 6
+
+    # A worker picking it up afterwards does nothing
+    assert generate_images_task(batch.id, user.id, provider=_BlockingProvider()) == {}
+    db.expire_all()
+    assert db.get(User, user.id).token_balance == 100
+    assert db.get(Batch, batch.id).tokens_refunded == 6
+    refunds = db.query(TokenHistory).filter(TokenHistory.user_id == user.id, TokenHistory.source == "batch_refund")
+    assert [record.change for record in refunds] == [6]
+
+
+def test_cancel_running_batch_stops_its_combinations(client, db, user, auth_headers):
+    batch = _reserved_batch(db, user)
+    provider = _BlockingProvider()
+    worker = threading.Thread(target=generate_images_task, args=(batch.id, user.id, provider))
+    worker.start()
+    assert provider.started.wait(5)
+
+    response = client.post(f"/batches/{batch.id}/cancel", headers=auth_headers)
+    assert response.status_code == 200
+    # The worker may already have stopped by the time the response is built
+    assert response.json()["status"] in ("cancelling", "cancelled")
+    worker.join(5)
+    assert not worker.is_alive()
+
+    db.expire_all()
+    cancelled = db.get(Batch, batch.id)
+    assert cancelled.status == "cancelled"
+    assert cancelled.tokens_refunded == 6
+    assert cancelled.failed_combinations == 0
+    assert db.query(GeneratedImage).join(GarmentImage).filter(GarmentImage.batch_id == batch.id).count() == 0
+    assert db.get(User, user.id).token_balance == 100
+
+
+def test_finished_batch_cannot_be_cancelled(client, db, user, auth_headers):
+    batch = _reserved_batch(db, user, status="done")
+    assert client.post(f"/batches/{batch.id}/cancel", headers=auth_headers).status_code == 409
+
+
+def test_other_users_batch_is_not_found(client, db, auth_headers):
+    owner = User(email="owner-cancel@example.com", password_hash="password", token_balance=10)
+    db.add(owner)
+    db.commit()
+    batch = _reserved_batch(db, owner)
+    assert client.post(f"/batches/{batch.id}/cancel", headers=auth_headers).status_code == 404
+
+
+class _QueueClient:
+    """Just enough of fal_client for FalQueueProvider: a request that never completes."""
+
+    class Completed:
+        pass
+
+    def __init__(self):
+        self.cancelled = []
+
+    def submit(self, application, arguments):
+        client = self
+
+        class Handle:
+            request_id = "req-1"
+
+            def status(self):
+                return object()
+
+            def get(self):
+                raise AssertionError("never completes")
+
+        client.handle = Handle()
+        return client.handle
+
+    def cancel(self, application, request_id):
+        self.cancelled.append(request_id)
+
+
+def test_queue_provider_cancels_outstanding_request():
+    provider = FalQueueProvider(poll_interval=5, timeout=60)
+    provider._client = _QueueClient()
+    cancel_event = threading.Event()
+    threading.Timer(0.05, cancel_event.set).start()
+    with pytest.raises(GenerationCancelled):
+        provider.generate("model.png", "garment.png", cancel_event=cancel_event)
+    assert provider._client.cancelled == ["req-1"]
+
+
+def test_restart_requeues_batches_left_queued(db, user, monkeypatch):
+    batch = _reserved_batch(db, user)
+    requeued = []
+    monkeypatch.setattr(image_tasks, "enqueue_generation",
+                        lambda batch_id, user_id, trace_context=None, combinations=0:
+                        requeued.append((batch_id, user_id, combinations)))
+
+    assert recover_queued_batches() >= 1
+    assert (batch.id, user.id, 6) in requeued
+
+
+def test_batch_claimed_by_another_runner_is_left_alone(db, user):
+    batch = _reserved_batch(db, user, status="processing")
+
+    assert generate_images_task(batch.id, user.id, provider=_BlockingProvider()) == {}
+    db.expire_all()
+    assert db.get(Batch, batch.id).status == "processing"
+    assert db.get(Batch, batch.id).tokens_refunded == 0
@@ -0,0 +1,51 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from app.models import Batch, GarmentImage, GeneratedImage, Model, ModelImage, Task
+from app.services.dedupe import find_near_duplicate, find_previous_garment, hamming_distance
+from app.services.preprocessing import normalize_image
+
+
+def _garment_photo(size, color):
+    img = Image.new("RGB", size, (240, 240, 240))
+    draw = ImageDraw.Draw(img)
+    w, h = size
+    draw.rectangle([w // 4, h // 6, 3 * w // 4, 5 * h // 6], fill=color)
+    draw.ellipse([w // 3, h // 3, 2 * w // 3, h // 2], fill=(20, 20, 20))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+def test_reencoded_copy_is_a_near_duplicate():
+    original = normalize_image(_garment_photo((3000, 4000), (180, 30, 40)), max_edge=2048)
+    resized = normalize_image(_garment_photo((750, 1000), (180, 30, 40)), max_edge=2048)
+    assert hamming_distance(original["phash"], resized["phash"]) <= 4
+
+
+def test_find_near_duplicate_respects_distance():
+    first = GarmentImage(phash="ffff0000ffff0000")
+    assert find_near_duplicate("ffff0000ffff0001", [first], max_distance=4) is first
+    assert find_near_duplicate("0000ffff0000ffff", [first], max_distance=4) is None
+    assert find_near_duplicate(None, [first], max_distance=4) is None
+
+
+def test_find_previous_garment_skips_garments_missing_poses(db, user):
+    model = Model(name="two-poses", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add_all([ModelImage(model_id=model.id, url=f"blobs/{pose}.png", pose_label=pose) for pose in ("front", "side")])
+    task = Task(user_id=user.id, model_id=model.id, name="reuse")
+    db.add(task)
+    db.flush()
+    garment = GarmentImage(batch=Batch(task_id=task.id, status="failed"), image_url="blobs/g.png", phash="0f0f0f0f0f0f0f0f")
+    garment.generated_images.append(GeneratedImage(model_id=model.id, output_url="blobs/front.png", pose_label="front"))
+    db.add(garment)
+    db.commit()
+
+    assert find_previous_garment(db, user.id, model.id, garment.phash) is None
+
+    garment.generated_images.append(GeneratedImage(model_id=model.id, output_url="blobs/side.png", pose_label="side"))
+    db.commit()
+    assert find_previous_garment(db, user.id, model.id, garment.phash).id == garment.id
@@ -0,0 +1,74 @@
+from app.core.etags import etag_matches
+from app.models import Batch, GarmentImage, GeneratedImage, Model, Task
+
+
+def _batch(db, user, status="done"):
+    model = Model(name="etag", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    task = Task(user_id=user.id, model_id=model.id, name="etag")
+    db.add(task)
+    db.flush()
+    batch = Batch(task_id=task.id, status=status)
+    db.add(batch)
+    db.flush()
+    garment = GarmentImage(batch_id=batch.id, image_url="blobs/garment.png")
+    db.add(garment)
+    db.commit()
+    return task, batch, garment
+
+
+def _output(garment, model_id):
+    return GeneratedImage(garment_image_id=garment.id, model_id=model_id, output_url="blobs/out.png", pose_label="front")
+
+
+def test_unchanged_batch_answers_304(client, db, user):
+    _, batch, _ = _batch(db, user)
+
+    first = client.get(f"/batches/{batch.id}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = client.get(f"/batches/{batch.id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+    assert client.get(f"/batches/{batch.id}", headers={"If-None-Match": '"batch-0-1-done"'}).status_code == 200
+
+
+def test_batch_etag_follows_status_and_children(client, db, user):
+    task, batch, garment = _batch(db, user, status="processing")
+    etag = client.get(f"/batches/{batch.id}").headers["etag"]
+
+    db.add(_output(garment, task.model_id))
+    db.commit()
+    after_output = client.get(f"/batches/{batch.id}", headers={"If-None-Match": etag})
+    assert after_output.status_code == 200
+    assert after_output.headers["etag"] != etag
+
+    batch.status = "done"
+    db.commit()
+    done = client.get(f"/batches/{batch.id}", headers={"If-None-Match": after_output.headers["etag"]})
+    assert done.status_code == 200
+    assert done.json()["status"] == "done"
+
+
+def test_task_batch_tree_answers_304_until_a_batch_changes(client, db, user):
+    task, batch, garment = _batch(db, user)
+    first = client.get(f"/tasks/{task.id}/batches/")
+    etag = first.headers["etag"]
+    assert [b["batch_id"] for b in first.json()] == [batch.id]
+
+    assert client.get(f"/tasks/{task.id}/batches/", headers={"If-None-Match": etag}).status_code == 304
+
+    db.add(_output(garment, task.model_id))
+    db.commit()
+    changed = client.get(f"/tasks/{task.id}/batches/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()[0]["garment_images"][0]["generated_images"][0]["output_url"] == "blobs/out.png"
+
+
+def test_if_none_match_lists_and_weak_tags():
+    assert etag_matches('"a", W/"batch-1-2-done"', '"batch-1-2-done"')
+    assert etag_matches("*", '"batch-1-2-done"')
+    assert not etag_matches(None, '"batch-1-2-done"')
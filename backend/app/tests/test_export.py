@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+from app.models import Batch, GarmentImage, GeneratedImage, Model, Task
+from app.models.user import User
+from app.services.export import COLUMNS, export_query, stream_export
+
+
+def _task_with_outputs(db, user, outputs, name="export"):
+    model = Model(name=name, description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    task = Task(user_id=user.id, model_id=model.id, name=name)
+    db.add(task)
+    db.flush()
+    batch = Batch(task_id=task.id, status="done", created_at="2026-10-01T10:00:00")
+    db.add(batch)
+    db.flush()
+    garment = GarmentImage(batch_id=batch.id, image_url=f"blobs/{name}.png")
+    db.add(garment)
+    db.flush()
+    db.add_all([
+        GeneratedImage(garment_image_id=garment.id, model_id=model.id, pose_label=f"pose-{n}",
+                       output_url=f"blobs/{name}-out-{n}.png")
+        for n in range(outputs)
+    ])
+    db.commit()
+    return task
+
+
+def test_task_export_streams_csv(client, db, user, auth_headers):
+    task = _task_with_outputs(db, user, 3)
+    _task_with_outputs(db, user, 2, name="other-task")
+
+    response = client.get(f"/tasks/{task.id}/export/", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["pose_label"] for row in rows] == ["pose-0", "pose-1", "pose-2"]
+    assert rows[0]["task_id"] == str(task.id)
+    assert rows[0]["garment_url"] == "blobs/export.png"
+    assert rows[0]["garment_source_url"] == ""
+    assert rows[0]["created_at"]
+
+
+def test_export_jsonl_by_date_range(client, db, user, auth_headers):
+    _task_with_outputs(db, user, 2)
+    old = _task_with_outputs(db, user, 1, name="old")
+    for image in db.query(GeneratedImage).join(GarmentImage).join(Batch).filter(Batch.task_id == old.id):
+        image.created_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    db.commit()
+
+    since = (datetime.now(timezone.utc) - timedelta(days=1)).replace(tzinfo=None).isoformat()
+    response = client.get("/tasks/export/", params={"format": "jsonl", "since": since}, headers=auth_headers)
+
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["output_url"] for row in rows] == ["blobs/export-out-0.png", "blobs/export-out-1.png"]
+    assert set(rows[0]) == set(COLUMNS)
+
+
+def test_export_is_scoped_to_the_owner(client, db, user, auth_headers):
+    other = User(email="other-export@example.com", password_hash="password")
+    db.add(other)
+    db.flush()
+    theirs = _task_with_outputs(db, other, 1, name="theirs")
+
+    assert client.get(f"/tasks/{theirs.id}/export/", headers=auth_headers).status_code == 404
+    assert client.get("/tasks/export/", params={"format": "jsonl"}, headers=auth_headers).text == ""
+
+
+def test_stream_export_sends_a_chunk_per_partition(db, user):
+    task = _task_with_outputs(db, user, 5)
+
+    chunks = list(stream_export(db, export_query(user.id, task_id=task.id), "jsonl", yield_per=2))
+
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
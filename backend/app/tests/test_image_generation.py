@@ -0,0 +1,75 @@
+import random
+
+import httpx
+import pytest
+
+from app.models import Batch, GarmentImage, GeneratedImage, Model, ModelImage, Task
+from app.services.blob_store import blob_store, parse_blob_name
+from app.services.image_generation import FakeTryOnProvider, parse_latency
+from app.workers.image_tasks import generate_images_task
+
+
+def _fake(**kwargs):
+    return FakeTryOnProvider(sleep=lambda seconds: None, **kwargs)
+
+
+def test_latency_distributions():
+    rng = random.Random(1)
+    assert parse_latency("fixed:0.5")(rng) == 0.5
+    assert 1.0 <= parse_latency("uniform:1:2")(rng) <= 2.0
+    assert parse_latency("lognormal:1.5:0.4")(rng) > 0
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1")
+
+
+def test_fake_provider_writes_synthetic_image():
+    result = _fake().generate("https://models/a.png", "blobs/garment.jpg")
+    digest, media_type = parse_blob_name(result.image_url.split("/", 1)[1])
+    assert media_type == "image/png"
+    assert blob_store.exists(digest)
+
+
+def test_fake_provider_is_deterministic():
+    pairs = [(f"model-{i}", f"garment-{i}") for i in range(50)]
+
+    def outcomes(provider):
+        results = []
+        for pair in pairs:
+            try:
+                results.append(provider.generate(*pair).image_url)
+            except httpx.HTTPStatusError as e:
+                results.append(e.response.status_code)
+        return results
+
+    spec = parse_latency("uniform:0:3")
+    first = outcomes(_fake(latency=spec, failure_rate=0.3, throttle_rate=0.1, seed=4))
+    second = outcomes(_fake(latency=spec, failure_rate=0.3, throttle_rate=0.1, seed=4))
+    assert first == second
+    assert 503 in first and 429 in first
+    assert any(isinstance(outcome, str) for outcome in first)
+
+
+def test_worker_runs_on_fake_provider(db, user):
+    model = Model(name="fake", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add_all([
+        ModelImage(model_id=model.id, url="blobs/front.png", pose_label="front"),
+        ModelImage(model_id=model.id, url="blobs/side.png", pose_label="side"),
+    ])
+    task = Task(user_id=user.id, model_id=model.id, name="load test")
+    db.add(task)
+    db.flush()
+    batch = Batch(task_id=task.id, status="queued")
+    db.add(batch)
+    db.flush()
+    db.add_all([GarmentImage(batch_id=batch.id, image_url=f"blobs/garment-{i}.jpg") for i in range(3)])
+    db.commit()
+
+    generated = generate_images_task(batch.id, user.id, provider=_fake())
+
+    assert len(generated) == 6
+    db.expire_all()
+    assert db.get(Batch, batch.id).status == "done"
+    assert db.query(GeneratedImage).join(GarmentImage).filter(GarmentImage.batch_id == batch.id).count() == 6
+    assert user.token_balance == 94
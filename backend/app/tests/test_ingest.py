@@ -0,0 +1,210 @@
+import asyncio
+import io
+import json
+import random
+import zipfile
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.models import Batch, Model, ModelImage, Task
+from app.models.user import User
+from app.services import ingest
+from app.services.ingest import iter_url_items, iter_zip_entries
+
+
+class _Unseekable(io.RawIOBase):
+    """A write-only stream, so zipfile writes data descriptors the way streaming clients do."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+
+def _image(seed: int) -> bytes:
+    pixels = random.Random(seed).randbytes(48 * 64 * 3)
+    out = io.BytesIO()
+    Image.frombytes("RGB", (48, 64), pixels).save(out, format="PNG")
+    return out.getvalue()
+
+
+def _zip(entries, streamed=True) -> bytes:
+    target = _Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(target, "w") as archive:
+        for name, data, method in entries:
+            archive.writestr(zipfile.ZipInfo(name), data, compress_type=method)
+    return bytes(target.buffer) if streamed else target.getvalue()
+
+
+async def _chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def _collect(items):
+    return [item async for item in items]
+
+
+@pytest.mark.parametrize("streamed", [True, False])
+def test_zip_entries_read_from_small_chunks(streamed):
+    archive = _zip([
+        ("shirts/", b"", zipfile.ZIP_STORED),
+        ("shirts/a.png", _image(1), zipfile.ZIP_DEFLATED),
+        ("b.png", _image(2), zipfile.ZIP_STORED),
+        ("big.png", b"x" * 40000, zipfile.ZIP_DEFLATED),
+    ], streamed=streamed)
+
+    items = asyncio.run(_collect(iter_zip_entries(_chunks(archive, 7), max_entry_bytes=32768)))
+
+    assert [(item.name, item.data, item.error) for item in items[:2]] == [
+        ("shirts/a.png", _image(1), None), ("b.png", _image(2), None),
+    ]
+    assert items[2].name == "big.png" and items[2].data is None and "larger than" in items[2].error
+
+
+def test_zip_garbage_is_rejected():
+    with pytest.raises(ingest.IngestError):
+        asyncio.run(_collect(iter_zip_entries(_chunks(b"not a zip at all", 4), max_entry_bytes=4096)))
+
+
+def test_url_list_downloads_each_image(fake_dns):
+    fake_dns["cdn.example.com"] = "93.184.216.34"
+
+    def handler(request):
+        if request.url.path == "/missing.png":
+            return httpx.Response(404)
+        return httpx.Response(200, content=_image(int(request.url.path.strip("/").split(".")[0])))
+
+    lines = b"\n".join([
+        b'"https://cdn.example.com/1.png"',
+        json.dumps({"url": "https://cdn.example.com/2.png", "sku": "A-2"}).encode(),
+        b'"https://cdn.example.com/missing.png"',
+        b"",
+        b'"ftp://cdn.example.com/3.png"',
+    ])
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await _collect(iter_url_items(_chunks(lines, 10), 1 << 20, concurrency=2, client=client))
+
+    items = {item.name: item for item in asyncio.run(run())}
+    assert items["https://cdn.example.com/1.png"].data == _image(1)
+    assert items["https://cdn.example.com/2.png"].data == _image(2)
+    assert "404" in items["https://cdn.example.com/missing.png"].error
+    assert "http(s) URL" in items['"ftp://cdn.example.com/3.png"'].error
+
+
+def test_url_list_refuses_internal_addresses_and_redirects_to_them(fake_dns):
+    fake_dns["cdn.example.com"] = "93.184.216.34"
+    fake_dns["intranet.example.com"] = "10.0.0.5"
+    requested = []
+
+    def handler(request):
+        requested.append(str(request.url))
+        if request.url.path == "/to-metadata.png":
+            return httpx.Response(302, headers={"Location": "http://169.254.169.254/latest/meta-data/"})
+        if request.url.path == "/to-intranet.png":
+            return httpx.Response(301, headers={"Location": "http://intranet.example.com/1.png"})
+        return httpx.Response(200, content=_image(1))
+
+    lines = b"\n".join([
+        b'"http://127.0.0.1:8000/1.png"',
+        b'"http://intranet.example.com/1.png"',
+        b'"https://cdn.example.com/to-metadata.png"',
+        b'"https://cdn.example.com/to-intranet.png"',
+    ])
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await _collect(iter_url_items(_chunks(lines, 10), 1 << 20, concurrency=2, client=client))
+
+    items = asyncio.run(run())
+    assert len(items) == 4
+    assert all(item.data is None and item.error == "download failed: not a public URL" for item in items)
+    assert sorted(requested) == ["https://cdn.example.com/to-intranet.png", "https://cdn.example.com/to-metadata.png"]
+
+
+@pytest.fixture
+def ingest_task(db, user, monkeypatch):
+    monkeypatch.setattr(settings, "GARMENT_STORAGE", "blob")
+    queued = []
+    monkeypatch.setattr(ingest, "enqueue_generation",
+                        lambda batch_id, user_id, trace_context=None, combinations=0: queued.append(batch_id))
+    model = Model(name="catalogue", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add_all([
+        ModelImage(model_id=model.id, url="blobs/front.png", pose_label="front"),
+        ModelImage(model_id=model.id, url="blobs/side.png", pose_label="side"),
+    ])
+    task = Task(user_id=user.id, model_id=model.id, name="catalogue")
+    db.add(task)
+    db.commit()
+    return task, queued
+
+
+def _post_zip(client, task, archive, headers, batch_size):
+    return client.post("/batches/ingest", params={"task_id": task.id, "batch_size": batch_size}, content=archive,
+                       headers={**headers, "Content-Type": "application/zip"})
+
+
+def test_zip_ingest_chunks_into_batches(client, db, user, auth_headers, ingest_task):
+    task, queued = ingest_task
+    archive = _zip([(f"sku-{n}.png", _image(n), zipfile.ZIP_DEFLATED) for n in range(5)]
+                   + [("README.txt", b"catalogue export", zipfile.ZIP_DEFLATED)])
+
+    response = _post_zip(client, task, archive, auth_headers, batch_size=2)
+
+    assert response.status_code == 200
+    summary = response.json()
+    assert sorted(batch["garments"] for batch in summary["batches"]) == [1, 2, 2]
+    assert summary["images"] == {"received": 6, "batched": 5, "duplicates": 0, "failed": 0, "skipped": 1}
+    assert summary["stopped"] is None
+    assert sorted(queued) == sorted(batch["batch_id"] for batch in summary["batches"])
+    db.expire_all()
+    assert db.get(User, user.id).token_balance == 100 - 5 * 2
+    assert all(db.get(Batch, batch_id).status == "queued" for batch_id in queued)
+
+
+def test_zip_ingest_collapses_duplicates_and_reports_bad_images(client, db, user, auth_headers, ingest_task):
+    task, _ = ingest_task
+    archive = _zip([
+        ("a.png", _image(1), zipfile.ZIP_DEFLATED),
+        ("a-again.png", _image(1), zipfile.ZIP_DEFLATED),
+        ("broken.png", b"not an image", zipfile.ZIP_DEFLATED),
+    ])
+
+    summary = _post_zip(client, task, archive, auth_headers, batch_size=10).json()
+
+    assert [batch["duplicate_garments"] for batch in summary["batches"]] == [1]
+    assert summary["batches"][0]["tokens_reserved"] == 2
+    assert [failure["name"] for failure in summary["failures"]] == ["broken.png"]
+
+
+def test_ingest_stops_when_tokens_run_out(client, db, user, auth_headers, ingest_task):
+    task, _ = ingest_task
+    db.get(User, user.id).token_balance = 4
+    db.commit()
+    archive = _zip([(f"sku-{n}.png", _image(n), zipfile.ZIP_DEFLATED) for n in range(4)])
+
+    summary = _post_zip(client, task, archive, auth_headers, batch_size=2).json()
+
+    assert len(summary["batches"]) == 1
+    assert summary["stopped"]["reason"] == "insufficient_tokens"
+    db.expire_all()
+    assert db.get(User, user.id).token_balance == 0
+
+
+def test_ingest_rejects_unknown_content_type(client, auth_headers, ingest_task):
+    task, _ = ingest_task
+    response = client.post("/batches/ingest", params={"task_id": task.id}, content=b"{}",
+                           headers={**auth_headers, "Content-Type": "application/json"})
+    assert response.status_code == 415
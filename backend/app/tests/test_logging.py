@@ -0,0 +1,51 @@
+import io
+import json
+import logging
+import random
+
+from app.core import logging_config
+from app.core.config import settings
+from app.core.logging_config import SamplingFilter, bind_log_context, parse_sampling, setup_logging
+
+
+def _record(name, level=logging.INFO):
+    return logging.LogRecord(name, level, __file__, 1, "message", (), None)
+
+
+def test_sampling_by_category():
+    sampler = SamplingFilter(parse_sampling("app.workers=0,app.workers.image_tasks=0.5"), rng=random.Random(3))
+    assert sampler.rate_for("app.workers.image_tasks") == 0.5
+    assert sampler.rate_for("app.workers.other") == 0.0
+    assert sampler.rate_for("app.api.batches") == 1.0
+    assert not sampler.filter(_record("app.workers.other"))
+    assert sampler.filter(_record("app.workers.other", logging.WARNING))
+    kept = sum(sampler.filter(_record("app.workers.image_tasks")) for _ in range(1000))
+    assert 400 < kept < 600
+
+
+def test_json_lines_carry_context_and_extras(monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(settings, "LOG_LEVEL", "DEBUG")
+    monkeypatch.setattr(settings, "LOG_SAMPLING", "app.tests.noisy=0")
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    try:
+        setup_logging(stream)
+        with bind_log_context(batch_id=7, user_id=3):
+            logging.getLogger("app.tests.logging").info("generated %d images", 4, extra={"pose_label": "front"})
+            logging.getLogger("app.tests.noisy").debug("dropped")
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                logging.getLogger("app.tests.logging").exception("failed")
+    finally:
+        logging_config.shutdown_logging()
+        root.handlers[:] = handlers
+        root.setLevel(level)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == ["generated 4 images", "failed"]
+    assert lines[0]["batch_id"] == 7 and lines[0]["user_id"] == 3
+    assert lines[0]["pose_label"] == "front"
+    assert lines[0]["logger"] == "app.tests.logging"
+    assert "ValueError: boom" in lines[1]["exc_info"]
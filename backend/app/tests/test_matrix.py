@@ -0,0 +1,113 @@
+import io
+import random
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.models import GarmentImage, GeneratedImage, Model, ModelImage, Task
+from app.models.user import User
+from app.services import image_generation
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    monkeypatch.setattr(settings, "TRYON_PROVIDER", "fake")
+    monkeypatch.setattr(settings, "GARMENT_STORAGE", "blob")
+    monkeypatch.setattr(settings, "FAKE_TRYON_LATENCY", "fixed:0")
+    monkeypatch.setattr(image_generation, "_providers", {})
+
+
+def _model(db, owner_id, name, poses):
+    model = Model(name=name, description="", user_id=owner_id)
+    db.add(model)
+    db.flush()
+    db.add_all([ModelImage(model_id=model.id, url=f"blobs/{name}-{pose}.png", pose_label=pose) for pose in poses])
+    return model
+
+
+def _garment(seed: int):
+    out = io.BytesIO()
+    Image.frombytes("RGB", (48, 64), random.Random(seed).randbytes(48 * 64 * 3)).save(out, format="PNG")
+    return ("files", (f"garment-{seed}.png", out.getvalue(), "image/png"))
+
+
+def test_matrix_batch_generates_every_model_once(client, db, user, auth_headers, wait_for_batch, offline):
+    tall = _model(db, user.id, "tall", ["front", "side"])
+    petite = _model(db, user.id, "petite", ["front"])
+    task = Task(user_id=user.id, model_id=tall.id, name="matrix")
+    db.add(task)
+    db.commit()
+
+    response = client.post(
+        "/batches/",
+        data={"task_id": str(task.id), "model_ids": [str(tall.id), str(petite.id)]},
+        files=[_garment(1), _garment(2)],
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200, response.text
+    batch = response.json()
+    # 2 garments × (2 + 1) poses
+    assert batch["tokens_reserved"] == 6
+    assert batch["models"] == [
+        {"model_id": tall.id, "poses": 2, "tokens_reserved": 4},
+        {"model_id": petite.id, "poses": 1, "tokens_reserved": 2},
+    ]
+
+    wait_for_batch(batch["id"])
+    progress = client.get(f"/batches/{batch['id']}/models").json()
+    assert progress["status"] == "done"
+    assert [(m["model_id"], m["expected"], m["generated"], m["failed"]) for m in progress["models"]] == [
+        (tall.id, 4, 4, 0), (petite.id, 2, 2, 0),
+    ]
+    # One garment upload per garment, shared by both models
+    assert db.query(GarmentImage).filter(GarmentImage.batch_id == batch["id"]).count() == 2
+    assert db.query(GeneratedImage).join(GarmentImage).filter(GarmentImage.batch_id == batch["id"]).count() == 6
+    db.expire_all()
+    assert db.get(User, user.id).token_balance == 100 - 6
+
+
+def test_matrix_batch_rejects_someone_elses_model(client, db, user, auth_headers, offline):
+    other = User(email="other-matrix@example.com", password_hash="password")
+    db.add(other)
+    db.flush()
+    mine = _model(db, user.id, "mine", ["front"])
+    theirs = _model(db, other.id, "theirs", ["front"])
+    task = Task(user_id=user.id, model_id=mine.id, name="matrix")
+    db.add(task)
+    db.commit()
+
+    response = client.post("/batches/", data={"task_id": str(task.id), "model_ids": [str(mine.id), str(theirs.id)]},
+                           files=[_garment(3)], headers=auth_headers)
+
+    assert response.status_code == 404
+    assert str(theirs.id) in response.json()["detail"]
+    db.expire_all()
+    assert db.get(User, user.id).token_balance == 100
+
+
+def test_plain_batch_reuses_only_its_models_outputs_from_a_matrix_batch(client, db, user, auth_headers,
+                                                                       wait_for_batch, offline):
+    tall = _model(db, user.id, "tall", ["front", "side"])
+    petite = _model(db, user.id, "petite", ["front"])
+    matrix_task = Task(user_id=user.id, model_id=tall.id, name="matrix")
+    petite_task = Task(user_id=user.id, model_id=petite.id, name="petite")
+    db.add_all([matrix_task, petite_task])
+    db.commit()
+    response = client.post("/batches/", data={"task_id": str(matrix_task.id), "model_ids": [str(tall.id), str(petite.id)]},
+                           files=[_garment(4)], headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert wait_for_batch(response.json()["id"]).status == "done"
+
+    for task, model in ((matrix_task, tall), (petite_task, petite)):
+        response = client.post("/batches/", data={"task_id": str(task.id)}, files=[_garment(4)], headers=auth_headers)
+        assert response.status_code == 200, response.text
+        batch = response.json()
+        assert batch["tokens_reserved"] == 0
+        wait_for_batch(batch["id"])
+        outputs = db.query(GeneratedImage).join(GarmentImage).filter(GarmentImage.batch_id == batch["id"]).all()
+        assert {o.model_id for o in outputs} == {model.id}
+        assert len(outputs) == len(model.model_images)
+    db.expire_all()
+    assert db.get(User, user.id).token_balance == 100 - 3
@@ -0,0 +1,49 @@
+from prometheus_client import REGISTRY
+
+from app.models import Batch, GarmentImage, Model, ModelImage, Task
+from app.services.image_generation import FakeTryOnProvider
+from app.workers.image_tasks import generate_images_task
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint_exposes_pool_and_http_metrics(client):
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "vestureai_db_pool_checked_out" in response.text
+    assert 'vestureai_http_requests_total{app_name="vestureai",method="GET",path="/",status_code="200"}' in response.text
+
+
+def test_worker_records_stage_metrics(db, user):
+    model = Model(name="metrics", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add(ModelImage(model_id=model.id, url="blobs/front.png", pose_label="front"))
+    task = Task(user_id=user.id, model_id=model.id, name="metrics")
+    db.add(task)
+    db.flush()
+    batch = Batch(task_id=task.id, status="queued")
+    db.add(batch)
+    db.flush()
+    db.add_all([GarmentImage(batch_id=batch.id, image_url=f"blobs/metrics-{i}.jpg") for i in range(2)])
+    db.commit()
+
+    before = {
+        "success": _value("vestureai_generation_combinations_total", outcome="success"),
+        "tokens": _value("vestureai_tokens_consumed_total"),
+        "inference": _value("vestureai_provider_inference_seconds_count", provider="fake"),
+        "writes": _value("vestureai_db_write_seconds_count"),
+    }
+
+    generate_images_task(batch.id, user.id, provider=FakeTryOnProvider(sleep=lambda seconds: None))
+
+    assert _value("vestureai_generation_combinations_total", outcome="success") - before["success"] == 2
+    assert _value("vestureai_tokens_consumed_total") - before["tokens"] == 2
+    assert _value("vestureai_provider_inference_seconds_count", provider="fake") - before["inference"] == 2
+    assert _value("vestureai_db_write_seconds_count") - before["writes"] == 2
+    assert _value("vestureai_generation_queue_depth") == 0
+    assert _value("vestureai_provider_requests_in_flight") == 0
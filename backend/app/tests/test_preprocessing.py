@@ -0,0 +1,38 @@
+import io
+
+from PIL import Image
+
+from app.services.preprocessing import normalize_image
+
+
+def _encode(img, fmt, **kwargs):
+    out = io.BytesIO()
+    img.save(out, format=fmt, **kwargs)
+    return out.getvalue()
+
+
+def test_caps_long_edge_and_keeps_aspect_ratio():
+    data = _encode(Image.new("RGB", (4000, 3000), (200, 10, 10)), "JPEG")
+    result = normalize_image(data, max_edge=1000)
+    assert (result["width"], result["height"]) == (1000, 750)
+    assert result["content_type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(result["data"])).size == (1000, 750)
+
+
+def test_strips_metadata_and_applies_orientation():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90° clockwise on display
+    exif[0x010F] = "PhoneMaker"
+    data = _encode(Image.new("RGB", (300, 200)), "JPEG", exif=exif)
+    result = normalize_image(data, max_edge=2048)
+    normalized = Image.open(io.BytesIO(result["data"]))
+    assert normalized.size == (200, 300)
+    assert not normalized.getexif()
+
+
+def test_flattens_transparency_for_jpeg():
+    data = _encode(Image.new("RGBA", (50, 50), (0, 0, 0, 0)), "PNG")
+    result = normalize_image(data, max_edge=2048)
+    normalized = Image.open(io.BytesIO(result["data"]))
+    assert normalized.mode == "RGB"
+    assert normalized.getpixel((25, 25))[0] > 240
@@ -0,0 +1,101 @@
+import httpx
+import pytest
+
+from app.services.rate_limit import (
+    FileBackend,
+    InProcessBackend,
+    RateGovernor,
+    RateLimited,
+    parse_retry_after,
+    retry_after_from_error,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _throttled(retry_after="2"):
+    request = httpx.Request("POST", "https://queue.fal.run/easel-ai/fashion-tryon")
+    response = httpx.Response(429, headers={"Retry-After": retry_after}, request=request)
+    try:
+        raise httpx.HTTPStatusError("429", request=request, response=response)
+    except httpx.HTTPStatusError as exc:
+        # Mirrors fal_client, which re-raises as FalClientError from the httpx error
+        try:
+            raise RuntimeError("rate limited") from exc
+        except RuntimeError as wrapped:
+            return wrapped
+
+
+def _governor(clock, rate=2.0, burst=2, backend=None, **kwargs):
+    return RateGovernor(rate=rate, burst=burst, backend=backend or InProcessBackend(4),
+                        clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_parse_retry_after_forms():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert retry_after_from_error(_throttled("7")) == 7.0
+    assert retry_after_from_error(ValueError("boom")) is None
+
+
+def test_token_bucket_spaces_calls_after_burst():
+    clock = FakeClock()
+    governor = _governor(clock)
+    for _ in range(4):
+        governor.call(lambda: None)
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_throttle_pauses_and_retries_without_losing_the_call():
+    clock = FakeClock()
+    governor = _governor(clock)
+    attempts = []
+
+    def submit():
+        attempts.append(clock.now)
+        if len(attempts) == 1:
+            raise _throttled("2")
+        return "ok"
+
+    assert governor.call(submit) == "ok"
+    assert attempts[1] - attempts[0] >= 2.0
+    assert governor.multiplier == pytest.approx(0.55)
+
+
+def test_gives_up_after_max_throttle_retries():
+    clock = FakeClock()
+    governor = _governor(clock, max_throttle_retries=1)
+
+    def submit():
+        raise _throttled("1")
+
+    with pytest.raises(RateLimited):
+        governor.call(submit)
+
+
+def test_other_errors_propagate_untouched():
+    governor = _governor(FakeClock())
+    with pytest.raises(ValueError):
+        governor.call(lambda: (_ for _ in ()).throw(ValueError("bad input")))
+
+
+def test_file_backend_shares_throttle_between_governors(tmp_path):
+    clock = FakeClock()
+    first = _governor(clock, backend=FileBackend(str(tmp_path), 2))
+    second = _governor(clock, backend=FileBackend(str(tmp_path), 2))
+    first.record_throttle(3.0)
+    second.call(lambda: None)
+    assert clock.sleeps[0] == pytest.approx(3.0)
+    assert second.multiplier == pytest.approx(0.55)
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from app.core import replicas
+from app.core.replicas import ReplicaRouter
+from app.database import Base
+from app.models import Model
+from app.models.plan import Plan
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """A second SQLite file standing in for a replica that has none of the primary's rows."""
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    seed = create_engine(url)
+    Base.metadata.create_all(bind=seed)
+    with seed.begin() as connection:
+        connection.execute(Plan.__table__.insert(), {"name": "replica-only", "price": 0, "limits": {}})
+    seed.dispose()
+
+    lag = {"seconds": 0.0}
+    router = ReplicaRouter([url], lag_check_seconds=0, lag_probe=lambda connection: lag["seconds"])
+    monkeypatch.setattr(replicas, "_router", router)
+    yield lag
+    asyncio.run(router.dispose())
+
+
+def _plan_names(client, **kwargs):
+    return {plan["name"] for plan in client.get("/plans/", **kwargs).json()}
+
+
+def test_reads_go_to_replica_until_it_lags(replica):
+    from app.main import app
+
+    client = TestClient(app)
+    assert "replica-only" in _plan_names(client)
+
+    replica["seconds"] = 30.0
+    assert "replica-only" not in _plan_names(client)
+
+
+def test_explicit_primary_read(replica):
+    from app.main import app
+
+    assert "replica-only" not in _plan_names(TestClient(app), headers={"X-Read-Consistency": "primary"})
+
+
+def test_reads_follow_own_writes_to_primary(replica, db, user, auth_headers):
+    from app.main import app
+
+    model = Model(name="just-made", description="", user_id=user.id)
+    db.add(model)
+    db.commit()
+    client = TestClient(app)
+    assert [m["name"] for m in client.get("/models/", headers=auth_headers).json()] == []
+
+    assert client.post("/tasks/", json={"model_id": model.id, "name": "shoot", "pose": "front"}, headers=auth_headers).status_code == 200
+    assert [m["name"] for m in client.get("/models/", headers=auth_headers).json()] == ["just-made"]
+
+    # Same user on a client without the cookie, e.g. another tab: still this process's record
+    assert [m["name"] for m in TestClient(app).get("/models/", headers=auth_headers).json()] == ["just-made"]
+    # Other users keep reading from the replica
+    assert "replica-only" in _plan_names(TestClient(app))
+
+
+def test_unreachable_replica_falls_back_to_primary(tmp_path):
+    router = ReplicaRouter([f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"])
+    router.check_lag()
+    assert router.replicas[0].lag_seconds == float("inf")
+    assert router.choose(None) is None
+    asyncio.run(router.dispose())
@@ -0,0 +1,139 @@
+import random
+
+import httpx
+import pytest
+
+from app.services.resilience import (
+    CIRCUIT_OPEN,
+    PERMANENT,
+    TRANSIENT,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryError,
+    RetryPolicy,
+    call_with_retry,
+    classify_error,
+)
+
+
+def _http_error(status):
+    request = httpx.Request("POST", "https://queue.fal.run/easel-ai/fashion-tryon")
+    response = httpx.Response(status, request=request)
+    return httpx.HTTPStatusError(str(status), request=request, response=response)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_classify_error():
+    assert classify_error(_http_error(503)) == TRANSIENT
+    assert classify_error(_http_error(422)) == PERMANENT
+    assert classify_error(httpx.ConnectError("reset")) == TRANSIENT
+    assert classify_error(ValueError("no image")) == PERMANENT
+    assert classify_error(CircuitOpenError(3)) == CIRCUIT_OPEN
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(max_attempts=10, base_delay=1.0, max_delay=8.0, rng=random.Random(7))
+    delays = [policy.delay(attempt) for attempt in range(1, 8)]
+    assert all(0 <= d <= min(8.0, 2 ** (n - 1)) for n, d in enumerate(delays, start=1))
+    assert len(set(delays)) == len(delays)
+
+
+def test_retries_transient_then_succeeds():
+    calls = []
+    sleeps = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _http_error(502)
+        return "image"
+
+    policy = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=5.0)
+    assert call_with_retry(flaky, policy, sleep=sleeps.append) == ("image", 3)
+    assert len(sleeps) == 2
+
+
+def test_permanent_error_is_not_retried():
+    policy = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=5.0)
+    with pytest.raises(RetryError) as info:
+        call_with_retry(lambda: (_ for _ in ()).throw(_http_error(400)), policy, sleep=lambda s: None)
+    assert info.value.attempts == 1
+    assert info.value.kind == PERMANENT
+
+
+def test_breaker_opens_on_error_spike_and_recovers_after_probe():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=4, window_seconds=60, open_seconds=30, clock=clock)
+    breaker.record_success()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now = 31
+    breaker.before_call()  # the single half-open probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_open_circuit_waits_instead_of_calling():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=1, window_seconds=60, open_seconds=10, clock=clock)
+    breaker.record_failure()
+    calls = []
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, max_delay=0.1)
+    result = call_with_retry(lambda: calls.append(1) or "ok", policy, breaker, sleep=sleep)
+    assert result == ("ok", 2)
+    assert calls == [1]
+    assert sleeps[0] >= 10
+
+
+def test_permanently_failing_probe_does_not_wedge_the_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=1, window_seconds=60, open_seconds=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+    policy = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+    def no_image():
+        raise ValueError("Provider returned no image")
+
+    with pytest.raises(RetryError):
+        call_with_retry(no_image, policy, breaker, sleep=lambda seconds: None)
+
+    # The provider answered, so the probe closed the circuit rather than holding it
+    assert breaker.state == "closed"
+    assert call_with_retry(lambda: "ok", policy, breaker) == ("ok", 1)
+
+
+def test_probe_interrupted_without_outcome_reopens():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=1, window_seconds=60, open_seconds=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        call_with_retry(interrupted, RetryPolicy(3, 0, 0), breaker)
+
+    assert breaker.state == "open"
+    clock.now = 22
+    assert breaker.before_call() is True  # a fresh probe is allowed
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from app.models.plan import Plan
+from app.models.subscription import Subscription
+from app.services.scheduler import FairScheduler, TenantPolicy, get_tenant_policy
+
+
+def _drain(scheduler, submissions):
+    """Submit everything before any worker starts, then record dispatch order."""
+    order = []
+    lock = threading.Lock()
+
+    def job(tenant):
+        with lock:
+            order.append(tenant)
+
+    futures = [scheduler.submit(tenant, policy, job, tenant) for tenant, policy in submissions]
+    scheduler.run()
+    for future in futures:
+        future.result(timeout=5)
+    return order
+
+
+class _DeferredStart(FairScheduler):
+    """Only starts its workers when asked, so all jobs are queued first."""
+
+    def start(self):
+        pass
+
+    def run(self):
+        FairScheduler.start(self)
+
+
+def test_small_batch_is_not_starved():
+    scheduler = _DeferredStart(workers=1)
+    policy = TenantPolicy(priority=1, max_concurrency=4)
+    submissions = [(1, policy)] * 50 + [(2, policy)] * 2
+    order = _drain(scheduler, submissions)
+    scheduler.shutdown()
+    # The two-job user is served within the first few slots, not after 50
+    assert max(i for i, tenant in enumerate(order) if tenant == 2) < 5
+
+
+def test_priority_weights_share_of_dispatches():
+    scheduler = _DeferredStart(workers=1)
+    submissions = [(1, TenantPolicy(3, 4))] * 30 + [(2, TenantPolicy(1, 4))] * 30
+    order = _drain(scheduler, submissions)
+    scheduler.shutdown()
+    assert order[:20].count(1) == 15
+
+
+def test_per_user_concurrency_cap():
+    scheduler = FairScheduler(workers=4)
+    running = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def job():
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.01)
+        with lock:
+            running["now"] -= 1
+
+    futures = [scheduler.submit(1, TenantPolicy(1, 2), job) for _ in range(10)]
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.shutdown()
+    assert running["peak"] == 2
+    assert scheduler.queue_depths() == {}
+
+
+def test_cancelled_jobs_are_skipped():
+    scheduler = _DeferredStart(workers=1)
+    policy = TenantPolicy(1, 1)
+    kept = scheduler.submit(1, policy, lambda: "kept")
+    dropped = scheduler.submit(1, policy, lambda: "dropped")
+    assert scheduler.queue_depths() == {1: 2}
+    assert dropped.cancel()
+    scheduler.run()
+    assert kept.result(timeout=5) == "kept"
+    scheduler.shutdown()
+    assert scheduler.queue_depths() == {}
+
+
+def test_policy_comes_from_plan_limits(db, user):
+    assert get_tenant_policy(db, user.id) == TenantPolicy(priority=1.0, max_concurrency=2)
+    plan = Plan(name="Pro", price=100, limits={"priority": 4, "max_concurrency": 6})
+    db.add(plan)
+    db.flush()
+    db.add(Subscription(user_id=user.id, plan_id=plan.id, status="active"))
+    db.commit()
+    # current_period_end defaults to now, so push it out
+    subscription = db.query(Subscription).filter(Subscription.user_id == user.id).first()
+    subscription.current_period_end = subscription.current_period_end.replace(year=2100)
+    db.commit()
+    assert get_tenant_policy(db, user.id) == TenantPolicy(priority=4.0, max_concurrency=6)
+
+
+def test_queue_endpoint(client, auth_headers):
+    response = client.get("/batches/queue", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == {"queued": 0, "running": 0}
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+# Loaded on first use by the code paths that need them, never at startup
+DEFERRED_MODULES = ("boto3", "botocore.config", "cloudinary", "requests", "httpx", "fal_client")
+# Generous, to catch an eager heavy import rather than machine-to-machine noise
+IMPORT_BUDGET_SECONDS = 4.0
+
+
+def _import_app(code: str) -> subprocess.CompletedProcess:
+    # Only what the API itself needs: no storage, email, payment or fal secrets
+    env = {
+        "PATH": os.environ.get("PATH", ""),
+        "DATABASE_URL": os.environ["DATABASE_URL"],
+        "SECRET_KEY": "test-secret",
+    }
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+
+def test_api_imports_without_integration_secrets_or_clients():
+    result = _import_app(f"import sys, app.main; print([m for m in {DEFERRED_MODULES!r} if m in sys.modules])")
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert result.stdout.strip() == "[]"
+
+
+def test_import_time_budget():
+    result = _import_app("import app.main")
+    assert result.returncode == 0, result.stderr[-2000:]
+    # -X importtime lines: "import time: self [us] | cumulative | name"
+    cumulative = next(
+        int(line.split("|")[1]) for line in result.stderr.splitlines() if line.rstrip().endswith("| app.main")
+    )
+    assert cumulative / 1e6 < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,74 @@
+import asyncio
+
+from botocore.stub import ANY, Stubber
+
+from app.services.storage import MIN_PART_SIZE, StorageService
+
+
+def test_iter_files_follows_pagination():
+    service = StorageService("test-bucket")
+    with Stubber(service.s3_client) as stubber:
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [{"Key": "a"}, {"Key": "b"}], "IsTruncated": True, "NextContinuationToken": "t1"},
+        )
+        stubber.add_response(
+            "list_objects_v2",
+            {"Contents": [{"Key": "c"}], "IsTruncated": False},
+            {"Bucket": "test-bucket", "Prefix": "garments/", "MaxKeys": 2, "ContinuationToken": "t1"},
+        )
+        assert list(service.iter_files("garments/", page_size=2)) == ["a", "b", "c"]
+
+
+def test_delete_files_batches_and_reports_failures():
+    service = StorageService("test-bucket")
+    keys = [f"k{i}" for i in range(1001)]
+    with Stubber(service.s3_client) as stubber:
+        stubber.add_response("delete_objects", {"Errors": [{"Key": "k7", "Code": "AccessDenied"}]})
+        stubber.add_response(
+            "delete_objects",
+            {},
+            {"Bucket": "test-bucket", "Delete": {"Objects": [{"Key": "k1000"}], "Quiet": True}},
+        )
+        assert service.delete_files(iter(keys)) == ["k7"]
+
+
+def test_upload_stream_sends_multipart_parts():
+    service = StorageService("test-bucket", multipart_chunksize=MIN_PART_SIZE, max_concurrency=1)
+
+    async def chunks():
+        for _ in range(12):
+            yield b"x" * (1024 * 1024)
+
+    with Stubber(service.s3_client) as stubber:
+        stubber.add_response("create_multipart_upload", {"UploadId": "u1"})
+        for part_number in (1, 2, 3):
+            stubber.add_response(
+                "upload_part",
+                {"ETag": f'"e{part_number}"'},
+                {"Bucket": "test-bucket", "Key": "big.bin", "UploadId": "u1",
+                 "PartNumber": part_number, "Body": ANY},
+            )
+        stubber.add_response(
+            "complete_multipart_upload",
+            {},
+            {"Bucket": "test-bucket", "Key": "big.bin", "UploadId": "u1",
+             "MultipartUpload": {"Parts": [{"ETag": f'"e{n}"', "PartNumber": n} for n in (1, 2, 3)]}},
+        )
+        assert asyncio.run(service.upload_stream(chunks(), "big.bin")) is True
+        stubber.assert_no_pending_responses()
+
+
+def test_upload_stream_small_body_uses_single_put():
+    service = StorageService("test-bucket")
+
+    async def chunks():
+        yield b"small"
+
+    with Stubber(service.s3_client) as stubber:
+        stubber.add_response(
+            "put_object",
+            {},
+            {"Bucket": "test-bucket", "Key": "small.jpg", "Body": b"small", "ContentType": "image/jpeg"},
+        )
+        assert asyncio.run(service.upload_stream(chunks(), "small.jpg", "image/jpeg")) is True
@@ -0,0 +1,57 @@
+import io
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from PIL import Image
+
+from app.core import tracing
+from app.core.config import settings
+from app.database import engine
+from app.models import Model, ModelImage, Task
+from app.services import image_generation
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+def _garment_jpeg():
+    out = io.BytesIO()
+    Image.new("RGB", (64, 96), (120, 30, 60)).save(out, format="JPEG")
+    return out.getvalue()
+
+
+def test_trace_context_round_trip():
+    carrier = {"traceparent": f"00-{TRACE_ID}-00f067aa0ba902b7-01"}
+    with tracing.attach_trace_context(carrier):
+        assert tracing.current_trace_context()["traceparent"].startswith(f"00-{TRACE_ID}-")
+    assert tracing.current_trace_context() == {}
+
+
+def test_batch_request_and_worker_share_one_trace(client, db, user, auth_headers, wait_for_batch, monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATIO", 1.0)
+    monkeypatch.setattr(settings, "TRYON_PROVIDER", "fake")
+    monkeypatch.setattr(settings, "GARMENT_STORAGE", "blob")
+    monkeypatch.setattr(settings, "FAKE_TRYON_LATENCY", "fixed:0")
+    monkeypatch.setattr(image_generation, "_providers", {})
+    exporter = InMemorySpanExporter()
+    tracing.setup_tracing(engine, exporter=exporter)
+
+    model = Model(name="traced", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add(ModelImage(model_id=model.id, url="blobs/front.png", pose_label="front"))
+    task = Task(user_id=user.id, model_id=model.id, name="traced")
+    db.add(task)
+    db.commit()
+
+    headers = dict(auth_headers, traceparent=f"00-{TRACE_ID}-00f067aa0ba902b7-01")
+    response = client.post("/batches/", data={"task_id": str(task.id)},
+                           files=[("files", ("shirt.jpg", _garment_jpeg(), "image/jpeg"))], headers=headers)
+    assert response.status_code == 200
+    wait_for_batch(response.json()["id"])
+    trace.get_tracer_provider().force_flush()
+
+    spans = [s for s in exporter.get_finished_spans() if format(s.context.trace_id, "032x") == TRACE_ID]
+    names = {s.name for s in spans}
+    assert "POST /batches/" in names
+    assert {"normalize_garments", "generate_images_task", "tryon.generate", "blob_store.put"} <= names
+    assert any(s.attributes.get("db.system") == "sqlite" for s in spans)
@@ -0,0 +1,69 @@
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from botocore.stub import Stubber
+
+from app.services import storage
+from app.services.storage import StorageService
+
+
+@pytest.fixture
+def s3_stub(monkeypatch):
+    """Local stand-in for MinIO: presigning is offline, object calls are stubbed."""
+    service = StorageService("test-bucket")
+    monkeypatch.setattr(storage, "_storage_service", service)
+    with Stubber(service.s3_client) as stubber:
+        yield stubber
+
+
+def _create_session(client, auth_headers, **overrides):
+    body = {"filename": "shirt.jpg", "content_type": "image/jpeg", **overrides}
+    response = client.post("/uploads/sessions", json=body, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_presigned_put_targets_minio(client, auth_headers, s3_stub):
+    ticket = _create_session(client, auth_headers)
+    url = urlparse(ticket["url"])
+    assert url.netloc == "localhost:9000"
+    assert url.path == f"/test-bucket/{ticket['object_key']}"
+    assert "X-Amz-Signature" in parse_qs(url.query)
+    assert ticket["object_key"].endswith(".jpg")
+
+
+def test_presigned_post_carries_size_policy(client, auth_headers, s3_stub):
+    ticket = _create_session(client, auth_headers, method="post")
+    assert ticket["fields"]["key"] == ticket["object_key"]
+    assert "policy" in ticket["fields"]
+
+
+def test_rejects_non_image_uploads(client, auth_headers, s3_stub):
+    response = client.post(
+        "/uploads/sessions",
+        json={"filename": "notes.txt", "content_type": "text/plain"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
+
+
+def test_complete_registers_object(client, auth_headers, s3_stub):
+    ticket = _create_session(client, auth_headers)
+    s3_stub.add_response(
+        "head_object",
+        {"ContentLength": 2048, "ContentType": "image/jpeg"},
+        {"Bucket": "test-bucket", "Key": ticket["object_key"]},
+    )
+    response = client.post(f"/uploads/sessions/{ticket['id']}/complete", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["status"] == "completed"
+    assert body["size_bytes"] == 2048
+    assert body["url"] == f"http://localhost:9000/test-bucket/{ticket['object_key']}"
+
+
+def test_complete_before_upload_conflicts(client, auth_headers, s3_stub):
+    ticket = _create_session(client, auth_headers)
+    s3_stub.add_client_error("head_object", service_error_code="404", http_status_code=404)
+    response = client.post(f"/uploads/sessions/{ticket['id']}/complete", headers=auth_headers)
+    assert response.status_code == 409
@@ -0,0 +1,184 @@
+import hashlib
+import hmac
+import io
+import json
+import random
+import threading
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.models import Batch, Model, ModelImage, Task, WebhookDelivery, WebhookEndpoint
+from app.services import image_generation, webhooks
+from app.services.resilience import RetryPolicy
+from app.services.webhooks import WebhookDispatcher
+
+
+class _Receiver:
+    """Stands in for customer endpoints: records each POST and answers with ``status``."""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.calls = []
+        self.received = threading.Semaphore(0)
+        self.release = None
+
+    def __call__(self, url, body, headers):
+        self.calls.append((url, body, headers))
+        self.received.release()
+        if self.release is not None:
+            self.release.wait(5)
+        return self.status
+
+    def wait(self, count=1):
+        for _ in range(count):
+            assert self.received.acquire(timeout=5)
+
+
+def _dispatcher(receiver, max_attempts=3):
+    return WebhookDispatcher(senders=4, poll_seconds=60, post=receiver,
+                             retry_policy=RetryPolicy(max_attempts, base_delay=0, max_delay=0))
+
+
+def _settled(db, delivery_id, statuses=("delivered", "failed", "pending")):
+    for _ in range(100):
+        db.expire_all()
+        delivery = db.get(WebhookDelivery, delivery_id)
+        if delivery.status in statuses:
+            return delivery
+        threading.Event().wait(0.05)
+    raise AssertionError(f"delivery {delivery_id} stuck in {delivery.status}")
+
+
+def _garment():
+    out = io.BytesIO()
+    Image.frombytes("RGB", (48, 64), random.Random(7).randbytes(48 * 64 * 3)).save(out, format="PNG")
+    return ("files", ("garment.png", out.getvalue(), "image/png"))
+
+
+def test_finished_batch_posts_signed_event(client, db, user, auth_headers, wait_for_batch, fake_dns, monkeypatch):
+    fake_dns["shop.example.com"] = "93.184.216.34"
+    monkeypatch.setattr(settings, "TRYON_PROVIDER", "fake")
+    monkeypatch.setattr(settings, "GARMENT_STORAGE", "blob")
+    monkeypatch.setattr(settings, "FAKE_TRYON_LATENCY", "fixed:0")
+    monkeypatch.setattr(image_generation, "_providers", {})
+    receiver = _Receiver()
+    dispatcher = _dispatcher(receiver)
+    monkeypatch.setattr(webhooks, "_dispatcher", dispatcher)
+
+    model = Model(name="webhook", description="", user_id=user.id)
+    db.add(model)
+    db.flush()
+    db.add(ModelImage(model_id=model.id, url="blobs/front.png", pose_label="front"))
+    task = Task(user_id=user.id, model_id=model.id, name="webhook")
+    db.add(task)
+    db.commit()
+
+    created = client.post("/webhooks/", json={"url": "https://shop.example.com/hooks", "task_id": task.id},
+                          headers=auth_headers)
+    assert created.status_code == 200
+    secret = created.json()["secret"]
+    assert "secret" not in client.get("/webhooks/", headers=auth_headers).json()[0]
+
+    batch = client.post("/batches/", data={"task_id": str(task.id)}, files=[_garment()], headers=auth_headers).json()
+    assert wait_for_batch(batch["id"]).status == "done"
+
+    assert dispatcher.dispatch_due() >= 1
+    receiver.wait()
+    url, body, headers = next(call for call in receiver.calls if call[0] == "https://shop.example.com/hooks")
+    event = json.loads(body)
+    assert event["type"] == "batch.completed"
+    assert event["data"]["batch_id"] == batch["id"]
+    assert event["data"]["generated_images"] == 1
+
+    timestamp, signature = (part.split("=", 1)[1] for part in headers["X-VestureAI-Signature"].split(","))
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    assert hmac.compare_digest(signature, expected)
+
+    deliveries = client.get(f"/webhooks/{created.json()['id']}/deliveries", headers=auth_headers).json()
+    assert _settled(db, deliveries[0]["id"]).status == "delivered"
+    dispatcher.shutdown()
+
+
+def _endpoint_with_deliveries(db, user, count, max_concurrency=None):
+    endpoint = WebhookEndpoint(user_id=user.id, url=f"https://hooks.example.com/{user.id}", secret="s",
+                               events=["batch.failed"], max_concurrency=max_concurrency, active=True)
+    db.add(endpoint)
+    db.flush()
+    task = Task(user_id=user.id, name="webhook")
+    db.add(task)
+    db.flush()
+    for _ in range(count):
+        batch = Batch(task_id=task.id, status="failed")
+        db.add(batch)
+        db.flush()
+        webhooks.record_batch_event(db, batch, user.id)
+    db.commit()
+    deliveries = db.query(WebhookDelivery).filter(WebhookDelivery.endpoint_id == endpoint.id).all()
+    return endpoint, [delivery.id for delivery in deliveries]
+
+
+def test_failing_endpoint_retried_then_given_up(db, user, fake_dns):
+    fake_dns["hooks.example.com"] = "93.184.216.34"
+    receiver = _Receiver(status=503)
+    dispatcher = _dispatcher(receiver, max_attempts=2)
+    endpoint, (delivery_id,) = _endpoint_with_deliveries(db, user, 1)
+
+    dispatcher.dispatch_due()
+    receiver.wait()
+    delivery = _settled(db, delivery_id)
+    assert (delivery.status, delivery.attempts, delivery.last_error) == ("pending", 1, "HTTP 503")
+
+    dispatcher.dispatch_due()
+    receiver.wait()
+    assert _settled(db, delivery_id, statuses=("failed",)).attempts == 2
+    dispatcher.shutdown()
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 2])
+def test_endpoint_concurrency_limit(db, user, max_concurrency, fake_dns):
+    fake_dns["hooks.example.com"] = "93.184.216.34"
+    receiver = _Receiver()
+    receiver.release = threading.Event()
+    dispatcher = _dispatcher(receiver)
+    endpoint, delivery_ids = _endpoint_with_deliveries(db, user, 3, max_concurrency=max_concurrency)
+
+    dispatcher.dispatch_due()
+    receiver.wait(max_concurrency)
+    db.expire_all()
+    sending = db.query(WebhookDelivery).filter(
+        WebhookDelivery.endpoint_id == endpoint.id, WebhookDelivery.status == "sending"
+    ).count()
+    assert sending == max_concurrency
+
+    # The rest go out as the first ones finish
+    receiver.release.set()
+    for _ in range(100):
+        dispatcher.dispatch_due()
+        db.expire_all()
+        if all(db.get(WebhookDelivery, delivery_id).status == "delivered" for delivery_id in delivery_ids):
+            break
+        threading.Event().wait(0.05)
+    assert all(db.get(WebhookDelivery, delivery_id).status == "delivered" for delivery_id in delivery_ids)
+    assert len([call for call in receiver.calls if call[0] == endpoint.url]) == 3
+    dispatcher.shutdown()
+
+
+def test_endpoints_on_internal_addresses_are_refused(client, db, user, auth_headers, fake_dns):
+    fake_dns["hooks.example.com"] = "93.184.216.34"
+    fake_dns["intranet.example.com"] = "192.168.1.20"
+    for url in ("http://127.0.0.1:8000/hooks", "http://169.254.169.254/latest", "https://intranet.example.com/hooks"):
+        response = client.post("/webhooks/", json={"url": url}, headers=auth_headers)
+        assert response.status_code == 400, url
+
+    # A host that moved inwards after registration is refused at send time
+    receiver = _Receiver()
+    dispatcher = _dispatcher(receiver, max_attempts=1)
+    endpoint, (delivery_id,) = _endpoint_with_deliveries(db, user, 1)
+    fake_dns["hooks.example.com"] = "10.1.2.3"
+    dispatcher.dispatch_due()
+    delivery = _settled(db, delivery_id, statuses=("failed",))
+    assert delivery.last_error == "endpoint is not a public address"
+    assert receiver.calls == []
+    dispatcher.shutdown()
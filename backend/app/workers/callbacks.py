@@ -0,0 +1,143 @@
+"""Results of callback-mode generations, as the provider POSTs them back.
+
+``_submit_for_callbacks`` leaves a ``PendingGeneration`` per combination;
+``complete_pending_generation`` turns the callback for one into a
+generated image or a recorded failure, once even if the provider calls
+back more than once, and finishes the batch with the last of them.
+Pending items that never hear back within PROVIDER_CALLBACK_TIMEOUT_SECONDS
+are failed by the sweeper, so no batch waits forever on a lost callback.
+"""
+import hmac
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import COMBINATIONS, DB_WRITE_SECONDS, TOKENS_CONSUMED
+from app.database import SessionLocal
+from app.models import Batch, GeneratedImage, PendingGeneration
+from app.models.user import User
+from app.services.image_generation import TryOnResult, parse_callback
+from app.services.resilience import PERMANENT, RetryError
+from app.workers.image_tasks import _record_failure, finish_if_settled
+
+logger = logging.getLogger(__name__)
+
+OUTSTANDING = ("submitting", "submitted")
+
+
+class CallbackMismatch(Exception):
+    """The callback's request id isn't the one this pending generation was submitted as."""
+
+
+def _resolve(db: Session, pending: PendingGeneration, request_id: Optional[str],
+             result: Optional[TryOnResult], error: Optional[str]) -> bool:
+    """Persist one outcome; False when the item was already resolved."""
+    claimed = db.query(PendingGeneration).filter(
+        PendingGeneration.id == pending.id, PendingGeneration.status.in_(OUTSTANDING)
+    ).update({
+        PendingGeneration.status: "completed" if result is not None else "failed",
+        PendingGeneration.request_id: func.coalesce(PendingGeneration.request_id, request_id),
+        PendingGeneration.error: error,
+        PendingGeneration.completed_at: datetime.now(timezone.utc),
+    }, synchronize_session=False)
+    if not claimed:
+        db.rollback()
+        return False
+
+    batch = db.get(Batch, pending.batch_id)
+    if result is not None:
+        if not batch.tokens_reserved:
+            # Batches from before up-front reservation are still charged per image
+            user = db.get(User, batch.task.user_id)
+            user.token_balance -= 1
+        db.add(GeneratedImage(
+            garment_image_id=pending.garment_image_id,
+            model_id=pending.model_id,
+            output_url=result.image_url,
+            pose_label=pending.pose_label,
+            attempts=pending.attempts or 1,
+        ))
+        with DB_WRITE_SECONDS.time():
+            db.commit()
+        TOKENS_CONSUMED.inc()
+        COMBINATIONS.labels("success").inc()
+    else:
+        logger.warning("Generation failed: %s", error, extra={
+            "garment_image_id": pending.garment_image_id, "model_id": pending.model_id,
+            "pose_label": pending.pose_label, "request_id": request_id,
+        })
+        _record_failure(db, batch, pending.garment_image_id, pending.model_id, pending.pose_label,
+                        RetryError(RuntimeError(error), pending.attempts or 1, PERMANENT))
+    finish_if_settled(db, pending.batch_id)
+    return True
+
+
+def complete_pending_generation(db: Session, pending_id: int, token: str, body: dict) -> Optional[PendingGeneration]:
+    """Apply a provider callback; None when no pending generation has that id and token.
+
+    Raises CallbackMismatch when the body is for another request.
+    """
+    pending = db.get(PendingGeneration, pending_id)
+    if pending is None or not hmac.compare_digest(pending.token, token or ""):
+        return None
+    request_id, result, error = parse_callback(body)
+    if pending.request_id is not None and request_id != pending.request_id:
+        raise CallbackMismatch(f"Callback for {request_id}, expected {pending.request_id}")
+    _resolve(db, pending, request_id, result, error)
+    db.refresh(pending)
+    return pending
+
+
+def expire_stale_generations(db: Session, timeout_seconds: float) -> int:
+    """Fail pending generations with no callback after ``timeout_seconds``; returns how many."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=timeout_seconds)
+    stale = db.query(PendingGeneration).filter(
+        PendingGeneration.status.in_(OUTSTANDING),
+        or_(PendingGeneration.submitted_at < cutoff,
+            PendingGeneration.submitted_at.is_(None) & (PendingGeneration.created_at < cutoff)),
+    ).all()
+    expired = 0
+    for pending in stale:
+        error = f"No callback within {timeout_seconds:.0f}s"
+        expired += _resolve(db, pending, pending.request_id, None, error)
+    return expired
+
+
+_sweeper: Optional[threading.Thread] = None
+_sweeper_stop = threading.Event()
+_sweeper_lock = threading.Lock()
+
+
+def _sweep() -> None:
+    interval = min(60.0, settings.PROVIDER_CALLBACK_TIMEOUT_SECONDS / 4)
+    while not _sweeper_stop.wait(interval):
+        db = SessionLocal()
+        try:
+            expired = expire_stale_generations(db, settings.PROVIDER_CALLBACK_TIMEOUT_SECONDS)
+            if expired:
+                logger.warning("Expired %d generations that never called back", expired)
+        except Exception:
+            logger.exception("Callback sweep failed")
+        finally:
+            db.close()
+
+
+def start_callback_sweeper() -> None:
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper_stop.clear()
+            _sweeper = threading.Thread(target=_sweep, name="callback-sweeper", daemon=True)
+            _sweeper.start()
+
+
+def shutdown_callback_sweeper() -> None:
+    global _sweeper
+    with _sweeper_lock:
+        _sweeper_stop.set()
+        _sweeper = None
@@ -1,367 +1,687 @@
-from app.services.image_generation import generate_images
-from app.models import Batch, GeneratedImage, Model, ModelImage, GarmentImage
+from app.core.logging_config import bind_log_context
+from app.core.metrics import (
+    COMBINATIONS, DB_WRITE_SECONDS, PROVIDER_IN_FLIGHT,
+    PROVIDER_INFERENCE_SECONDS, PROVIDER_QUEUE_WAIT_SECONDS, TOKENS_CONSUMED,
+)
+from app.core.tracing import SpanKind, attach_trace_context, span
+from app.services.image_generation import GenerationCancelled, TryOnProvider, get_tryon_provider
+from app.services.preprocessing import prepare_garments
+from app.services.archives import ensure_archive
+from app.services.dedupe import mark_batch_duplicates, fill_batch_duplicates
+from app.services.rate_limit import get_fal_governor
+from app.services.scheduler import get_scheduler, get_tenant_policy
+from app.services.token import TokenService
+from app.services.webhooks import get_webhook_dispatcher, record_batch_event
+from app.services.resilience import (
+    PERMANENT, RetryError, call_with_retry, get_fal_breaker, get_fal_retry_policy,
+)
+from app.models import (
+    Batch, GeneratedImage, Model, ModelImage, GarmentImage, GenerationFailure, PendingGeneration, Task,
+)
 from app.database import SessionLocal
-import os
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from app.core.config import settings
+import logging
+import secrets
+import threading
 import time
-import asyncio
-from typing import Dict, List
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 from app.models.user import User
 
-def _configure_fal():
-    """Configure fal.ai client with API key"""
-    try:
-        import fal_client as fal
-        fal_key = os.getenv("FAL_KEY")
-        if not fal_key:
-            raise ValueError("FAL_KEY environment variable is not set")
-        
-        # Set the API key as environment variable for fal
-        os.environ["FAL_KEY"] = fal_key
-        return fal
-    except ImportError:
-        raise ImportError("fal package is not installed. Please install it with: pip install fal")
-    except Exception as e:
-        raise Exception(f"Failed to configure fal.ai client: {str(e)}")
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_URL = "https://images.easelai.com/tryon/woman.webp"
+
+
+class _BatchRun:
+    """A batch being generated in this process, so it can be cancelled."""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.futures = []
+
+
+_active_runs: Dict[int, _BatchRun] = {}
+_active_runs_lock = threading.Lock()
+
+
+def cancel_batch_run(batch_id: int) -> bool:
+    """Stop a batch running in this process; False when it isn't running here.
+
+    Combinations still queued on the scheduler are dropped and in-flight
+    provider calls are told to abort. Workers in other processes notice the
+    batch's ``cancelling`` status as their next combination completes.
+    """
+    with _active_runs_lock:
+        run = _active_runs.get(batch_id)
+        if run is None:
+            return False
+        run.cancelled.set()
+        futures = list(run.futures)
+    for future in futures:
+        future.cancel()
+    return True
+
+
+def _call_provider(provider: TryOnProvider, call, span_name: str, cancel_event: Optional[threading.Event],
+                   inference: bool = True):
+    """``call`` through the rate governor, retried on transient errors; returns ``(result, attempts)``."""
+    def attempt():
+        waiting_since = time.perf_counter()
+
+        def submit():
+            nonlocal waiting_since
+            PROVIDER_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - waiting_since)
+            if cancel_event is not None and cancel_event.is_set():
+                raise GenerationCancelled("Batch cancelled")
+            try:
+                timer = PROVIDER_INFERENCE_SECONDS.labels(provider.name).time() if inference else nullcontext()
+                with PROVIDER_IN_FLIGHT.track_inprogress(), timer, \
+                        span(span_name, kind=SpanKind.CLIENT, provider=provider.name):
+                    return call()
+            finally:
+                # A throttled call goes back through the governor
+                waiting_since = time.perf_counter()
+
+        return get_fal_governor().call(submit)
+
+    return call_with_retry(attempt, get_fal_retry_policy(), get_fal_breaker())
+
+
+def _generate_tryon(provider: TryOnProvider, model_image_url: str, garment_image_url: str,
+                    cancel_event: Optional[threading.Event] = None):
+    """One combination through the rate governor, retried on transient errors.
+
+    Returns ``(TryOnResult, attempts)``; raises RetryError once it gives up,
+    wrapping GenerationCancelled when ``cancel_event`` is set meanwhile.
+    """
+    return _call_provider(
+        provider, lambda: provider.generate(model_image_url, garment_image_url, cancel_event=cancel_event),
+        "tryon.generate", cancel_event,
+    )
+
+
+def _submit_tryon(provider: TryOnProvider, model_image_url: str, garment_image_url: str, webhook_url: str,
+                  cancel_event: Optional[threading.Event] = None):
+    """``_generate_tryon`` for callback mode: returns ``(request_id, attempts)`` once the provider has queued it."""
+    return _call_provider(
+        provider, lambda: provider.submit(model_image_url, garment_image_url, webhook_url),
+        "tryon.submit", cancel_event, inference=False,
+    )
+
+
+def _record_failure(db, batch, garment_image_id, model_id, pose_label, error: RetryError):
+    """Persist a combination that could not be generated, with its attempt count."""
+    db.add(GenerationFailure(
+        batch_id=batch.id,
+        garment_image_id=garment_image_id,
+        model_id=model_id,
+        pose_label=pose_label,
+        attempts=error.attempts,
+        error_kind=error.kind,
+        error=str(error.last_error)[:1000]
+    ))
+    batch.failed_combinations = (batch.failed_combinations or 0) + 1
+    db.commit()
+    COMBINATIONS.labels(error.kind).inc()
+
+
+def _settle_tokens(db, batch, user_id: int, succeeded: int) -> None:
+    """Refund the part of the batch's reservation that produced no image."""
+    refund = (batch.tokens_reserved or 0) - succeeded - (batch.tokens_refunded or 0)
+    if refund <= 0:
+        return
+    TokenService(db).refund_tokens(user_id, refund)
+    batch.tokens_refunded = (batch.tokens_refunded or 0) + refund
+    db.commit()
+
+
+def _announce_finished(db, batch, user_id: int, succeeded: int) -> None:
+    """Commit the batch's final status in one transaction with its webhook events and token refund."""
+    # In the same transaction as the status, so the event can't be lost
+    webhooks = record_batch_event(db, batch, user_id)
+    _settle_tokens(db, batch, user_id, succeeded)
+    db.commit()
+    if webhooks:
+        get_webhook_dispatcher().wake()
+    if batch.status == 'done':
+        # Ready before anyone asks to download it
+        ensure_archive(batch.id)
+
+
+def callback_url(pending: PendingGeneration) -> str:
+    base = settings.PROVIDER_CALLBACK_BASE_URL.rstrip("/")
+    return f"{base}/callbacks/tryon/{pending.id}?token={pending.token}"
+
+
+def _submit_for_callbacks(db, batch, curr_user: int, provider: TryOnProvider, models, run: _BatchRun) -> dict:
+    """Callback mode: submit every combination and return without waiting for the results.
+
+    The batch stays ``processing``; ``app.workers.callbacks`` persists each
+    result as the provider calls back, and whichever of this and the last
+    callback comes second finishes the batch.
+    """
+    settings.require("PROVIDER_CALLBACK_BASE_URL")
+    combinations = []
+    for garment_image, model_id, model_image_url, pose_label in _iter_combinations(batch, models):
+        pending = PendingGeneration(batch_id=batch.id, garment_image_id=garment_image.id, model_id=model_id,
+                                    pose_label=pose_label, provider=provider.name, token=secrets.token_urlsafe(24))
+        combinations.append((pending, model_image_url, garment_image.image_url))
+    db.add_all([pending for pending, _, _ in combinations])
+    db.commit()
 
-fal = _configure_fal()
+    scheduler = get_scheduler()
+    policy = get_tenant_policy(db, curr_user)
+    submissions = {}
+    for pending, model_image_url, garment_image_url in combinations:
+        if run.cancelled.is_set():
+            break
+        future = scheduler.submit(curr_user, policy, _submit_tryon,
+                                  provider, model_image_url, garment_image_url, callback_url(pending), run.cancelled)
+        submissions[future] = pending
+        with _active_runs_lock:
+            run.futures.append(future)
 
-def on_queue_update(update):
-    if isinstance(update, fal.InProgress):
-        for log in update.logs:
-           print(log["message"])
-           
-           
-def generate_images_task(batch_id: int, curr_user: int):
+    for future in as_completed(list(submissions)):
+        pending = submissions.pop(future)
+        try:
+            request_id, attempts = future.result()
+        except CancelledError:
+            continue
+        except RetryError as e:
+            if isinstance(e.last_error, GenerationCancelled):
+                continue
+            logger.warning("Submission failed: %s", e, extra={
+                "garment_image_id": pending.garment_image_id, "model_id": pending.model_id,
+                "pose_label": pending.pose_label, "error_kind": e.kind, "attempts": e.attempts,
+            })
+            pending.status, pending.attempts, pending.error = 'failed', e.attempts, str(e.last_error)[:1000]
+            _record_failure(db, batch, pending.garment_image_id, pending.model_id, pending.pose_label, e)
+            _cancel_requested(db, batch, run)
+            continue
+        db.query(PendingGeneration).filter(PendingGeneration.id == pending.id).update({
+            PendingGeneration.request_id: request_id,
+            PendingGeneration.attempts: attempts,
+            PendingGeneration.submitted_at: datetime.now(timezone.utc),
+        }, synchronize_session=False)
+        # Unless its callback has already come in
+        db.query(PendingGeneration).filter(
+            PendingGeneration.id == pending.id, PendingGeneration.status == 'submitting'
+        ).update({PendingGeneration.status: 'submitted'}, synchronize_session=False)
+        db.commit()
+
+    # Never sent: cancelled before their turn
+    skipped = db.query(PendingGeneration).filter(
+        PendingGeneration.batch_id == batch.id, PendingGeneration.status == 'submitting',
+        PendingGeneration.request_id.is_(None),
+    ).update({PendingGeneration.status: 'cancelled'}, synchronize_session=False)
+    db.commit()
+    if skipped:
+        COMBINATIONS.labels("cancelled").inc(skipped)
+    if _cancel_requested(db, batch, run):
+        # Also withdraws what was accepted after the cancel came in
+        cancel_submitted_generations(db, batch.id)
+    else:
+        finish_if_settled(db, batch.id)
+    return {}
+
+
+def finish_if_settled(db, batch_id: int) -> bool:
+    """Finish a callback-mode batch once none of its combinations is still out; True if this call did."""
+    counts = dict(
+        db.query(PendingGeneration.status, func.count(PendingGeneration.id))
+        .filter(PendingGeneration.batch_id == batch_id)
+        .group_by(PendingGeneration.status)
+    )
+    if counts.get('submitting') or counts.get('submitted'):
+        return False
+    succeeded, failed = counts.get('completed', 0), counts.get('failed', 0)
+
+    batch = db.get(Batch, batch_id)
+    db.refresh(batch)
+    fill_batch_duplicates(db, batch.garment_images)
+    if batch.status == 'cancelling':
+        final = 'cancelled'
+    else:
+        final = 'failed' if succeeded + failed and failed == succeeded + failed else 'done'
+    # The worker and the last callback can both get here; only one finishes
+    claimed = db.query(Batch).filter(Batch.id == batch_id, Batch.status.in_(('processing', 'cancelling'))).update(
+        {Batch.status: final, Batch.version: Batch.version + 1}, synchronize_session=False
+    )
+    if not claimed:
+        db.rollback()
+        return False
+    batch.status = final
+    _announce_finished(db, batch, batch.task.user_id, succeeded)
+    return True
+
+
+def cancel_submitted_generations(db, batch_id: int) -> int:
+    """Withdraw a cancelled callback-mode batch's submitted generations; returns how many.
+
+    Once submission is over nothing in this process is driving the batch, so
+    cancelling has to reach the provider and finish the batch from here.
+    Callbacks that still come in for withdrawn generations are ignored.
+    """
+    submitted = db.query(PendingGeneration).filter(
+        PendingGeneration.batch_id == batch_id, PendingGeneration.status == 'submitted'
+    ).all()
+    withdrawn = 0
+    for pending in submitted:
+        # A callback may resolve it first; whichever claims it wins
+        claimed = db.query(PendingGeneration).filter(
+            PendingGeneration.id == pending.id, PendingGeneration.status == 'submitted'
+        ).update({
+            PendingGeneration.status: 'cancelled',
+            PendingGeneration.error: "Batch cancelled",
+            PendingGeneration.completed_at: datetime.now(timezone.utc),
+        }, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            continue
+        withdrawn += 1
+        try:
+            if not get_tryon_provider(pending.provider).cancel(pending.request_id):
+                logger.info("Provider could not cancel request %s", pending.request_id)
+        except Exception:
+            logger.warning("Cancelling request %s failed", pending.request_id, exc_info=True)
+    if withdrawn:
+        COMBINATIONS.labels("cancelled").inc(withdrawn)
+    # Batches generated in-thread have no pending rows; their worker finishes them
+    if submitted or db.query(PendingGeneration.id).filter(PendingGeneration.batch_id == batch_id).first():
+        finish_if_settled(db, batch_id)
+    return withdrawn
+
+
+def _cancel_requested(db, batch, run: _BatchRun) -> bool:
+    """Whether the batch was cancelled here or, through its status, by another process."""
+    if run.cancelled.is_set():
+        return True
+    status = db.query(Batch.status).filter(Batch.id == batch.id).scalar()
+    if status in ("cancelling", "cancelled"):
+        cancel_batch_run(batch.id)
+        return True
+    return False
+
+
+def _default_models() -> List[dict]:
+    return [{
+        "id": None,
+        "model_images": [{
+            "url": DEFAULT_MODEL_URL,
+            "pose_label": "default"
+        }]
+    }]
+
+
+def _load_models(db, batch) -> list:
+    """The batch's matrix models or else the task's model, or the default model image when it has none.
+
+    Models come with their images, in one query, so every garment is paired
+    with poses already in memory.
     """
-    Generate fashion try-on images using fal.ai API with long polling
-    
+    if batch.matrix_models:
+        model_ids = [entry.model_id for entry in batch.matrix_models]
+        models = {
+            model.id: model
+            for model in db.query(Model).options(selectinload(Model.model_images)).filter(Model.id.in_(model_ids))
+        }
+        for model_id in model_ids:
+            if model_id not in models:
+                logger.warning("Model %s of matrix batch not found, skipping", model_id)
+            elif not models[model_id].model_images:
+                logger.warning("Model %s has no model images", model_id)
+        return [models[model_id] for model_id in model_ids if model_id in models]
+
+    task = batch.task
+    if not task or not task.model_id:
+        # Fallback to default model image if no model is associated with the task
+        logger.info("No model associated with this task, using default model image: %s", DEFAULT_MODEL_URL)
+        return _default_models()
+
+    # Get the specific model for this task
+    model = db.query(Model).options(selectinload(Model.model_images)).filter(Model.id == task.model_id).first()
+    if not model:
+        # Fallback to default model image if model not found
+        logger.info("Model %s not found, using default model image: %s", task.model_id, DEFAULT_MODEL_URL)
+        return _default_models()
+
+    # Ensure model has at least one model image
+    if not model.model_images:
+        logger.warning("Model %s has no model images", model.id)
+    return [model]
+
+
+def _iter_combinations(batch, models) -> Iterator[Tuple[GarmentImage, int, str, str]]:
+    """Yield ``(garment_image, model_id, model_image_url, pose_label)`` to generate."""
+    for garment_image in batch.garment_images:
+        garment_image_url = garment_image.image_url
+
+        # Validate garment URL
+        if not garment_image_url or garment_image_url.strip() == "":
+            logger.warning("Garment image %s has empty URL, skipping", garment_image.id)
+            continue
+
+        # Near-duplicates reuse the outputs of their original
+        if garment_image.duplicate_of_id is not None:
+            continue
+
+        for model in models:
+            if isinstance(model, dict):
+                model_id = model['id']
+                model_images = model['model_images']
+            else:
+                model_id = model.id
+                model_images = model.model_images
+
+            for model_image in model_images:
+                # Check if model_image is a dictionary or an ORM object
+                if isinstance(model_image, dict):
+                    model_image_url = model_image['url']
+                    pose_label = model_image['pose_label']
+                else:
+                    model_image_url = model_image.url
+                    pose_label = model_image.pose_label
+
+                # Validate model URL
+                if not model_image_url or model_image_url.strip() == "":
+                    logger.warning("Model image has empty URL, skipping", extra={"model_id": model_id})
+                    continue
+
+                yield garment_image, model_id, model_image_url, pose_label
+
+
+def generate_images_task(batch_id: int, curr_user: int, provider: TryOnProvider = None,
+                         trace_context: Dict[str, str] = None):
+    """
+    Generate fashion try-on images for every garment × model image of a batch
+
     Args:
         batch_id (int): The batch ID to process
         curr_user (int): The current user ID
-        
+        provider (TryOnProvider): Backend to use; defaults to TRYON_PROVIDER
+        trace_context (dict): Trace headers of the request that queued the job
     """
-    # Configure fal.ai client
-    fal = _configure_fal()
-    
+    with attach_trace_context(trace_context), span("generate_images_task", batch_id=batch_id), \
+            bind_log_context(batch_id=batch_id, user_id=curr_user):
+        return _generate_images(batch_id, curr_user, provider or get_tryon_provider())
+
+
+def _generate_images(batch_id: int, curr_user: int, provider: TryOnProvider):
+
     db = SessionLocal()
+    batch = None
+    pending = {}
+    succeeded = 0
+    run = _BatchRun()
     try:
         # Get batch information
         batch = db.query(Batch).filter(Batch.id == batch_id).first()
         if not batch:
             raise ValueError("Batch not found")
-        
+
         # Get current user
         current_user = db.query(User).filter(User.id == curr_user).first()
         if not current_user:
             raise ValueError("User not found")
-        
-        # Update batch status to processing
-        batch.status = 'processing'
+
+        with _active_runs_lock:
+            _active_runs[batch_id] = run
+
+        # Update batch status to processing. Only a queued batch can be claimed,
+        # so a batch re-queued after a restart is never run twice
+        claimed = db.query(Batch).filter(
+            Batch.id == batch_id, Batch.status == 'queued'
+        ).update({Batch.status: 'processing', Batch.version: Batch.version + 1}, synchronize_session=False)
         db.commit()
-        
+        if not claimed:
+            db.refresh(batch)
+            if batch.status not in ('cancelling', 'cancelled'):
+                return {}
+            # Cancelled while queued
+            batch.status = 'cancelled'
+            _settle_tokens(db, batch, curr_user, 0)
+            return {}
+
         # Get all garment images from the batch
         if not batch.garment_images:
             raise ValueError("No garment images found for this batch")
-        
-        # Get the model related to this task
-        task = batch.task
-        if not task or not task.model_id:
-            # Fallback to default model image if no model is associated with the task
-            default_model_url = "https://images.easelai.com/tryon/woman.webp"
-            print(f"No model associated with this task, using default model image: {default_model_url}")
-            models = [{
-                "id": None,
-                "model_images": [{
-                    "url": default_model_url,
-                    "pose_label": "default"
-                }]
-            }]
-        else:
-            # Get the specific model for this task
-            model = db.query(Model).filter(Model.id == task.model_id).first()
-            if not model:
-                # Fallback to default model image if model not found
-                default_model_url = "https://images.easelai.com/tryon/woman.webp"
-                print(f"Model {task.model_id} not found, using default model image: {default_model_url}")
-                models = [{
-                    "id": None,
-                    "model_images": [{
-                        "url": default_model_url,
-                        "pose_label": "default"
-                    }]
-                }]
-            else:
-                # Ensure model has at least one model image
-                if not model.model_images:
-                    print(f"Warning: Model {model.id} has no model images")
-                models = [model]
-        
+
+        # Normalize garments that were uploaded straight to storage
+        prepare_garments(db, batch.garment_images)
+        mark_batch_duplicates(db, batch.garment_images)
+
+        models = _load_models(db, batch)
+        if provider.supports_callbacks:
+            return _submit_for_callbacks(db, batch, curr_user, provider, models, run)
+
         generated_images = {}
-        
-        # For each garment image, generate images with each model
-        for garment_image in batch.garment_images:
-            garment_image_url = garment_image.image_url
-            
-            # Validate garment URL
-            if not garment_image_url or garment_image_url.strip() == "":
-                print(f"Warning: Garment image {garment_image.id} has empty URL, skipping")
+        attempted = 0
+        failed = 0
+        skipped = 0
+        # Batches created with an up-front reservation are settled at the end;
+        # older ones are still charged per image
+        charge_per_image = not batch.tokens_reserved
+
+        # Provider calls run on the shared worker pool, interleaved fairly with
+        # other users' batches; results are written back here as they finish
+        scheduler = get_scheduler()
+        policy = get_tenant_policy(db, curr_user)
+        pending = {}
+        for combination in _iter_combinations(batch, models):
+            if run.cancelled.is_set():
+                break
+            garment_image, model_id, model_image_url, pose_label = combination
+            future = scheduler.submit(curr_user, policy, _generate_tryon,
+                                      provider, model_image_url, garment_image.image_url, run.cancelled)
+            pending[future] = combination
+            with _active_runs_lock:
+                run.futures.append(future)
+
+        for future in as_completed(list(pending)):
+            garment_image, model_id, model_image_url, pose_label = pending.pop(future)
+            try:
+                # Retries transient errors and backs off while the circuit is open
+                result, attempts = future.result()
+            except CancelledError:
+                skipped += 1
                 continue
-                
-            print(f"Processing garment image: {garment_image_url}")
-            
-            # For each model, generate images with this garment
-            for model in models:
-                model_id = getattr(model, 'id', None)
-                model_images = getattr(model, 'model_images', [{'url': "https://images.easelai.com/tryon/woman.webp", 'pose_label': 'default'}])
-                
-                for model_image in model_images:
-                    # Check if model_image is a dictionary or an ORM object
-                    if isinstance(model_image, dict):
-                        model_image_url = model_image['url']
-                        pose_label = model_image['pose_label']
-                    else:
-                        # It's an ORM object, use attribute access
-                        model_image_url = model_image.url
-                        pose_label = model_image.pose_label
-                    
-                    # Validate model URL
-                    if not model_image_url or model_image_url.strip() == "":
-                        print(f"Warning: Model image has empty URL, skipping")
-                        continue
-                        
-                    print(f"Using model image: {model_image_url} with pose: {pose_label}")
-                    
-                    try:
-                        # Prepare the request payload
-                        request_payload = {
-                            "full_body_image": model_image_url,
-                            "clothing_image": garment_image_url
-                        }
-                        
-                        # Debug: Print the request payload
-                        print(f"Debug - Request payload: {request_payload}")
-                        
-                        # Call fal.ai fashion try-on API with long polling
-                        result = fal.subscribe("easel-ai/fashion-tryon", arguments=request_payload, with_logs=True, on_queue_update=on_queue_update)
-                        print(f"result - payload: {result}")
-                        
-                        # Extract the generated image URL from the result
-                        if 'image' in result and 'url' in result['image']:
-                            generated_image_url = result['image']['url'].strip().replace('`', '')
-                            key = f"garment_{garment_image.id}_model_{model_id}_pose_{pose_label}"
-                            generated_images[key] = generated_image_url
-                            
-                            # Deduct token from user balance
-                            current_user.token_balance -= 1
-                            
-                            # Save to database
-                            generated_image = GeneratedImage(
-                                garment_image_id=garment_image.id,
-                                model_id=model_id,
-                                output_url=generated_image_url,
-                                pose_label=pose_label
-                            )
-                            db.add(generated_image)
-                            db.commit()  # This will save both the generated image and the updated token balance
-                        
-                    except Exception as e:
-                        print(f"Error generating image for garment {garment_image.id} with model {model_id} and pose {pose_label}: {str(e)}")
-                        # Continue with other combinations even if one fails
-                        continue
-        
-        # Update batch status to done
-        batch.status = 'done'
-        db.commit()
-        
+            except RetryError as e:
+                if isinstance(e.last_error, GenerationCancelled):
+                    skipped += 1
+                    continue
+                attempted += 1
+                logger.warning("Generation failed: %s", e, extra={
+                    "garment_image_id": garment_image.id, "model_id": model_id, "pose_label": pose_label,
+                    "error_kind": e.kind, "attempts": e.attempts,
+                })
+                # Record the failure and continue with other combinations
+                failed += 1
+                _record_failure(db, batch, garment_image.id, model_id, pose_label, e)
+                _cancel_requested(db, batch, run)
+                continue
+            except Exception as e:
+                attempted += 1
+                logger.exception("Generation failed", extra={
+                    "garment_image_id": garment_image.id, "model_id": model_id, "pose_label": pose_label,
+                })
+                db.rollback()
+                failed += 1
+                _record_failure(db, batch, garment_image.id, model_id, pose_label, RetryError(e, 1, PERMANENT))
+                _cancel_requested(db, batch, run)
+                continue
+
+            attempted += 1
+            try:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Try-on result", extra={
+                        "garment_image_id": garment_image.id, "model_id": model_id, "pose_label": pose_label,
+                        "payload": {"model_image_url": model_image_url, "garment_image_url": garment_image.image_url},
+                        "result": result.raw, "attempts": attempts,
+                    })
+                key = f"garment_{garment_image.id}_model_{model_id}_pose_{pose_label}"
+                generated_images[key] = result.image_url
+
+                # Deduct token from user balance
+                if charge_per_image:
+                    current_user.token_balance -= 1
+
+                # Save to database
+                generated_image = GeneratedImage(
+                    garment_image_id=garment_image.id,
+                    model_id=model_id,
+                    output_url=result.image_url,
+                    pose_label=pose_label,
+                    attempts=attempts
+                )
+                with DB_WRITE_SECONDS.time():
+                    db.add(generated_image)
+                    db.commit()  # This will save both the generated image and the updated token balance
+                succeeded += 1
+                TOKENS_CONSUMED.inc()
+                COMBINATIONS.labels("success").inc()
+
+            except Exception as e:
+                logger.exception("Generation failed", extra={
+                    "garment_image_id": garment_image.id, "model_id": model_id, "pose_label": pose_label,
+                })
+                db.rollback()
+                failed += 1
+                _record_failure(db, batch, garment_image.id, model_id, pose_label, RetryError(e, 1, PERMANENT))
+            _cancel_requested(db, batch, run)
+
+        if skipped:
+            COMBINATIONS.labels("cancelled").inc(skipped)
+
+        fill_batch_duplicates(db, batch.garment_images)
+
+        if run.cancelled.is_set():
+            batch.status = 'cancelled'
+        else:
+            # Done unless every combination failed
+            batch.status = 'failed' if attempted and failed == attempted else 'done'
+        _announce_finished(db, batch, curr_user, succeeded)
+
         return generated_images
-        
+
     except Exception as e:
+        # Don't leave this batch's work queued behind a failure
+        for future in pending:
+            future.cancel()
         # Update batch status to failed
         if batch:
+            db.rollback()
             batch.status = 'failed'
+            webhooks = record_batch_event(db, batch, curr_user)
             db.commit()
+            if webhooks:
+                get_webhook_dispatcher().wake()
+            _settle_tokens(db, batch, curr_user, succeeded)
         raise e
     finally:
+        with _active_runs_lock:
+            if _active_runs.get(batch_id) is run:
+                del _active_runs[batch_id]
         db.close()
 
-def generate_images_task_with_queue(batch_id: int):
+
+_batch_runners: Optional[ThreadPoolExecutor] = None
+_batch_runners_lock = threading.Lock()
+# Combinations of batches waiting for a runner, by batch id
+_runner_backlog: Dict[int, int] = {}
+
+
+def _log_runner_failure(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Batch generation failed", exc_info=future.exception())
+
+
+def queued_combinations() -> int:
+    """Combinations of the batches still waiting for a batch runner in this process."""
+    with _batch_runners_lock:
+        return sum(_runner_backlog.values())
+
+
+def _run_queued(batch_id: int, curr_user: int, trace_context: Dict[str, str]):
+    with _batch_runners_lock:
+        _runner_backlog.pop(batch_id, None)
+    return generate_images_task(batch_id, curr_user, trace_context=trace_context)
+
+
+def enqueue_generation(batch_id: int, curr_user: int, trace_context: Dict[str, str] = None,
+                       combinations: int = 0) -> Future:
+    """Run ``generate_images_task`` in the background instead of waiting for it.
+
+    Up to BATCH_RUNNERS batches are driven at once; later ones stay queued
+    until a runner frees up, and can be cancelled meanwhile. Their
+    ``combinations`` count towards admission until then.
     """
-    Generate fashion try-on images using fal.ai API with queue and long polling
-    
-    Args:
-        batch_id (int): The batch ID to process
-        poses (list): List of poses to generate images for
+    global _batch_runners
+    with _batch_runners_lock:
+        if _batch_runners is None:
+            _batch_runners = ThreadPoolExecutor(settings.BATCH_RUNNERS, thread_name_prefix="batch-runner")
+        _runner_backlog[batch_id] = combinations
+        future = _batch_runners.submit(_run_queued, batch_id, curr_user, trace_context)
+    future.add_done_callback(_log_runner_failure)
+    return future
+
+
+def recover_queued_batches() -> int:
+    """Hand batches left queued by an earlier process back to the batch runners.
+
+    The runner queue lives in memory, so a restart would otherwise strand
+    them with their tokens reserved. Only one runner can claim a batch, so
+    several processes recovering the same batch is harmless.
     """
-    # Configure fal.ai client
-    fal = _configure_fal()
-    
     db = SessionLocal()
     try:
-        # Get batch information
-        batch = db.query(Batch).filter(Batch.id == batch_id).first()
-        if not batch:
-            raise ValueError("Batch not found")
-        
-        # Update batch status to processing
-        batch.status = 'processing'
-        db.commit()
-        
-        # Get all garment images from the batch
-        if not batch.garment_images:
-            raise ValueError("No garment images found for this batch")
-        
-        # Get the model related to this task
-        task = batch.task
-        if not task or not task.model_id:
-            # Fallback to default model image if no model is associated with the task
-            default_model_url = "https://images.easelai.com/tryon/woman.webp"
-            print(f"No model associated with this task, using default model image: {default_model_url}")
-            models = [{
-                "id": None,
-                "model_images": [{
-                    "url": default_model_url,
-                    "pose_label": "default"
-                }]
-            }]
-        else:
-            # Get the specific model for this task
-            model = db.query(Model).filter(Model.id == task.model_id).first()
-            if not model:
-                # Fallback to default model image if model not found
-                default_model_url = "https://images.easelai.com/tryon/woman.webp"
-                print(f"Model {task.model_id} not found, using default model image: {default_model_url}")
-                models = [{
-                    "id": None,
-                    "model_images": [{
-                        "url": default_model_url,
-                        "pose_label": "default"
-                    }]
-                }]
-            else:
-                # Ensure model has at least one model image
-                if not model.model_images:
-                    print(f"Warning: Model {model.id} has no model images")
-                models = [model]
-        
-        generated_images = {}
-        
-        # For each garment image, generate images with each model
-        for garment_image in batch.garment_images:
-            garment_image_url = garment_image.image_url
-            
-            # Validate garment URL
-            if not garment_image_url or garment_image_url.strip() == "":
-                print(f"Warning: Garment image {garment_image.id} has empty URL, skipping")
-                continue
-                
-            print(f"Processing garment image: {garment_image_url}")
-            
-            # For each model, generate images with this garment
-            for model in models:
-                model_id = getattr(model, 'id', None)
-                model_images = getattr(model, 'model_images', [{'url': "https://images.easelai.com/tryon/woman.webp", 'pose_label': 'default'}])
-                
-                for model_image in model_images:
-                    # Check if model_image is a dictionary or an ORM object
-                    if isinstance(model_image, dict):
-                        model_image_url = model_image['url']
-                        pose_label = model_image['pose_label']
-                    else:
-                        # It's an ORM object, use attribute access
-                        model_image_url = model_image.url
-                        pose_label = model_image.pose_label
-                    
-                    # Validate model URL
-                    if not model_image_url or model_image_url.strip() == "":
-                        print(f"Warning: Model image has empty URL, skipping")
-                        continue
-                        
-                    print(f"Using model image: {model_image_url} with pose: {pose_label}")
-                    
-                    try:
-                        # Prepare the request payload
-                        request_payload = {
-                            "input": {
-                                "full_body_image": model_image_url,
-                                "clothing_image": garment_image_url,
-                                "gender": "female"  # Default to female, can be made configurable
-                            }
-                        }
-                        
-                        # Debug: Print the request payload
-                        print(f"Debug - Queue request payload: {request_payload}")
-                        
-                        # Clean URLs to ensure no extra spaces or backticks
-                        request_payload['input']['full_body_image'] = request_payload['input']['full_body_image'].strip().replace('`', '')
-                        request_payload['input']['clothing_image'] = request_payload['input']['clothing_image'].strip().replace('`', '')
-                        
-                        # Submit request to queue
-                        queue_result = fal.queue.submit("easel-ai/fashion-tryon", request_payload)
-                        
-                        request_id = queue_result.request_id
-                        
-                        # Long polling to wait for completion
-                        max_attempts = 12  # Maximum 1 minute (12 * 5 seconds)
-                        attempt = 0
-                        
-                        while attempt < max_attempts:
-                            # Check status
-                            status = fal.queue.status("easel-ai/fashion-tryon", {
-                                "requestId": request_id,
-                                "logs": True
-                            })
-                            
-                            if status['status'] == "COMPLETED":
-                                # Get the result
-                                result = fal.queue.result("easel-ai/fashion-tryon", {
-                                    "requestId": request_id
-                                })
-                                
-                                if 'payload' in result and 'image' in result['payload'] and 'url' in result['payload']['image']:
-                                    # Clean the URL by removing backticks and extra spaces
-                                    generated_image_url = result['payload']['image']['url'].strip().replace('`', '')
-                                    key = f"garment_{garment_image.id}_model_{model_id}_pose_{pose_label}"
-                                    generated_images[key] = generated_image_url
-                                    
-                                    # Save to database
-                                    generated_image = GeneratedImage(
-                                        garment_image_id=garment_image.id,
-                                        model_id=model_id,
-                                        output_url=generated_image_url,
-                                        pose_label=pose_label
-                                    )
-                                    db.add(generated_image)
-                                    db.commit()
-                                
-                                break
-                            elif status['status'] == "FAILED":
-                                print(f"Request failed for garment {garment_image.id} with model {model_id} and pose {pose_label}: {status}")
-                                break
-                            else:
-                                # Wait 5 seconds before checking again
-                                time.sleep(5)
-                                attempt += 1
-                        
-                        if attempt >= max_attempts:
-                            print(f"Timeout waiting for garment {garment_image.id} with model {model_id} and pose {pose_label} to complete")
-                        
-                    except Exception as e:
-                        print(f"Error generating image for garment {garment_image.id} with model {model_id} and pose {pose_label}: {str(e)}")
-                        continue
-        
-        # Update batch status to done
-        batch.status = 'done'
-        db.commit()
-        
-        return generated_images
-        
-    except Exception as e:
-        if batch:
-            batch.status = 'failed'
-            db.commit()
-        raise e
+        queued = (
+            db.query(Batch.id, Task.user_id, Batch.tokens_reserved, Batch.tokens_refunded)
+            .join(Task, Batch.task_id == Task.id)
+            .filter(Batch.status == 'queued')
+            .order_by(Batch.id)
+            .all()
+        )
     finally:
         db.close()
+    for batch_id, user_id, reserved, refunded in queued:
+        enqueue_generation(batch_id, user_id, combinations=(reserved or 0) - (refunded or 0))
+    if queued:
+        logger.info("Re-queued %s batches left by an earlier run", len(queued))
+    return len(queued)
+
+
+def shutdown_batch_runners() -> None:
+    global _batch_runners
+    with _batch_runners_lock:
+        if _batch_runners is not None:
+            _batch_runners.shutdown(wait=False, cancel_futures=True)
+            _batch_runners = None
+        _runner_backlog.clear()
+
+
+def generate_images_task_with_queue(batch_id: int, curr_user: int = None):
+    """
+    Generate fashion try-on images through the fal.ai queue API
+
+    Args:
+        batch_id (int): The batch ID to process
+        curr_user (int): The user to charge; defaults to the task's owner
+    """
+    if curr_user is None:
+        db = SessionLocal()
+        try:
+            batch = db.query(Batch).filter(Batch.id == batch_id).first()
+            if not batch:
+                raise ValueError("Batch not found")
+            curr_user = batch.task.user_id
+        finally:
+            db.close()
+    return generate_images_task(batch_id, curr_user, provider=get_tryon_provider("fal_queue"))
 
 def start_fashion_tryon_task(batch_id: int, poses: list):
     """
@@ -373,4 +693,4 @@ def start_fashion_tryon_task_with_queue(batch_id: int, poses: list):
     """
     Start the fashion try-on task with queue and long polling
     """
-    return generate_images_task_with_queue(batch_id, poses)
\ No newline at end of file
+    return generate_images_task_with_queue(batch_id)
\ No newline at end of file
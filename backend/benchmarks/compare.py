@@ -0,0 +1,70 @@
+"""Compare two benchmark result files cell by cell.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.1
+
+Exits non-zero when any cell's throughput drops, or its p95 latency or
+query count grows, by more than the threshold.
+"""
+import argparse
+import json
+import sys
+from typing import Iterator, Tuple
+
+# (label, path into a cell, True when higher is better)
+METRICS = [
+    ("images/s", ("throughput", "images_per_second"), True),
+    ("create p95", ("latency_seconds", "create", "p95"), False),
+    ("generate p95", ("latency_seconds", "generate", "p95"), False),
+    ("download p95", ("latency_seconds", "download", "p95"), False),
+    ("create queries", ("queries", "per_batch", "create"), False),
+    ("download queries", ("queries", "per_batch", "download"), False),
+    ("peak rss MB", ("peak_rss_mb",), False),
+]
+
+
+def _key(cell: dict) -> Tuple[int, int, int]:
+    return cell["garments"], cell["poses"], cell["users"]
+
+
+def _get(cell: dict, path: tuple) -> float:
+    for part in path:
+        cell = cell[part]
+    return float(cell)
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> Iterator[Tuple[str, bool]]:
+    """Yield a report line per metric and whether it regressed."""
+    before = {_key(cell): cell for cell in baseline["cells"]}
+    for cell in candidate["cells"]:
+        old = before.get(_key(cell))
+        if old is None:
+            continue
+        label = "garments={} poses={} users={}".format(*_key(cell))
+        for name, path, higher_is_better in METRICS:
+            a, b = _get(old, path), _get(cell, path)
+            change = (b - a) / a if a else 0.0
+            regressed = change < -threshold if higher_is_better else change > threshold
+            yield f"{label:<32} {name:<18} {a:>10.3f} -> {b:>10.3f} ({change:+.1%})", regressed
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = 0
+    for line, regressed in compare(baseline, candidate, args.threshold):
+        print(("REGRESSION " if regressed else "           ") + line)
+        regressions += regressed
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Concurrent-request throughput of the three ways a handler can reach the database.
+
+A slow-DB stand-in (every query sleeps ``--delay`` seconds inside SQLite,
+on the connection's own thread) makes the difference visible without a
+real remote database. Each mode serves ``--requests`` concurrent requests
+on one event loop, the way uvicorn would:
+
+* ``blocking``: ``async def`` with the sync Session, what create_batch used to do
+* ``threadpool``: plain ``def`` with the sync Session, run on FastAPI's threadpool
+* ``async``: ``async def`` with the AsyncSession from ``get_async_db``
+
+Keep ``blocking`` runs within the pool (20 connections). Beyond it the
+mode stalls outright: the loop blocks waiting for a connection that only
+comes back when a finished request's session is closed, which is
+scheduled on that same loop, so every extra request costs a full
+``--pool-timeout`` and is counted as an error. Run ``threadpool`` and
+``async`` on their own for higher concurrency.
+
+::
+
+    python -m benchmarks.db_concurrency --requests 16 --delay 0.05 --out results.json
+    python -m benchmarks.db_concurrency --requests 200 --modes threadpool,async
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+MODES = ("blocking", "threadpool", "async")
+
+
+def _slow_query(seconds: float) -> int:
+    time.sleep(seconds)
+    return 1
+
+
+def _install_slow_function(engine) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.create_function("slow_query", 1, _slow_query)
+
+
+def build_app(database_url: str, delay: float, pool_timeout: float):
+    """A FastAPI app with one endpoint per mode, over engines configured like app.database."""
+    from fastapi import Depends, FastAPI
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.database import POOL_OPTIONS, async_database_url
+
+    options = dict(POOL_OPTIONS, pool_timeout=pool_timeout)
+    sync_engine = create_engine(database_url, **options)
+    async_engine = create_async_engine(async_database_url(database_url), **options)
+    _install_slow_function(sync_engine)
+    _install_slow_function(async_engine.sync_engine)
+    SyncSession = sessionmaker(bind=sync_engine)
+    AsyncSession = async_sessionmaker(bind=async_engine)
+    query = text("SELECT slow_query(:delay)").bindparams(delay=delay)
+
+    def get_sync_db():
+        db = SyncSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    app = FastAPI()
+
+    @app.get("/blocking")
+    async def blocking(db=Depends(get_sync_db)):
+        return {"value": db.execute(query).scalar()}
+
+    @app.get("/threadpool")
+    def threadpool(db=Depends(get_sync_db)):
+        return {"value": db.execute(query).scalar()}
+
+    @app.get("/async")
+    async def async_(db=Depends(get_async_db)):
+        return {"value": (await db.execute(query)).scalar()}
+
+    async def dispose():
+        await async_engine.dispose()
+        sync_engine.dispose()
+
+    return app, dispose
+
+
+async def _run_mode(app, mode: str, requests: int) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.get(f"/{mode}")  # warm the pool
+        latencies = []
+        errors = 0
+
+        async def one():
+            nonlocal errors
+            start = time.perf_counter()
+            response = await client.get(f"/{mode}")
+            if response.status_code != 200:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": requests,
+        "elapsed_seconds": round(elapsed, 4),
+        "requests_per_second": round((requests - errors) / elapsed, 2),
+        "errors": errors,
+        "p50_seconds": round(latencies[len(latencies) // 2], 4),
+        "max_seconds": round(latencies[-1], 4),
+    }
+
+
+def run(database_url: str, requests: int, delay: float, modes=MODES, pool_timeout: float = 5.0) -> dict:
+    async def main():
+        app, dispose = build_app(database_url, delay, pool_timeout)
+        try:
+            return [await _run_mode(app, mode, requests) for mode in modes]
+        finally:
+            await dispose()
+
+    results = asyncio.run(main())
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database_url": database_url.split("@")[-1],
+            "delay_seconds": delay,
+            "pool_timeout_seconds": pool_timeout,
+            "requests": requests,
+            "timestamp": time.time(),
+        },
+        "modes": results,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=16, help="concurrent requests per mode")
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds every query takes")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--pool-timeout", type=float, default=5.0, help="seconds to wait for a pooled connection")
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='vestureai-bench-'), 'bench.db')}"
+    # app.database builds its engine from DATABASE_URL at import
+    os.environ.setdefault("DATABASE_URL", database_url)
+    results = run(database_url, args.requests, args.delay, modes=args.modes.split(","),
+                  pool_timeout=args.pool_timeout)
+    for result in results["modes"]:
+        print(f"{result['mode']:>10}: {result['requests_per_second']:.1f} req/s, "
+              f"p50 {result['p50_seconds'] * 1000:.0f} ms, {result['errors']} errors", file=sys.stderr)
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""End-to-end throughput benchmark for the batch pipeline.
+
+Drives ``POST /batches/`` (normalize, dedupe, upload, generate) and
+``GET /batches/{id}/download`` through the ASGI app with the fake try-on
+provider, across a matrix of garments × poses × concurrent users, and
+writes one JSON document per run::
+
+    python -m benchmarks.pipeline --garments 1,4 --poses 1,3 --users 1,4 \\
+        --database-url sqlite:////tmp/bench.db --out results.json
+
+Compare two runs with ``python -m benchmarks.compare old.json new.json``.
+Nothing leaves the machine: garments go to the local blob store and the
+fake provider writes synthetic outputs there too.
+"""
+import argparse
+import contextvars
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List
+
+STAGES = ("create", "generate", "download")
+
+_stage = contextvars.ContextVar("benchmark_stage", default="other")
+
+
+def configure_environment(database_url: str, blob_dir: str, latency: str, failure_rate: float,
+                          rate: float) -> None:
+    """Settings are read at import time, so this must run before ``app`` is imported."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["BLOB_STORE_DIR"] = blob_dir
+    os.environ["TRYON_PROVIDER"] = "fake"
+    os.environ["GARMENT_STORAGE"] = "blob"
+    os.environ["FAKE_TRYON_LATENCY"] = latency
+    os.environ["FAKE_TRYON_FAILURE_RATE"] = str(failure_rate)
+    os.environ["FAL_RATE_PER_SECOND"] = str(rate)
+    os.environ["FAL_BURST"] = str(max(1, int(rate)))
+    os.environ["FAL_RETRY_BASE_DELAY"] = "0.01"
+    os.environ["FAL_RETRY_MAX_DELAY"] = "0.1"
+    for name, value in {
+        "SECRET_KEY": "benchmark",
+        "EMAIL_USERNAME": "benchmark",
+        "EMAIL_PASSWORD": "benchmark",
+        "EMAIL_FROM": "benchmark@example.com",
+        "STRIPE_API_KEY": "benchmark",
+        "MINIO_URL": "http://localhost:9000",
+        "MINIO_ACCESS_KEY": "benchmark",
+        "MINIO_SECRET_KEY": "benchmark",
+        "CELERY_BROKER_URL": "memory://",
+        "FAL_KEY": "benchmark",
+    }.items():
+        os.environ.setdefault(name, value)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for no samples."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "max": max(samples) if samples else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def garment_jpeg(rng: random.Random, size=(1200, 1600)) -> bytes:
+    """A noisy photo-sized JPEG; noise keeps perceptual hashes apart so nothing dedupes."""
+    from PIL import Image
+
+    small = Image.frombytes("RGB", (24, 32), bytes(rng.randrange(256) for _ in range(24 * 32 * 3)))
+    out = io.BytesIO()
+    small.resize(size, Image.BICUBIC).save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+class QueryCounter:
+    """Counts SQL statements per benchmark stage via engine events."""
+
+    def __init__(self, *engines):
+        self.engines = engines
+        self.counts: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.counts[_stage.get()] += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._on_execute)
+
+
+class StageApp:
+    """ASGI wrapper tagging each request with its stage for query attribution."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        stage = "other"
+        if scope["type"] == "http":
+            if scope["method"] == "POST" and scope["path"].rstrip("/") == "/batches":
+                stage = "create"
+            elif scope["path"].endswith("/download"):
+                stage = "download"
+        token = _stage.set(stage)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _stage.reset(token)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+
+def _timed_worker(worker, recorder: Recorder):
+    def run(*args, **kwargs):
+        token = _stage.set("generate")
+        start = time.perf_counter()
+        try:
+            return worker(*args, **kwargs)
+        finally:
+            recorder.add("generate", time.perf_counter() - start)
+            _stage.reset(token)
+    return run
+
+
+def wait_for_batch(http, batch_id: int, headers: dict, timeout: float = 300.0) -> str:
+    """Poll until the batch runners are finished with ``batch_id``; returns its status."""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = http.get(f"/batches/{batch_id}", headers=headers).json()["status"]
+        if status not in ("queued", "processing") or time.monotonic() > deadline:
+            return status
+        time.sleep(0.02)
+
+
+def seed_users(db, users: int, poses: int, tokens: int) -> List[dict]:
+    """One user, model (with ``poses`` images) and task per simulated client."""
+    from app.core.auth import create_access_token
+    from app.models import Model, ModelImage, Task
+    from app.models.user import User
+
+    clients = []
+    for index in range(users):
+        user = User(email=f"bench-{uuid.uuid4().hex[:12]}@example.com", password_hash="benchmark",
+                    token_balance=tokens)
+        db.add(user)
+        db.flush()
+        model = Model(name=f"bench-{index}", description="benchmark", user_id=user.id)
+        db.add(model)
+        db.flush()
+        db.add_all([
+            ModelImage(model_id=model.id, url=f"blobs/pose-{index}-{pose}.png", pose_label=f"pose-{pose}")
+            for pose in range(poses)
+        ])
+        task = Task(user_id=user.id, model_id=model.id, name=f"bench-{index}")
+        db.add(task)
+        db.flush()
+        clients.append({
+            "task_id": task.id,
+            "headers": {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"},
+        })
+    db.commit()
+    return clients
+
+
+def run_cell(garments: int, poses: int, users: int, batches_per_user: int = 1, seed: int = 0) -> dict:
+    """Run one matrix cell and return its metrics."""
+    from fastapi.testclient import TestClient
+
+    import app.workers.image_tasks as image_tasks
+    from app.database import SessionLocal, engine, get_async_engine
+    from app.main import app
+
+    db = SessionLocal()
+    try:
+        clients = seed_users(db, users, poses, tokens=garments * poses * batches_per_user + 1)
+    finally:
+        db.close()
+
+    rng = random.Random(seed)
+    payloads = [
+        [[garment_jpeg(rng) for _ in range(garments)] for _ in range(batches_per_user)]
+        for _ in range(users)
+    ]
+
+    recorder = Recorder()
+    errors: List[str] = []
+    original_worker = image_tasks.generate_images_task
+    image_tasks.generate_images_task = _timed_worker(original_worker, recorder)
+
+    def client_loop(client: dict, batches: List[List[bytes]]):
+        with TestClient(StageApp(app)) as http:
+            for images in batches:
+                files = [("files", (f"garment-{i}.jpg", data, "image/jpeg")) for i, data in enumerate(images)]
+                start = time.perf_counter()
+                response = http.post("/batches/", data={"task_id": str(client["task_id"])},
+                                     files=files, headers=client["headers"])
+                recorder.add("create", time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors.append(f"create {response.status_code}: {response.text[:200]}")
+                    continue
+                batch_id = response.json()["id"]
+                status = wait_for_batch(http, batch_id, client["headers"])
+                if status != "done":
+                    errors.append(f"batch {batch_id} finished {status}")
+                    continue
+                start = time.perf_counter()
+                response = http.get(f"/batches/{batch_id}/download")
+                recorder.add("download", time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors.append(f"download {response.status_code}: {response.text[:200]}")
+
+    try:
+        # Request handlers query through the async engine, the worker through the sync one
+        with QueryCounter(engine, get_async_engine().sync_engine) as queries:
+            started = time.perf_counter()
+            threads = [
+                threading.Thread(target=client_loop, args=(client, batches))
+                for client, batches in zip(clients, payloads)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+    finally:
+        image_tasks.generate_images_task = original_worker
+
+    batches = users * batches_per_user
+    combinations = batches * garments * poses
+    return {
+        "garments": garments,
+        "poses": poses,
+        "users": users,
+        "batches": batches,
+        "combinations": combinations,
+        "elapsed_seconds": elapsed,
+        "throughput": {
+            "batches_per_second": batches / elapsed if elapsed else 0.0,
+            "images_per_second": combinations / elapsed if elapsed else 0.0,
+        },
+        "latency_seconds": {stage: summarize(recorder.samples[stage]) for stage in STAGES},
+        "queries": {
+            "total": sum(queries.counts.values()),
+            "per_batch": {stage: queries.counts.get(stage, 0) / batches for stage in STAGES},
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "errors": errors,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_matrix(garments: List[int], poses: List[int], users: List[int], batches_per_user: int = 1,
+               seed: int = 0) -> dict:
+    from app.core.config import settings
+    from app.database import Base, engine
+    import app.models  # noqa: F401  register all tables
+
+    Base.metadata.create_all(bind=engine)
+    cells = []
+    for g, p, u in itertools.product(garments, poses, users):
+        cell = run_cell(g, p, u, batches_per_user=batches_per_user, seed=seed)
+        print(
+            f"garments={g} poses={p} users={u}: "
+            f"{cell['throughput']['images_per_second']:.1f} images/s, "
+            f"create p95 {cell['latency_seconds']['create']['p95'] * 1000:.0f} ms, "
+            "queries/batch " + "/".join(f"{cell['queries']['per_batch'][stage]:.0f}" for stage in STAGES),
+            file=sys.stderr,
+        )
+        cells.append(cell)
+    return {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.dialect.name,
+            "fake_latency": settings.FAKE_TRYON_LATENCY,
+            "fake_failure_rate": settings.FAKE_TRYON_FAILURE_RATE,
+            "fal_rate_per_second": settings.FAL_RATE_PER_SECOND,
+            "batches_per_user": batches_per_user,
+            "seed": seed,
+            "timestamp": time.time(),
+        },
+        "cells": cells,
+    }
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--garments", type=_int_list, default=[1, 4])
+    parser.add_argument("--poses", type=_int_list, default=[1, 3])
+    parser.add_argument("--users", type=_int_list, default=[1, 4])
+    parser.add_argument("--batches-per-user", type=int, default=2)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file; pass a postgresql:// URL to test Postgres")
+    parser.add_argument("--latency", default="lognormal:0.05:0.5", help="fake provider latency distribution")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=1000.0, help="governor rate limit (requests/second)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="vestureai-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    configure_environment(database_url, os.path.join(work_dir, "blobs"), args.latency,
+                          args.failure_rate, args.rate)
+
+    results = run_matrix(args.garments, args.poses, args.users,
+                         batches_per_user=args.batches_per_user, seed=args.seed)
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()